@@ -7,24 +7,67 @@ import argparse
 import grpc
 import os
 import sys
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import perf_counter, sleep
 
 # Import P4Runtime libraries
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'utils/'))
 import p4runtime_lib.bmv2
+from google.rpc import code_pb2
+from p4.v1 import p4runtime_pb2
+from p4runtime_lib.decode import TableEntryDecoder, formatRecord
 from p4runtime_lib.error_utils import printGrpcError
+from p4runtime_lib.keys import tableEntryKey
+from p4runtime_lib.read_builder import ReadBuilder
+from p4runtime_lib.reconcile import reconcileTables
 from p4runtime_lib.switch import ShutdownAllSwitchConnections
 import p4runtime_lib.helper
 
+# Tables owned by the controller: entries not configured here are removed
+MANAGED_TABLES = [
+    "MyIngress.ipv4_lpm",
+    "MyIngress.ipv6_lpm",
+    "MyIngress.yequdesu_exact",
+    "MyIngress.vxlan_lpm",
+    "MyIngress.vxlan_decap_exact",
+    "MyIngress.arp_match",
+]
+
+# Route tables with a direct counter, whose hits read_route_counters reports
+ROUTE_COUNTER_TABLES = [
+    "MyIngress.ipv4_lpm",
+    "MyIngress.ipv6_lpm",
+    "MyIngress.yequdesu_exact",
+    "MyIngress.vxlan_lpm",
+    "MyIngress.vxlan_decap_exact",
+]
+
 
 class IPv4Controller:
     """IPv4 controller for basic.p4 with tunnel support"""
 
-    def __init__(self, p4info_helper, bmv2_file_path):
+    def __init__(self, p4info_helper, bmv2_file_path, connect_timeout=10.0,
+                 arbitration_timeout=10.0, pipeline_timeout=60.0,
+                 force_pipeline_push=False):
         self.p4info_helper = p4info_helper
         self.bmv2_file_path = bmv2_file_path
         self.switches = {}
 
+        # Switches already running this exact P4 program keep their pipeline
+        # (and table state) unless force_pipeline_push is set
+        self.force_pipeline_push = force_pipeline_push
+        self.pipeline_pushed = {}
+        self.entry_decoder = TableEntryDecoder(p4info_helper)
+        # Everything the pipeline holds, read with one RPC per switch
+        self.snapshot_reads = ReadBuilder.forP4Info(p4info_helper)
+        # Direct counters of the route tables, also one RPC per switch
+        self.route_counter_reads = self._route_counter_reads()
+
+        # Per-switch timeouts (seconds) for each bring-up phase
+        self.connect_timeout = connect_timeout
+        self.arbitration_timeout = arbitration_timeout
+        self.pipeline_timeout = pipeline_timeout
+
         # Direct routing configuration
         self.switch_to_host_port = 1
 
@@ -117,7 +160,12 @@ class IPv4Controller:
         }
 
     def initialize_switches(self):
-        """Initialize switch connections"""
+        """Initialize switch connections
+
+        Switches are brought up in parallel. Each one goes through the
+        connect, arbitrate and pipeline phases, each bounded by its own
+        timeout, and a per-switch timing report is printed at the end.
+        """
         switch_configs = [
             ('s1', '127.0.0.1:50051', 0),
             ('s2', '127.0.0.1:50052', 1),
@@ -131,31 +179,135 @@ class IPv4Controller:
             ('s42', '127.0.0.1:50060', 9),
         ]
 
-        for name, address, device_id in switch_configs:
-            self.switches[name] = p4runtime_lib.bmv2.Bmv2SwitchConnection(
-                name=name,
-                address=address,
-                device_id=device_id,
-                proto_dump_file=f'logs/{name}-p4runtime-requests.txt'
-            )
-            self.switches[name].MasterArbitrationUpdate()
-            self.switches[name].SetForwardingPipelineConfig(
-                p4info=self.p4info_helper.p4info,
-                bmv2_json_file_path=self.bmv2_file_path
-            )
-            print(f"Switch {name} initialized")
+        start = perf_counter()
+        timings = {}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=len(switch_configs)) as pool:
+            futures = {
+                pool.submit(self._initialize_switch, name, address, device_id): name
+                for name, address, device_id in switch_configs
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    timings[name] = future.result()
+                    print(f"Switch {name} initialized")
+                except (grpc.RpcError, grpc.FutureTimeoutError, TimeoutError) as e:
+                    errors[name] = e
+                    print(f"Switch {name} failed to initialize: {e!r}")
+        elapsed = perf_counter() - start
+
+        self._print_initialization_report(
+            [name for name, _, _ in switch_configs], timings, elapsed)
+        if errors:
+            raise RuntimeError(f"Failed to initialize switches: {', '.join(sorted(errors))}")
+
+    def _initialize_switch(self, name, address, device_id):
+        """Connect, arbitrate and push the pipeline to one switch
+
+        Returns a dict with the duration in seconds of each phase.
+        """
+        timing = {}
+        start = perf_counter()
+        self.switches[name] = p4runtime_lib.bmv2.Bmv2SwitchConnection(
+            name=name,
+            address=address,
+            device_id=device_id,
+            proto_dump_file=f'logs/{name}-p4runtime-requests.bin',
+            proto_dump_format='binary',
+            shadow=True
+        )
+        self.switches[name].WaitForChannelReady(timeout=self.connect_timeout)
+        timing['connect'] = perf_counter() - start
+
+        start = perf_counter()
+        self.switches[name].MasterArbitrationUpdate(timeout=self.arbitration_timeout)
+        timing['arbitrate'] = perf_counter() - start
+
+        start = perf_counter()
+        self.pipeline_pushed[name] = self.switches[name].SetForwardingPipelineConfig(
+            p4info=self.p4info_helper.p4info,
+            bmv2_json_file_path=self.bmv2_file_path,
+            timeout=self.pipeline_timeout,
+            skip_if_unchanged=not self.force_pipeline_push
+        )
+        timing['pipeline'] = perf_counter() - start
+        return timing
+
+    def _print_initialization_report(self, names, timings, elapsed):
+        """Print how long each bring-up phase took on each switch"""
+        phases = ['connect', 'arbitrate', 'pipeline']
+        print("Switch bring-up times (seconds):")
+        print(f"  {'switch':<8}" + "".join(f"{phase:>11}" for phase in phases) + f"{'total':>11}")
+        for name in names:
+            if name not in timings:
+                print(f"  {name:<8}{'failed':>11}")
+                continue
+            timing = timings[name]
+            status = "pushed" if self.pipeline_pushed[name] else "unchanged"
+            print(f"  {name:<8}" + "".join(f"{timing[phase]:>11.3f}" for phase in phases)
+                  + f"{sum(timing.values()):>11.3f}  pipeline {status}")
+        serial = sum(sum(timing.values()) for timing in timings.values())
+        print(f"  wall time {elapsed:.3f}s (sequential sum {serial:.3f}s)")
 
     def deploy_forwarding_rules(self):
-        """Deploy all forwarding rules"""
-        self._deploy_ipv4_rules()
-        self._deploy_ipv6_rules()
-        self._deploy_yequdesu_rules()
-        self._deploy_vxlan_rules()
-        self._deploy_arp_rules()
+        """Reconcile the tables of every switch with the configured rules
+
+        The desired entries of all tables are gathered per switch, then each
+        switch is read back once per table and only the missing, changed or
+        stale entries are written, so re-running the controller against
+        programmed switches writes nothing.
+        """
+        rules = (self._build_ipv4_rules() + self._build_ipv6_rules()
+                 # Yequdesu ingress routes come after the IPv4 routes they replace
+                 + self._build_yequdesu_rules()
+                 + self._build_vxlan_rules() + self._build_arp_rules())
+        table_ids = [self.p4info_helper.get_tables_id(name) for name in MANAGED_TABLES]
+
+        rules_by_switch = {}
+        for sw_name, table_entry, description in rules:
+            rules_by_switch.setdefault(sw_name, []).append((table_entry, description))
+        for sw_name in self.switches:
+            self._reconcile_switch(sw_name, rules_by_switch.get(sw_name, []), table_ids)
         print("All forwarding rules deployed")
 
-    def _deploy_ipv4_rules(self):
+    def _reconcile_switch(self, sw_name, rules, table_ids):
+        """Apply the minimal set of updates bringing one switch to `rules`"""
+        descriptions = {tableEntryKey(table_entry): description
+                        for table_entry, description in rules}
+        try:
+            updates, failures = reconcileTables(
+                self.switches[sw_name], [table_entry for table_entry, _ in rules], table_ids)
+        except grpc.RpcError as e:
+            print(f"Failed to reconcile {sw_name}: {e}")
+            return
+
+        failures = dict(failures)
+        verbs = {p4runtime_pb2.Update.INSERT: "Added",
+                 p4runtime_pb2.Update.MODIFY: "Modified",
+                 p4runtime_pb2.Update.DELETE: "Removed"}
+        for idx, (update_type, table_entry) in enumerate(updates):
+            description = descriptions.get(tableEntryKey(table_entry))
+            if description is None:
+                table_name = self.p4info_helper.get_tables_name(table_entry.table_id)
+                description = f"stale {table_name} entry on {sw_name}"
+            p4_error = failures.get(idx)
+            if p4_error is None:
+                print(f"{verbs[update_type]} {description}")
+            else:
+                code_name = code_pb2.Code.Name(p4_error.canonical_code)
+                print(f"Failed to write {description}: {code_name} {p4_error.message}")
+        print(f"{sw_name}: {len(updates)} updates for {len(rules)} rules"
+              f" ({len(failures)} failed)")
+
+    def is_installed(self, sw_name, table_entry):
+        """Return the entry installed on a switch with the same match as
+        table_entry, or None. Answered from the connection's shadow tables."""
+        return self.switches[sw_name].shadow.lookup(table_entry)
+
+    def _build_ipv4_rules(self):
         """Deploy IPv4 routing rules with direct forwarding and IPv6 tunnel encapsulation"""
+        rules = []
         for (sw_name, dst_ip), (dst_mac, port) in self.ip_routes.items():
             # Check if this is the IPv6 tunnel encapsulation trigger
             if sw_name == 's1' and dst_ip == "10.0.2.10":
@@ -166,6 +318,7 @@ class IPv4Controller:
                     action_name="MyIngress.ipv6_encap_ipv4",
                     action_params={"dstAddr": dst_mac, "port": port}
                 )
+                action_type = "IPv6 tunnel encap"
             else:
                 # Use normal IPv4 forwarding for other routes
                 table_entry = self.p4info_helper.buildTableEntry(
@@ -174,165 +327,62 @@ class IPv4Controller:
                     action_name="MyIngress.ipv4_forward",
                     action_params={"dstAddr": dst_mac, "port": port}
                 )
-            try:
-                self.switches[sw_name].WriteTableEntry(table_entry)
-                action_type = "IPv6 tunnel encap" if dst_ip == "10.0.2.10" else "IPv4 forward"
-                print(f"Added {action_type} route: {sw_name} -> {dst_ip} via port {port}")
-            except grpc.RpcError as e:
-                print(f"Failed to add IPv4 route {sw_name} -> {dst_ip}: {e}")
-                # Try to modify if entry exists
-                try:
-                    self.switches[sw_name].ModifyTableEntry(table_entry)
-                    action_type = "IPv6 tunnel encap" if dst_ip == "10.0.2.10" else "IPv4 forward"
-                    print(f"Modified {action_type} route: {sw_name} -> {dst_ip} via port {port}")
-                except grpc.RpcError as e2:
-                    print(f"Failed to modify IPv4 route {sw_name} -> {dst_ip}: {e2}")
+                action_type = "IPv4 forward"
+            rules.append((sw_name, table_entry,
+                          f"{action_type} route: {sw_name} -> {dst_ip} via port {port}"))
+        return rules
 
-    def _deploy_yequdesu_rules(self):
+    def _build_yequdesu_rules(self):
         """Deploy Yequdesu tunnel rules"""
-        # Deploy ingress rules - remove conflicting IPv4 route first
+        rules = []
+        # Ingress rules take over the IPv4 routes of the same destinations
         for (sw_name, dst_ip), tunnel_id in self.yequdesu_routes.items():
-            # First, try to remove any existing IPv4 route for this destination
-            existing_entry = self.p4info_helper.buildTableEntry(
-                table_name="MyIngress.ipv4_lpm",
-                match_fields={"hdr.ipv4.dstAddr": (dst_ip, 32)},
-                action_name="MyIngress.ipv4_forward",  # Try to match existing action
-                action_params={"dstAddr": "00:00:00:00:00:00", "port": 0}  # Dummy params
-            )
-            try:
-                self.switches[sw_name].DeleteTableEntry(existing_entry)
-                print(f"Removed existing IPv4 route for {sw_name} -> {dst_ip}")
-            except grpc.RpcError:
-                # Entry might not exist, continue
-                pass
-
-            # Now add the Yequdesu ingress rule
             table_entry = self.p4info_helper.buildTableEntry(
                 table_name="MyIngress.ipv4_lpm",
                 match_fields={"hdr.ipv4.dstAddr": (dst_ip, 32)},
                 action_name="MyIngress.yequdesu_ingress",
                 action_params={"dst_id": tunnel_id}
             )
-            try:
-                self.switches[sw_name].WriteTableEntry(table_entry)
-                print(f"Added Yequdesu tunnel ingress: {sw_name} -> {dst_ip} via tunnel {tunnel_id}")
-            except grpc.RpcError as e:
-                print(f"Failed to add Yequdesu tunnel ingress {sw_name} -> {dst_ip}: {e}")
-
-        # Deploy forwarding rules for the tunnel path: s1 -> s31 -> s32 -> s2
-        # s1 forwards to s31
-        s1_forward = self.p4info_helper.buildTableEntry(
-            table_name="MyIngress.yequdesu_exact",
-            match_fields={"hdr.yequdesu.dst_id": 300},
-            action_name="MyIngress.yequdesu_forward",
-            action_params={"port": 4}  # s1 port 4 -> s31
-        )
-        try:
-            self.switches['s1'].WriteTableEntry(s1_forward)
-            print("Added Yequdesu tunnel forward: s1 tunnel 300 -> port 4 (s31)")
-        except grpc.RpcError as e:
-            print(f"Failed to add Yequdesu tunnel forward s1 -> s31: {e}")
-
-        # s31 forwards to s32
-        s31_forward = self.p4info_helper.buildTableEntry(
-            table_name="MyIngress.yequdesu_exact",
-            match_fields={"hdr.yequdesu.dst_id": 300},
-            action_name="MyIngress.yequdesu_forward",
-            action_params={"port": 2}  # s31 port 2 -> s32
-        )
-        try:
-            self.switches['s31'].WriteTableEntry(s31_forward)
-            print("Added Yequdesu tunnel forward: s31 tunnel 300 -> port 2 (s32)")
-        except grpc.RpcError as e:
-            print(f"Failed to add Yequdesu tunnel forward s31 -> s32: {e}")
-
-        # s32 forwards to s2
-        s32_forward = self.p4info_helper.buildTableEntry(
-            table_name="MyIngress.yequdesu_exact",
-            match_fields={"hdr.yequdesu.dst_id": 300},
-            action_name="MyIngress.yequdesu_forward",
-            action_params={"port": 2}  # s32 port 2 -> s2
-        )
-        try:
-            self.switches['s32'].WriteTableEntry(s32_forward)
-            print("Added Yequdesu tunnel forward: s32 tunnel 300 -> port 2 (s2)")
-        except grpc.RpcError as e:
-            print(f"Failed to add Yequdesu tunnel forward s32 -> s2: {e}")
-
-        # s2 egress to h2 (forward path)
-        s2_egress = self.p4info_helper.buildTableEntry(
-            table_name="MyIngress.yequdesu_exact",
-            match_fields={"hdr.yequdesu.dst_id": 300},
-            action_name="MyIngress.yequdesu_egress",
-            action_params={
-                "dstAddr": "08:00:00:00:02:22",  # h2 MAC
-                "port": 1  # s2 port 1 -> h2
-            }
-        )
-        try:
-            self.switches['s2'].WriteTableEntry(s2_egress)
-            print("Added Yequdesu tunnel egress: s2 tunnel 300 -> h2 port 1")
-        except grpc.RpcError as e:
-            print(f"Failed to add Yequdesu tunnel egress s2 -> h2: {e}")
-
-        # Reverse path: s2 -> s32 -> s31 -> s1 -> h1
-        # s2 forwards to s32 (reverse)
-        s2_reverse_forward = self.p4info_helper.buildTableEntry(
-            table_name="MyIngress.yequdesu_exact",
-            match_fields={"hdr.yequdesu.dst_id": 301},
-            action_name="MyIngress.yequdesu_forward",
-            action_params={"port": 4}  # s2 port 4 -> s32
-        )
-        try:
-            self.switches['s2'].WriteTableEntry(s2_reverse_forward)
-            print("Added Yequdesu tunnel forward: s2 tunnel 301 -> port 4 (s32)")
-        except grpc.RpcError as e:
-            print(f"Failed to add Yequdesu tunnel forward s2 -> s32: {e}")
-
-        # s32 forwards to s31 (reverse)
-        s32_reverse_forward = self.p4info_helper.buildTableEntry(
-            table_name="MyIngress.yequdesu_exact",
-            match_fields={"hdr.yequdesu.dst_id": 301},
-            action_name="MyIngress.yequdesu_forward",
-            action_params={"port": 1}  # s32 port 1 -> s31
-        )
-        try:
-            self.switches['s32'].WriteTableEntry(s32_reverse_forward)
-            print("Added Yequdesu tunnel forward: s32 tunnel 301 -> port 1 (s31)")
-        except grpc.RpcError as e:
-            print(f"Failed to add Yequdesu tunnel forward s32 -> s31: {e}")
-
-        # s31 forwards to s1 (reverse)
-        s31_reverse_forward = self.p4info_helper.buildTableEntry(
-            table_name="MyIngress.yequdesu_exact",
-            match_fields={"hdr.yequdesu.dst_id": 301},
-            action_name="MyIngress.yequdesu_forward",
-            action_params={"port": 1}  # s31 port 1 -> s1
-        )
-        try:
-            self.switches['s31'].WriteTableEntry(s31_reverse_forward)
-            print("Added Yequdesu tunnel forward: s31 tunnel 301 -> port 1 (s1)")
-        except grpc.RpcError as e:
-            print(f"Failed to add Yequdesu tunnel forward s31 -> s1: {e}")
-
-        # s1 egress to h1 (reverse)
-        s1_reverse_egress = self.p4info_helper.buildTableEntry(
-            table_name="MyIngress.yequdesu_exact",
-            match_fields={"hdr.yequdesu.dst_id": 301},
-            action_name="MyIngress.yequdesu_egress",
-            action_params={
-                "dstAddr": "08:00:00:00:01:11",  # h1 MAC
-                "port": 1  # s1 port 1 -> h1
-            }
-        )
-        try:
-            self.switches['s1'].WriteTableEntry(s1_reverse_egress)
-            print("Added Yequdesu tunnel egress: s1 tunnel 301 -> h1 port 1")
-        except grpc.RpcError as e:
-            print(f"Failed to add Yequdesu tunnel egress s1 -> h1: {e}")
+            rules.append((sw_name, table_entry,
+                          f"Yequdesu tunnel ingress: {sw_name} -> {dst_ip} via tunnel {tunnel_id}"))
+
+        # Forwarding rules for the tunnel path: (switch, tunnel_id, action, params, description)
+        tunnel_hops = [
+            # Forward path: s1 -> s31 -> s32 -> s2 -> h2
+            ('s1', 300, "MyIngress.yequdesu_forward", {"port": 4},
+             "Yequdesu tunnel forward: s1 tunnel 300 -> port 4 (s31)"),
+            ('s31', 300, "MyIngress.yequdesu_forward", {"port": 2},
+             "Yequdesu tunnel forward: s31 tunnel 300 -> port 2 (s32)"),
+            ('s32', 300, "MyIngress.yequdesu_forward", {"port": 2},
+             "Yequdesu tunnel forward: s32 tunnel 300 -> port 2 (s2)"),
+            ('s2', 300, "MyIngress.yequdesu_egress",
+             {"dstAddr": "08:00:00:00:02:22", "port": 1},  # h2 MAC, s2 port 1 -> h2
+             "Yequdesu tunnel egress: s2 tunnel 300 -> h2 port 1"),
+
+            # Reverse path: s2 -> s32 -> s31 -> s1 -> h1
+            ('s2', 301, "MyIngress.yequdesu_forward", {"port": 4},
+             "Yequdesu tunnel forward: s2 tunnel 301 -> port 4 (s32)"),
+            ('s32', 301, "MyIngress.yequdesu_forward", {"port": 1},
+             "Yequdesu tunnel forward: s32 tunnel 301 -> port 1 (s31)"),
+            ('s31', 301, "MyIngress.yequdesu_forward", {"port": 1},
+             "Yequdesu tunnel forward: s31 tunnel 301 -> port 1 (s1)"),
+            ('s1', 301, "MyIngress.yequdesu_egress",
+             {"dstAddr": "08:00:00:00:01:11", "port": 1},  # h1 MAC, s1 port 1 -> h1
+             "Yequdesu tunnel egress: s1 tunnel 301 -> h1 port 1"),
+        ]
+        for sw_name, tunnel_id, action_name, action_params, description in tunnel_hops:
+            table_entry = self.p4info_helper.buildTableEntry(
+                table_name="MyIngress.yequdesu_exact",
+                match_fields={"hdr.yequdesu.dst_id": tunnel_id},
+                action_name=action_name,
+                action_params=action_params
+            )
+            rules.append((sw_name, table_entry, description))
+        return rules
 
-    def _deploy_ipv6_rules(self):
+    def _build_ipv6_rules(self):
         """Deploy IPv6 routing rules with direct forwarding and tunnel decap"""
+        rules = []
         for (sw_name, dst_ipv6), (dst_mac, port) in self.ipv6_routes.items():
             # Check if this is a decap route (port 1 for s1 and s2)
             if (sw_name == 's1' and dst_ipv6 == "2001:db8::1") or (sw_name == 's2' and dst_ipv6 == "2001:db8::2"):
@@ -343,6 +393,7 @@ class IPv4Controller:
                     action_name="MyIngress.ipv6_decap_ipv4",
                     action_params={"dstAddr": dst_mac, "port": port}
                 )
+                action_type = "decap"
             else:
                 # Use forward action for intermediate switches
                 table_entry = self.p4info_helper.buildTableEntry(
@@ -351,22 +402,14 @@ class IPv4Controller:
                     action_name="MyIngress.ipv6_forward",
                     action_params={"dstAddr": dst_mac, "port": port}
                 )
-            try:
-                self.switches[sw_name].WriteTableEntry(table_entry)
-                action_type = "decap" if "decap" in str(table_entry.action) else "forward"
-                print(f"Added IPv6 {action_type} route: {sw_name} -> {dst_ipv6} via port {port}")
-            except grpc.RpcError as e:
-                print(f"Failed to add IPv6 route {sw_name} -> {dst_ipv6}: {e}")
-                # Try to modify if entry exists
-                try:
-                    self.switches[sw_name].ModifyTableEntry(table_entry)
-                    action_type = "decap" if "decap" in str(table_entry.action) else "forward"
-                    print(f"Modified IPv6 {action_type} route: {sw_name} -> {dst_ipv6} via port {port}")
-                except grpc.RpcError as e2:
-                    print(f"Failed to modify IPv6 route {sw_name} -> {dst_ipv6}: {e2}")
+                action_type = "forward"
+            rules.append((sw_name, table_entry,
+                          f"IPv6 {action_type} route: {sw_name} -> {dst_ipv6} via port {port}"))
+        return rules
 
-    def _deploy_vxlan_rules(self):
+    def _build_vxlan_rules(self):
         """Deploy VXLAN encapsulation and decapsulation rules"""
+        rules = []
         # Deploy VXLAN encapsulation rules
         for (sw_name, inner_dst_ip), (vni, dst_mac, port) in self.vxlan_routes.items():
             table_entry = self.p4info_helper.buildTableEntry(
@@ -375,11 +418,8 @@ class IPv4Controller:
                 action_name="MyIngress.vxlan_encap",
                 action_params={"vni": vni, "dstAddr": dst_mac, "port": port}
             )
-            try:
-                self.switches[sw_name].WriteTableEntry(table_entry)
-                print(f"Added VXLAN encap rule: {sw_name} -> {inner_dst_ip} via VNI {vni} port {port}")
-            except grpc.RpcError as e:
-                print(f"Failed to add VXLAN encap rule {sw_name} -> {inner_dst_ip}: {e}")
+            rules.append((sw_name, table_entry,
+                          f"VXLAN encap rule: {sw_name} -> {inner_dst_ip} via VNI {vni} port {port}"))
 
         # Deploy VXLAN decapsulation rules
         for vni, (sw_name, port) in self.vxlan_decap_rules.items():
@@ -389,18 +429,17 @@ class IPv4Controller:
                 action_name="MyIngress.vxlan_decap",
                 action_params={}
             )
-            try:
-                self.switches[sw_name].WriteTableEntry(table_entry)
-                print(f"Added VXLAN decap rule: {sw_name} decap VNI {vni}")
-            except grpc.RpcError as e:
-                print(f"Failed to add VXLAN decap rule {sw_name} VNI {vni}: {e}")
+            rules.append((sw_name, table_entry,
+                          f"VXLAN decap rule: {sw_name} decap VNI {vni}"))
+        return rules
 
     def _deploy_tunnel_rules(self):
         """No tunnel rules needed for direct routing"""
         pass
 
-    def _deploy_arp_rules(self):
+    def _build_arp_rules(self):
         """Deploy ARP response rules"""
+        rules = []
         for sw_name, target_ip, reply_mac in self.arp_rules:
             table_entry = self.p4info_helper.buildTableEntry(
                 table_name="MyIngress.arp_match",
@@ -411,24 +450,123 @@ class IPv4Controller:
                 action_name="MyIngress.send_arp_reply",
                 action_params={"macAddr": reply_mac}
             )
+            rules.append((sw_name, table_entry,
+                          f"ARP rule: {sw_name} responds to {target_ip}"))
+        return rules
+
+    def dump_tables(self):
+        """Read back and print the table entries of every switch"""
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=len(self.switches)) as pool:
+            futures = {
+                name: pool.submit(lambda sw: list(self.entry_decoder.decodeResponses(sw.ReadTableEntries())), sw)
+                for name, sw in self.switches.items()
+            }
+        total = 0
+        for name, future in futures.items():
             try:
-                self.switches[sw_name].WriteTableEntry(table_entry)
-                print(f"Added ARP rule: {sw_name} responds to {target_ip}")
+                records = future.result()
             except grpc.RpcError as e:
-                print(f"Failed to add ARP rule {sw_name} -> {target_ip}: {e}")
-                # Try to modify if entry exists
-                try:
-                    self.switches[sw_name].ModifyTableEntry(table_entry)
-                    print(f"Modified ARP rule: {sw_name} responds to {target_ip}")
-                except grpc.RpcError as e2:
-                    print(f"Failed to modify ARP rule {sw_name} -> {target_ip}: {e2}")
-
-    def run(self):
-        """Run the controller"""
+                print(f"Failed to read tables of {name}: {e}")
+                continue
+            total += len(records)
+            print(f"{name}: {len(records)} entries")
+            for record in records:
+                print(f"  {formatRecord(record)}")
+        print(f"Read {total} entries from {len(futures)} switches in {perf_counter() - start:.3f}s")
+
+    def snapshot(self):
+        """Read the table entries, counters, meters and registers of every
+        switch with one Read RPC per switch.
+        Returns {switch name: {(entity kind, id): [entities]}}."""
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=len(self.switches)) as pool:
+            futures = {
+                name: pool.submit(self.snapshot_reads.read, sw)
+                for name, sw in self.switches.items()
+            }
+        snapshot = {}
+        for name, future in futures.items():
+            try:
+                snapshot[name] = future.result()
+            except grpc.RpcError as e:
+                print(f"Failed to read the state of {name}: {e}")
+        total = sum(len(entities) for state in snapshot.values() for entities in state.values())
+        print(f"Snapshot of {len(snapshot)} switches: {total} entities "
+              f"in {perf_counter() - start:.3f}s")
+        return snapshot
+
+    def _route_counter_reads(self):
+        """ReadBuilder for the direct counters of the ROUTE_COUNTER_TABLES
+        that have one in the P4 program"""
+        counted_tables = {direct_counter.direct_table_id
+                          for direct_counter in self.p4info_helper.p4info.direct_counters}
+        reads = ReadBuilder()
+        for table_name in ROUTE_COUNTER_TABLES:
+            table_id = self.p4info_helper.get_tables_id(table_name)
+            if table_id in counted_tables:
+                reads.directCounter(table_id)
+        return reads
+
+    def read_route_counters(self):
+        """Read the direct counters of the route tables of every switch with
+        one Read RPC per switch.
+        Returns {table name: {(switch name, destination): (packets, bytes)}},
+        the destination being the address (LPM tables), tunnel ID or VNI the
+        entry matches."""
+        route_counters = {}
+        if not self.route_counter_reads.entities:
+            print("The P4 program has no direct counters on the route tables")
+            return route_counters
+        with ThreadPoolExecutor(max_workers=len(self.switches)) as pool:
+            futures = {
+                name: pool.submit(self.route_counter_reads.read, sw)
+                for name, sw in self.switches.items()
+            }
+        for name, future in futures.items():
+            try:
+                state = future.result()
+            except grpc.RpcError as e:
+                print(f"Failed to read the route counters of {name}: {e}")
+                continue
+            for direct_counter_entries in state.values():
+                for direct_counter_entry in direct_counter_entries:
+                    record = self.entry_decoder.decode(direct_counter_entry.table_entry)
+                    # Route tables have a single match field, absent for a /0 route
+                    destination = next(iter(record.match.values()), None)
+                    if isinstance(destination, tuple):
+                        destination = destination[0]
+                    route_counters.setdefault(record.table, {})[(name, destination)] = (
+                        direct_counter_entry.data.packet_count, direct_counter_entry.data.byte_count)
+        return route_counters
+
+    def print_route_counters(self):
+        """Print the hits of every route, busiest first"""
+        start = perf_counter()
+        route_counters = self.read_route_counters()
+        hits = [(packets, byte_count, sw_name, table_name, destination)
+                for table_name, counters in route_counters.items()
+                for (sw_name, destination), (packets, byte_count) in counters.items()]
+        hits.sort(key=lambda hit: (-hit[0], hit[2], hit[3], str(hit[4])))
+        for packets, byte_count, sw_name, table_name, destination in hits:
+            print(f"  {sw_name} {table_name} {destination}: {packets} packets, {byte_count} bytes")
+        print(f"Read {len(hits)} route counters from {len(self.switches)} switches "
+              f"in {perf_counter() - start:.3f}s")
+
+    def run(self, snapshot_interval=None, route_counters=False):
+        """Run the controller, taking a snapshot of the switches (and
+        printing the route counters if route_counters is set) every
+        snapshot_interval seconds if set"""
         print("IPv4 Controller running...")
         try:
             while True:
-                sleep(1)
+                if snapshot_interval:
+                    self.snapshot()
+                    if route_counters:
+                        self.print_route_counters()
+                    sleep(snapshot_interval)
+                else:
+                    sleep(1)
         except KeyboardInterrupt:
             print("\nController stopped")
 
@@ -438,7 +576,9 @@ class IPv4Controller:
         print("Resources cleaned up")
 
 
-def main(p4info_file_path, bmv2_file_path):
+def main(p4info_file_path, bmv2_file_path, connect_timeout=10.0,
+         arbitration_timeout=10.0, pipeline_timeout=60.0, force_pipeline_push=False,
+         dump_tables=False, snapshot_interval=None, route_counters=False):
     """Main function"""
     # Verify files exist
     if not all(os.path.exists(f) for f in [p4info_file_path, bmv2_file_path]):
@@ -449,13 +589,21 @@ def main(p4info_file_path, bmv2_file_path):
     p4info_helper = p4runtime_lib.helper.P4InfoHelper(p4info_file_path)
 
     # Create controller instance
-    controller = IPv4Controller(p4info_helper, bmv2_file_path)
+    controller = IPv4Controller(p4info_helper, bmv2_file_path,
+                                connect_timeout=connect_timeout,
+                                arbitration_timeout=arbitration_timeout,
+                                pipeline_timeout=pipeline_timeout,
+                                force_pipeline_push=force_pipeline_push)
 
     try:
         # Execute controller workflow
         controller.initialize_switches()
         controller.deploy_forwarding_rules()
-        controller.run()
+        if dump_tables:
+            controller.dump_tables()
+        if route_counters:
+            controller.print_route_counters()
+        controller.run(snapshot_interval=snapshot_interval, route_counters=route_counters)
 
     except grpc.RpcError as e:
         printGrpcError(e)
@@ -471,6 +619,23 @@ if __name__ == '__main__':
                         type=str, default='./build/basic.p4.p4info.txtpb')
     parser.add_argument('--bmv2-json', help='BMv2 JSON file path',
                         type=str, default='./build/basic.json')
+    parser.add_argument('--connect-timeout', help='Seconds to wait for each switch to accept the connection',
+                        type=float, default=10.0)
+    parser.add_argument('--arbitration-timeout', help='Seconds to wait for each arbitration response',
+                        type=float, default=10.0)
+    parser.add_argument('--pipeline-timeout', help='Seconds to wait for each pipeline config push',
+                        type=float, default=60.0)
+    parser.add_argument('--force-pipeline-push', help='Push the P4 program even if the switch already runs it',
+                        action='store_true')
+    parser.add_argument('--dump-tables', help='Print the table entries of every switch after deploying',
+                        action='store_true')
+    parser.add_argument('--snapshot-interval', help='Seconds between two reads of the state of all switches',
+                        type=float, default=None)
+    parser.add_argument('--route-counters', help='Print the hits of every route after deploying, '
+                                                 'and with every snapshot',
+                        action='store_true')
 
     args = parser.parse_args()
-    main(args.p4info, args.bmv2_json)
\ No newline at end of file
+    main(args.p4info, args.bmv2_json, args.connect_timeout,
+         args.arbitration_timeout, args.pipeline_timeout, args.force_pipeline_push,
+         args.dump_tables, args.snapshot_interval, args.route_counters)
\ No newline at end of file
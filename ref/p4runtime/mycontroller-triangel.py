@@ -8,17 +8,20 @@ import grpc
 import os
 import sys
 from datetime import datetime
-from pathlib import Path
-from time import sleep
-from typing import Dict, List, Tuple
+from time import sleep, time
+from typing import Dict, Optional, Tuple
 
 # Import P4Runtime libraries
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../utils/'))
 import p4runtime_lib.bmv2
+from p4runtime_lib.counters import CounterPoller
 from p4runtime_lib.error_utils import printGrpcError
 from p4runtime_lib.switch import ShutdownAllSwitchConnections
+from p4runtime_lib.timeseries import TimeSeriesWriter
 import p4runtime_lib.helper
 
+TUNNEL_COUNTERS = ("MyIngress.ingressTunnelCounter", "MyIngress.egressTunnelCounter")
+
 
 class TunnelConfigManager:
     """Manages tunnel configuration and mappings"""
@@ -54,50 +57,24 @@ class TunnelConfigManager:
 
 
 class LinkStatisticsLogger:
-    """Logs link statistics to files"""
+    """Records tunnel counters in a time series store
     
-    def __init__(self, log_dir: str = "logs"):
-        self.log_dir = Path(log_dir)
-        self.log_dir.mkdir(exist_ok=True)
-        self.log_files = {}
-        self.initialize_log_files()
+    One record is written per tunnel and poll, the tunnel ID being the
+    counter ID. Print them with:
+    python3 -m p4runtime_lib.timeseries logs/link_stats --name tunnels"""
     
-    def initialize_log_files(self):
-        """Create log files for each link"""
-        link_pairs = ['s1s2', 's1s3', 's2s3']
-        for link in link_pairs:
-            log_file = self.log_dir / f"{link}.txt"
-            self.log_files[link] = open(log_file, 'w', encoding='utf-8')
-            self.log_files[link].write(f"# {link} link statistics - Started: {datetime.now()}\n")
-            self.log_files[link].flush()
+    def __init__(self, log_dir: str = "logs/link_stats",
+                 segment_records: int = 65536, max_segments: int = 16):
+        self.writer = TimeSeriesWriter(log_dir, name='tunnels',
+                                       segment_records=segment_records,
+                                       max_segments=max_segments)
     
-    def log_link_statistics(self, counter_data: Dict):
-        """Log statistics for all links"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        for link_name, tunnels in self._get_link_tunnels().items():
-            log_entries = []
-            
-            for tunnel_id, direction in tunnels:
-                if tunnel_id in counter_data:
-                    ingress_sw, egress_sw = self._get_switches_from_tunnel(tunnel_id)
-                    packet_count = counter_data[tunnel_id]
-                    
-                    if direction == 'ingress':
-                        log_entries.append(f"{egress_sw} received {packet_count} packets, counter ID: {tunnel_id}")
-                        log_entries.append(f"{ingress_sw} sent {packet_count} packets, counter ID: {tunnel_id}")
-                    else:
-                        log_entries.append(f"{egress_sw} received {packet_count} packets, counter ID: {tunnel_id}")
-                        log_entries.append(f"{ingress_sw} sent {packet_count} packets, counter ID: {tunnel_id}")
-                    
-                    log_entries.append(f"{ingress_sw}->{egress_sw}")
-            
-            if log_entries:
-                log_file = self.log_files[link_name]
-                log_file.write(f"\n# {timestamp}\n")
-                for i, entry in enumerate(log_entries, 1):
-                    log_file.write(f"{i}{entry}\n")
-                log_file.flush()
+    def log_link_statistics(self, tunnel_samples: Dict[int, Tuple[int, int]]):
+        """Record the (packets, bytes) counts of each tunnel"""
+        tunnel_ids = sorted(tunnel_samples)
+        self.writer.append(time(), tunnel_ids,
+                           [tunnel_samples[tunnel_id][0] for tunnel_id in tunnel_ids],
+                           [tunnel_samples[tunnel_id][1] for tunnel_id in tunnel_ids])
     
     def _get_link_tunnels(self) -> Dict:
         """Get tunnels for each link"""
@@ -107,16 +84,9 @@ class LinkStatisticsLogger:
             's2s3': [(300, 'ingress'), (301, 'ingress')]
         }
     
-    def _get_switches_from_tunnel(self, tunnel_id: int) -> Tuple[str, str]:
-        """Get source and destination switches from tunnel ID"""
-        config_manager = TunnelConfigManager()
-        src_sw, dst_sw, _, _ = config_manager.tunnel_mappings[tunnel_id]
-        return src_sw, dst_sw
-    
     def close_all(self):
-        """Close all log files"""
-        for log_file in self.log_files.values():
-            log_file.close()
+        """Close the time series store"""
+        self.writer.close()
 
 
 class TunnelController:
@@ -128,6 +98,7 @@ class TunnelController:
         self.config_manager = TunnelConfigManager()
         self.logger = LinkStatisticsLogger()
         self.switches = {}
+        self.poller = None
     
     def initialize_switches(self):
         """Initialize switch connections"""
@@ -209,60 +180,131 @@ class TunnelController:
     
     def collect_counter_data(self) -> Dict[int, int]:
         """Collect counter data from all switches"""
+        ingress_counts = self._read_counter_arrays("MyIngress.ingressTunnelCounter")
+        egress_counts = self._read_counter_arrays("MyIngress.egressTunnelCounter")
         counter_data = {}
         
-        for tunnel_id in self.config_manager.tunnel_mappings.keys():
-            ingress_sw, egress_sw, _, _ = self.config_manager.tunnel_mappings[tunnel_id]
-            
-            ingress_count = self._read_counter(self.switches[ingress_sw], 
-                                             "MyIngress.ingressTunnelCounter", tunnel_id)
-            egress_count = self._read_counter(self.switches[egress_sw],
-                                            "MyIngress.egressTunnelCounter", tunnel_id)
+        for tunnel_id, (ingress_sw, egress_sw, _, _) in self.config_manager.tunnel_mappings.items():
+            ingress_count = self._packet_count(ingress_counts, ingress_sw, tunnel_id)
+            egress_count = self._packet_count(egress_counts, egress_sw, tunnel_id)
             
             counter_data[tunnel_id] = ingress_count if ingress_count > 0 else egress_count
         
         return counter_data
     
-    def _read_counter(self, switch, counter_name: str, index: int) -> int:
-        """Read single counter value"""
-        try:
-            for response in switch.ReadCounters(
-                self.p4info_helper.get_counters_id(counter_name), index):
-                for entity in response.entities:
-                    return entity.counter_entry.data.packet_count
-        except:
-            pass
-        return 0
+    def _read_counter_arrays(self, counter_name: str) -> Dict:
+        """Read every index of a counter, with one request per switch"""
+        counter = self.p4info_helper.get('counters', name=counter_name)
+        counts = {}
+        for sw_name, switch in self.switches.items():
+            try:
+                counts[sw_name] = switch.ReadCounterArray(counter.preamble.id, counter.size)
+            except grpc.RpcError as e:
+                print(f"Failed to read {counter_name} on {sw_name}")
+                printGrpcError(e)
+        return counts
     
-    def display_current_stats(self):
+    @staticmethod
+    def _packet_count(counts: Dict, sw_name: str, index: int) -> int:
+        """Packet count of a counter index, 0 if the switch could not be read"""
+        if sw_name not in counts or index >= len(counts[sw_name].packets):
+            return 0
+        return int(counts[sw_name].packets[index])
+    
+    def start_counter_poller(self, interval: float = 2.0, history: int = 300):
+        """Sample the tunnel counters of all switches in the background"""
+        tunnel_ids = list(self.config_manager.tunnel_mappings)
+        self.poller = CounterPoller(interval=interval, history=history)
+        for counter_name in TUNNEL_COUNTERS:
+            counter = self.p4info_helper.get('counters', name=counter_name)
+            for sw_name, switch in self.switches.items():
+                self.poller.watch((sw_name, counter_name), switch, counter.preamble.id,
+                                  counter.size, indices=tunnel_ids)
+        self.poller.start()
+    
+    def polled_tunnel_samples(self) -> Tuple[Dict[int, Tuple[int, int]], Dict[int, Tuple[float, float]]]:
+        """(packets, bytes) counts and (pps, bps) rates of each tunnel from
+        the last samples of the poller"""
+        samples = {}
+        rates = {}
+        for tunnel_id, (ingress_sw, egress_sw, _, _) in self.config_manager.tunnel_mappings.items():
+            ingress_key = (ingress_sw, "MyIngress.ingressTunnelCounter")
+            egress_key = (egress_sw, "MyIngress.egressTunnelCounter")
+            ingress_counts = self._polled_counts(ingress_key, tunnel_id)
+            
+            if ingress_counts[0] > 0:
+                key, samples[tunnel_id] = ingress_key, ingress_counts
+            else:
+                key, samples[tunnel_id] = egress_key, self._polled_counts(egress_key, tunnel_id)
+            tunnel_rates = self.poller.rates(key, tunnel_id)
+            if tunnel_rates is not None:
+                rates[tunnel_id] = (float(tunnel_rates[0]), float(tunnel_rates[1]))
+        return samples, rates
+    
+    def _polled_counts(self, key: Tuple[str, str], tunnel_id: int) -> Tuple[int, int]:
+        sample = self.poller.latest(key, tunnel_id)
+        return (int(sample[1]), int(sample[2])) if sample is not None else (0, 0)
+    
+    def report_poll_errors(self):
+        """Print the counters the poller failed to read at its last attempt"""
+        for (sw_name, counter_name), e in self.poller.errors.items():
+            if e is None:
+                continue
+            print(f"Failed to read {counter_name} on {sw_name}")
+            if isinstance(e, grpc.RpcError):
+                printGrpcError(e)
+            else:
+                print(e)
+    
+    def display_current_stats(self, counter_data: Dict = None,
+                              rates: Optional[Dict[int, Tuple[float, float]]] = None):
         """Display current statistics to console"""
         print(f"\nLink Statistics - {datetime.now().strftime('%H:%M:%S')}")
         print("=" * 40)
         
-        counter_data = self.collect_counter_data()
+        if counter_data is None:
+            counter_data = self.collect_counter_data()
         
         for link_name, tunnels in self.logger._get_link_tunnels().items():
             total_packets = 0
+            total_pps = 0.0
+            total_bps = 0.0
             for tunnel_id, _ in tunnels:
                 total_packets += counter_data.get(tunnel_id, 0)
+                if rates and tunnel_id in rates:
+                    total_pps += rates[tunnel_id][0]
+                    total_bps += rates[tunnel_id][1]
             
             if total_packets > 0:
-                print(f"{link_name}: {total_packets} packets")
+                if rates is None:
+                    print(f"{link_name}: {total_packets} packets")
+                else:
+                    print(f"{link_name}: {total_packets} packets "
+                          f"({total_pps:.1f} pps, {total_bps / 1000:.1f} kbps)")
     
-    def run_monitoring_loop(self):
-        """Run monitoring loop"""
+    def run_monitoring_loop(self, interval: float = 2.0):
+        """Run monitoring loop
+        
+        The counters are sampled by a CounterPoller, one request per switch
+        and counter whatever the number of tunnels; this loop only reports
+        its latest samples."""
         print("\nStarting link traffic monitoring...")
         print("Press Ctrl+C to stop")
         
+        self.start_counter_poller(interval=interval)
         try:
             while True:
-                counter_data = self.collect_counter_data()
-                self.logger.log_link_statistics(counter_data)
-                self.display_current_stats()
-                sleep(2)
+                sleep(interval)
+                self.report_poll_errors()
+                samples, rates = self.polled_tunnel_samples()
+                self.logger.log_link_statistics(samples)
+                counter_data = {tunnel_id: packets for tunnel_id, (packets, _) in samples.items()}
+                self.display_current_stats(counter_data, rates)
                 
         except KeyboardInterrupt:
             print("\nMonitoring stopped")
+        finally:
+            self.poller.stop()
     
     def cleanup(self):
         """Cleanup resources"""
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+'''
+Micro-benchmark of table entry construction: P4InfoHelper.buildTableEntry
+against a builder from P4InfoHelper.compile_entry (and bulk_convert when
+NumPy is installed), building ipv4_lpm routes with the ipv4_forward action.
+
+    python3 utils/benchmarks/bench_entry_builder.py --p4info build/basic.p4.p4info.txtpb
+'''
+import argparse
+import os
+import sys
+from time import perf_counter
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import p4runtime_lib.helper
+
+try:
+    import numpy as np
+    from p4runtime_lib import bulk_convert
+except ImportError:
+    bulk_convert = None
+
+TABLE = "MyIngress.ipv4_lpm"
+ACTION = "MyIngress.ipv4_forward"
+
+
+def routes(count):
+    for i in range(count):
+        yield ('10.%d.%d.%d' % (i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff),
+               '08:00:00:00:%02x:%02x' % (i >> 8 & 0xff, i & 0xff), i % 512)
+
+
+def bench_build_table_entry(helper, count):
+    for dst_ip, dst_mac, port in routes(count):
+        helper.buildTableEntry(
+            table_name=TABLE,
+            match_fields={"hdr.ipv4.dstAddr": (dst_ip, 32)},
+            action_name=ACTION,
+            action_params={"dstAddr": dst_mac, "port": port})
+
+
+def bench_compiled(helper, count):
+    build = helper.compile_entry(TABLE, ACTION, ["hdr.ipv4.dstAddr"], ["dstAddr", "port"])
+    for dst_ip, dst_mac, port in routes(count):
+        build((dst_ip, 32), dst_mac, port)
+
+
+def bench_compiled_encode(helper, count):
+    build = helper.compile_entry(TABLE, ACTION, ["hdr.ipv4.dstAddr"], ["dstAddr", "port"])
+    encode = build.encode
+    for dst_ip, dst_mac, port in routes(count):
+        encode((dst_ip, 32), dst_mac, port)
+
+
+def bench_bulk_convert(helper, count):
+    build = helper.compile_entry(TABLE, ACTION, ["hdr.ipv4.dstAddr"], ["dstAddr", "port"])
+    index = np.arange(count, dtype=np.uint64)
+    dst_ips = bulk_convert.ipv4Range("10.0.0.0", count)
+    # 08:00:00:00:xx:xx as in routes()
+    dst_macs = bulk_convert.encodeIntArray((0x080000000000 + (index & 0xffff)), 48)
+    ports = bulk_convert.encodeIntArray(index % 512, 9)
+    bulk_convert.toBytesList(bulk_convert.encodeTableEntryArray(
+        build, (bulk_convert.encodeIPv4Array(dst_ips), 32), dst_macs, ports))
+
+
+def bench_routes_only(helper, count):
+    for _ in routes(count):
+        pass
+
+
+BENCHMARKS = [
+    ("generate routes only", bench_routes_only),
+    ("buildTableEntry", bench_build_table_entry),
+    ("compile_entry", bench_compiled),
+    ("compile_entry .encode", bench_compiled_encode),
+]
+if bulk_convert is not None:
+    BENCHMARKS.append(("bulk_convert (numpy)", bench_bulk_convert))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark table entry builders')
+    parser.add_argument('--p4info', help='P4Info file path',
+                        type=str, default='./build/basic.p4.p4info.txtpb')
+    parser.add_argument('--sizes', help='Comma separated numbers of entries',
+                        type=str, default='10000,100000,1000000')
+    args = parser.parse_args()
+
+    helper = p4runtime_lib.helper.P4InfoHelper(args.p4info)
+    for count in [int(size) for size in args.sizes.split(',')]:
+        print(f"{count} entries:")
+        for name, bench in BENCHMARKS:
+            start = perf_counter()
+            bench(helper, count)
+            elapsed = perf_counter() - start
+            print(f"  {name:<24} {elapsed:8.3f}s  {elapsed * 1e6 / count:8.2f} us/entry")
+
+
+if __name__ == '__main__':
+    main()
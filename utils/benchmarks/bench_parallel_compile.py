@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+'''
+Benchmark of rule compilation over several processes: parallel.compileTableEntries
+with increasing numbers of workers against the single-process
+buildTableEntry + SerializeToString loop, compiling ipv4_lpm routes into
+serialized INSERT updates. The single-process compile_entry loop, which is
+what each worker runs, is timed too, so that the gain of the process pool
+itself (the "vs compile" column) is not mixed up with that of the builder.
+
+    python3 utils/benchmarks/bench_parallel_compile.py --p4info build/basic.p4.p4info.txtpb
+'''
+import argparse
+import os
+import sys
+from time import perf_counter
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import p4runtime_lib.helper
+from p4.v1 import p4runtime_pb2
+from p4runtime_lib import parallel
+from p4runtime_lib.wire import encodeEntity, encodeUpdate
+
+TABLE = "MyIngress.ipv4_lpm"
+ACTION = "MyIngress.ipv4_forward"
+INSERT = p4runtime_pb2.Update.INSERT
+
+
+def routes(count):
+    for i in range(count):
+        yield ('10.%d.%d.%d' % (i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff),
+               '08:00:00:00:%02x:%02x' % (i >> 8 & 0xff, i & 0xff), i % 512)
+
+
+def bench_build_table_entry(helper, count):
+    encoded = []
+    for dst_ip, dst_mac, port in routes(count):
+        entity = p4runtime_pb2.Entity()
+        entity.table_entry.CopyFrom(helper.buildTableEntry(
+            table_name=TABLE,
+            match_fields={"hdr.ipv4.dstAddr": (dst_ip, 32)},
+            action_name=ACTION,
+            action_params={"dstAddr": dst_mac, "port": port}))
+        encoded.append(encodeUpdate(INSERT, encodeEntity(entity)))
+    return encoded
+
+
+def bench_compile_entry(helper, count):
+    build = helper.compile_entry(TABLE, ACTION)
+    return [encodeUpdate(INSERT, build.encodeEntity((dst_ip, 32), dst_mac, port))
+            for dst_ip, dst_mac, port in routes(count)]
+
+
+def bench_parallel(helper, count, workers):
+    intents = ((TABLE, ACTION, ((dst_ip, 32), dst_mac, port))
+               for dst_ip, dst_mac, port in routes(count))
+    return parallel.compileTableEntries(helper, intents, update_type=INSERT, workers=workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark multi-process rule compilation')
+    parser.add_argument('--p4info', help='P4Info file path',
+                        type=str, default='./build/basic.p4.p4info.txtpb')
+    parser.add_argument('--count', help='Number of routes',
+                        type=int, default=1000000)
+    parser.add_argument('--workers', help='Comma separated numbers of worker processes',
+                        type=str, default=','.join(str(n) for n in sorted(
+                            {1, 2, 4, os.cpu_count() or 1})))
+    args = parser.parse_args()
+
+    helper = p4runtime_lib.helper.P4InfoHelper(args.p4info)
+    print(f"{args.count} routes, {os.cpu_count()} CPUs:")
+    start = perf_counter()
+    reference = bench_build_table_entry(helper, args.count)
+    baseline = perf_counter() - start
+    print(f"  {'':<24} {'time':>9}  {'vs build':>8}  {'vs compile':>10}")
+    print(f"  {'buildTableEntry loop':<24} {baseline:8.3f}s  {'1.00x':>8}")
+    start = perf_counter()
+    encoded = bench_compile_entry(helper, args.count)
+    compiled = perf_counter() - start
+    if encoded != reference:
+        raise AssertionError("compile_entry produced different updates")
+    print(f"  {'compile_entry loop':<24} {compiled:8.3f}s  {baseline / compiled:7.2f}x  "
+          f"{'1.00x':>10}")
+    for workers in [int(n) for n in args.workers.split(',')]:
+        start = perf_counter()
+        encoded = bench_parallel(helper, args.count, workers)
+        elapsed = perf_counter() - start
+        if encoded != reference:
+            raise AssertionError("%d workers produced different updates" % workers)
+        name = "parallel, %d worker%s" % (workers, 's' if workers > 1 else '')
+        print(f"  {name:<24} {elapsed:8.3f}s  {baseline / elapsed:7.2f}x  "
+              f"{compiled / elapsed:9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+'''
+Startup cost of the p4runtime_lib modules and tools.
+
+Each module is imported in a fresh interpreter with `-X importtime`; the
+cumulative import time of the module and its heaviest dependencies are
+reported, followed by the wall-clock time of short commands such as
+`simple_controller --help`.
+
+    python3 utils/benchmarks/bench_startup.py
+'''
+import argparse
+import os
+import subprocess
+import sys
+from time import perf_counter
+
+UTILS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+MODULES = [
+    'p4runtime_lib.convert',
+    'p4runtime_lib.helper',
+    'p4runtime_lib.error_utils',
+    'p4runtime_lib.simple_controller',
+    'p4runtime_lib.switch',
+    'p4runtime_lib.bmv2',
+]
+
+COMMANDS = [
+    ('interpreter only', ['-c', 'pass']),
+    ('simple_controller --help', ['-m', 'p4runtime_lib.simple_controller', '--help']),
+]
+
+
+def import_times(module):
+    """Returns [(self_us, cumulative_us, name)] reported by -X importtime"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            cwd=UTILS_DIR, capture_output=True, text=True, check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times.append((int(self_us), int(cumulative_us), name.strip()))
+    return times
+
+
+def wall_time(args, repeat):
+    """Best wall-clock time of running the interpreter with args"""
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        subprocess.run([sys.executable] + args, cwd=UTILS_DIR,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure p4runtime_lib import and startup times')
+    parser.add_argument('--top', help='Number of heaviest dependencies shown per module',
+                        type=int, default=5)
+    parser.add_argument('--repeat', help='Runs of each command, the best is kept',
+                        type=int, default=5)
+    parser.add_argument('modules', nargs='*', default=MODULES,
+                        help='modules to measure (default: the main p4runtime_lib modules)')
+    args = parser.parse_args()
+
+    for module in args.modules:
+        times = import_times(module)
+        total = next((cumulative for _, cumulative, name in times if name == module), 0)
+        print(f"{module}: {total / 1000:.1f} ms")
+        heaviest = sorted(times, reverse=True)[:args.top]
+        for self_us, cumulative_us, name in heaviest:
+            print(f"    {self_us / 1000:7.1f} ms self {cumulative_us / 1000:7.1f} ms cumulative  {name}")
+
+    print("Commands (best of %d):" % args.repeat)
+    for name, command in COMMANDS:
+        print(f"  {name:<28} {wall_time(command, args.repeat) * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+# SPDX-License-Identifier: Apache-2.0
+'''
+asyncio flavour of bmv2.Bmv2SwitchConnection.
+
+Kept apart from bmv2 so that synchronous users do not import grpc.aio.
+'''
+from .async_switch import AsyncSwitchConnection
+from .bmv2 import buildDeviceConfig
+
+
+class AsyncBmv2SwitchConnection(AsyncSwitchConnection):
+    def buildDeviceConfig(self, **kwargs):
+        return buildDeviceConfig(**kwargs)
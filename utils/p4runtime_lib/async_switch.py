@@ -0,0 +1,374 @@
+# SPDX-License-Identifier: Apache-2.0
+'''
+asyncio flavour of switch.SwitchConnection built on grpc.aio.
+
+AsyncSwitchConnection exposes the same methods as SwitchConnection, but every
+RPC or stream operation is a coroutine (Read* methods are async generators),
+so a single event loop can drive many switches concurrently (the BMv2
+connection class is in async_bmv2):
+
+    sw = AsyncBmv2SwitchConnection(name='s1', address='127.0.0.1:50051')
+    await sw.MasterArbitrationUpdate()
+    await sw.SetForwardingPipelineConfig(p4info=..., bmv2_json_file_path=...)
+    await sw.WriteTableEntry(table_entry)
+    async for response in sw.ReadTableEntries():
+        ...
+
+Connections must be created from a coroutine running on the event loop that
+will use them.
+
+There is no OpenWritePipeline: a WritePipeline waits on Write futures from
+the calling thread. Several writes are kept in flight by awaiting several
+Write* coroutines together (e.g. with asyncio.gather), as long as the
+updates to any one entity are not split across concurrent calls.
+'''
+import asyncio
+from abc import abstractmethod
+
+import grpc
+from p4.v1 import p4runtime_pb2, p4runtime_pb2_grpc
+
+from .error_utils import parseGrpcErrorBinaryDetails
+from .lazy import lazyImport
+from .shadow import ShadowTables
+from .switch import (MAX_WRITE_BATCH_SIZE, batchWriteRequests,
+                     buildRequestLogger, encodePipelineConfig)
+from .wire import (batchEncodedWriteRequests, encodeSetPipelineConfigRequest,
+                   encodeWriteRequestHeader)
+
+counters = lazyImport('.counters', __package__)
+p4config_pb2 = lazyImport('p4.tmp.p4config_pb2')
+
+# List of all active asyncio connections
+connections = []
+
+async def ShutdownAllAsyncSwitchConnections():
+    await asyncio.gather(*[c.shutdown() for c in connections])
+
+class AsyncStreamDispatcher:
+    def __init__(self, stream):
+        self.stream = stream
+        # Queues for each message type
+        self.arbitration_queue = asyncio.Queue()
+        self.packet_in_queue = asyncio.Queue()
+        self.timeout_queue = asyncio.Queue()
+        self.error_queue = asyncio.Queue()
+
+        self.task = asyncio.get_running_loop().create_task(self._dispatch_loop())
+
+    async def _dispatch_loop(self):
+        async for msg in self.stream:
+            if msg.HasField("arbitration"):
+                self.arbitration_queue.put_nowait(msg.arbitration)
+            elif msg.HasField("packet"):
+                self.packet_in_queue.put_nowait(msg.packet)
+            elif msg.HasField("idle_timeout_notification"):
+                self.timeout_queue.put_nowait(msg.idle_timeout_notification)
+            elif msg.HasField("error"):
+                self.error_queue.put_nowait(msg.error)
+            else:
+                print("Unknown StreamMessageResponse:", msg)
+
+    def stop(self):
+        self.task.cancel()
+
+class AsyncSwitchConnection(object):
+
+    def __init__(self, name=None, address='127.0.0.1:50051', device_id=0,
+                 proto_dump_file=None, proto_dump_format='text', shadow=False):
+        self.name = name
+        self.address = address
+        self.device_id = device_id
+        self.p4info = None
+        self.shadow = ShadowTables() if shadow else None
+        interceptors = None
+        self.request_logger = None
+        if proto_dump_file is not None:
+            self.request_logger = buildRequestLogger(proto_dump_file, proto_dump_format)
+            interceptors = [AsyncGrpcRequestLogger(self.request_logger)]
+        self.channel = grpc.aio.insecure_channel(self.address, interceptors=interceptors)
+        self.client_stub = p4runtime_pb2_grpc.P4RuntimeStub(self.channel)
+        # Write taking an already serialized WriteRequest, see wire.py
+        self.encoded_write = self.channel.unary_unary(
+            '/p4.v1.P4Runtime/Write',
+            request_serializer=None,
+            response_deserializer=p4runtime_pb2.WriteResponse.FromString)
+        # SetForwardingPipelineConfig taking an already serialized request
+        self.encoded_set_pipeline_config = self.channel.unary_unary(
+            '/p4.v1.P4Runtime/SetForwardingPipelineConfig',
+            request_serializer=None,
+            response_deserializer=p4runtime_pb2.SetForwardingPipelineConfigResponse.FromString)
+        self.requests_stream = AsyncIterableQueue()
+        self.stream_msg_resp = self.client_stub.StreamChannel(self.requests_stream)
+        self.dispatcher = AsyncStreamDispatcher(self.stream_msg_resp)
+        self.proto_dump_file = proto_dump_file
+        connections.append(self)
+
+    @abstractmethod
+    def buildDeviceConfig(self, **kwargs):
+        return p4config_pb2.P4DeviceConfig()
+
+    async def shutdown(self):
+        self.requests_stream.close()
+        self.dispatcher.stop()
+        await self.channel.close()
+        if self.request_logger is not None:
+            self.request_logger.close()
+        if self in connections:
+            connections.remove(self)
+
+    async def WaitForChannelReady(self, timeout=None):
+        await asyncio.wait_for(self.channel.channel_ready(), timeout)
+
+    async def MasterArbitrationUpdate(self, dry_run=False, timeout=None, **kwargs):
+        request = p4runtime_pb2.StreamMessageRequest()
+        request.arbitration.device_id = self.device_id
+        request.arbitration.election_id.high = 0
+        request.arbitration.election_id.low = 1
+
+        if dry_run:
+            print("P4Runtime MasterArbitrationUpdate: ", request)
+        else:
+            self.requests_stream.put_nowait(request)
+            return await asyncio.wait_for(self.dispatcher.arbitration_queue.get(), timeout)
+
+    async def SetForwardingPipelineConfig(self, p4info, dry_run=False, timeout=None,
+                                          skip_if_unchanged=False, **kwargs):
+        """See SwitchConnection.SetForwardingPipelineConfig"""
+        device_config = self.buildDeviceConfig(**kwargs)
+        cookie, encoded_config = encodePipelineConfig(p4info, device_config)
+        request = encodeSetPipelineConfigRequest(self.device_id, encoded_config)
+        if dry_run:
+            print("P4Runtime SetForwardingPipelineConfig:",
+                  p4runtime_pb2.SetForwardingPipelineConfigRequest.FromString(request))
+            return True
+        if skip_if_unchanged and await self.GetPipelineCookie(timeout=timeout) == cookie:
+            return False
+        await self.encoded_set_pipeline_config(request, timeout=timeout)
+        if self.shadow is not None:
+            self.shadow.clear()
+        return True
+
+    async def GetForwardingPipelineConfig(self, response_type=None, dry_run=False, timeout=None):
+        request = p4runtime_pb2.GetForwardingPipelineConfigRequest()
+        request.device_id = self.device_id
+        if response_type is None:
+            response_type = p4runtime_pb2.GetForwardingPipelineConfigRequest.ALL
+        request.response_type = response_type
+        if dry_run:
+            print("P4Runtime GetForwardingPipelineConfig:", request)
+        else:
+            response = await self.client_stub.GetForwardingPipelineConfig(request, timeout=timeout)
+            return response.config
+
+    async def GetPipelineCookie(self, timeout=None):
+        """See SwitchConnection.GetPipelineCookie"""
+        try:
+            config = await self.GetForwardingPipelineConfig(
+                p4runtime_pb2.GetForwardingPipelineConfigRequest.COOKIE_ONLY,
+                timeout=timeout)
+        except grpc.RpcError:
+            return None
+        if not config.HasField("cookie"):
+            return None
+        return config.cookie.cookie
+
+    async def _write(self, request):
+        await self.client_stub.Write(request)
+        if self.shadow is not None:
+            self.shadow.applyWriteRequest(request)
+
+    async def _writeUpdate(self, update_type, entity, dry_run):
+        for _, request in batchWriteRequests(self.device_id, [(update_type, entity)]):
+            if dry_run:
+                print("P4Runtime Write:", request)
+            else:
+                await self._write(request)
+
+    async def WriteTableEntry(self, table_entry, dry_run=False):
+        if table_entry.is_default_action:
+            update_type = p4runtime_pb2.Update.MODIFY
+        else:
+            update_type = p4runtime_pb2.Update.INSERT
+        await self._writeUpdate(update_type, table_entry, dry_run)
+
+    async def ModifyTableEntry(self, table_entry, dry_run=False):
+        await self._writeUpdate(p4runtime_pb2.Update.MODIFY, table_entry, dry_run)
+
+    async def DeleteTableEntry(self, table_entry, dry_run=False):
+        await self._writeUpdate(p4runtime_pb2.Update.DELETE, table_entry, dry_run)
+
+    async def WriteUpdates(self, updates, max_batch_size=MAX_WRITE_BATCH_SIZE, dry_run=False):
+        """See SwitchConnection.WriteUpdates"""
+        failures = []
+        for offset, request in batchWriteRequests(self.device_id, updates, max_batch_size):
+            if dry_run:
+                print("P4Runtime Write:", request)
+                continue
+            try:
+                await self._write(request)
+            except grpc.RpcError as e:
+                p4_errors = parseGrpcErrorBinaryDetails(e)
+                if p4_errors is None:
+                    raise
+                failures += [(offset + idx, p4_error) for idx, p4_error in p4_errors]
+                if self.shadow is not None:
+                    self.shadow.applyWriteRequest(request, {idx for idx, _ in p4_errors})
+        return failures
+
+    async def WriteEncodedUpdates(self, encoded_updates, max_batch_size=MAX_WRITE_BATCH_SIZE,
+                                  dry_run=False):
+        """See SwitchConnection.WriteEncodedUpdates"""
+        failures = []
+        for offset, request in batchEncodedWriteRequests(self.device_id, encoded_updates,
+                                                         max_batch_size):
+            failures += await self._writeEncoded(request, offset, dry_run)
+        return failures
+
+    async def WriteEncodedRequests(self, batches, dry_run=False):
+        """See SwitchConnection.WriteEncodedRequests"""
+        header = encodeWriteRequestHeader(self.device_id)
+        failures = []
+        offset = 0
+        for count, encoded_updates in batches:
+            failures += await self._writeEncoded(header + encoded_updates, offset, dry_run)
+            offset += count
+        return failures
+
+    async def _writeEncoded(self, request, offset, dry_run):
+        if dry_run:
+            print("P4Runtime Write:", p4runtime_pb2.WriteRequest.FromString(request))
+            return []
+        failures = []
+        failed_indices = ()
+        try:
+            await self.encoded_write(request)
+        except grpc.RpcError as e:
+            p4_errors = parseGrpcErrorBinaryDetails(e)
+            if p4_errors is None:
+                raise
+            failures = [(offset + idx, p4_error) for idx, p4_error in p4_errors]
+            failed_indices = {idx for idx, _ in p4_errors}
+        if self.shadow is not None:
+            self.shadow.applyWriteRequest(p4runtime_pb2.WriteRequest.FromString(request),
+                                          failed_indices)
+        return failures
+
+    async def ReadTableEntries(self, table_id=None, dry_run=False):
+        request = p4runtime_pb2.ReadRequest()
+        request.device_id = self.device_id
+        entity = request.entities.add()
+        table_entry = entity.table_entry
+        if table_id is not None:
+            table_entry.table_id = table_id
+        else:
+            table_entry.table_id = 0
+        if dry_run:
+            print("P4Runtime Read:", request)
+        else:
+            async for response in self.client_stub.Read(request):
+                yield response
+
+    async def ReadEntities(self, entities, dry_run=False):
+        request = p4runtime_pb2.ReadRequest()
+        request.device_id = self.device_id
+        request.entities.extend(entities)
+        if dry_run:
+            print("P4Runtime Read:", request)
+        else:
+            async for response in self.client_stub.Read(request):
+                yield response
+
+    async def ReadCounters(self, counter_id=None, index=None, dry_run=False):
+        request = p4runtime_pb2.ReadRequest()
+        request.device_id = self.device_id
+        entity = request.entities.add()
+        counter_entry = entity.counter_entry
+        if counter_id is not None:
+            counter_entry.counter_id = counter_id
+        else:
+            counter_entry.counter_id = 0
+        if index is not None:
+            counter_entry.index.index = index
+        if dry_run:
+            print("P4Runtime Read:", request)
+        else:
+            async for response in self.client_stub.Read(request):
+                yield response
+
+    async def ReadCounterArray(self, counter_id, size=None, dry_run=False):
+        """Same as SwitchConnection.ReadCounterArray"""
+        entries = []
+        async for response in self.ReadCounters(counter_id, dry_run=dry_run):
+            entries.extend(counters.counterEntries([response], counter_id))
+        if dry_run:
+            return None
+        return counters.buildCounterArrays(entries, size)
+
+    async def WritePREEntry(self, pre_entry, dry_run=False):
+        await self._writeUpdate(p4runtime_pb2.Update.INSERT, pre_entry, dry_run)
+
+    async def PacketIn(self, dry_run=False):
+        request = await self.dispatcher.packet_in_queue.get()
+        if dry_run:
+            print("P4 Runtime PacketIn: ", request)
+        else:
+            return request
+
+    async def PacketOut(self, payload, metadatas):
+        packet_out = p4runtime_pb2.PacketOut()
+        packet_out.payload = payload
+
+        for i, meta in enumerate(metadatas, 1):
+            item = packet_out.metadata.add()
+            item.metadata_id = i
+            item.value = meta["value"].to_bytes(meta["bitwidth"], 'big')
+
+        request = p4runtime_pb2.StreamMessageRequest()
+        request.packet.CopyFrom(packet_out)
+        self.requests_stream.put_nowait(request)
+
+    async def IdleTimeoutNotification(self, dry_run=False):
+        msg = await self.dispatcher.timeout_queue.get()
+        if dry_run:
+            print("P4 Runtime PacketIn: ", msg)
+        else:
+            return msg
+
+class AsyncGrpcRequestLogger(grpc.aio.UnaryUnaryClientInterceptor,
+                             grpc.aio.UnaryStreamClientInterceptor):
+    """Adapts a switch.GrpcRequestLogger or request_log.BinaryRequestLogger
+    to grpc.aio channels"""
+
+    def __init__(self, logger):
+        self.logger = logger
+
+    def _log(self, client_call_details, request):
+        # Unlike grpc, grpc.aio passes the method name as bytes
+        method = client_call_details.method
+        if isinstance(method, bytes):
+            method = method.decode('utf-8')
+        self.logger.log_message(method, request)
+
+    async def intercept_unary_unary(self, continuation, client_call_details, request):
+        self._log(client_call_details, request)
+        return await continuation(client_call_details, request)
+
+    async def intercept_unary_stream(self, continuation, client_call_details, request):
+        self._log(client_call_details, request)
+        return await continuation(client_call_details, request)
+
+class AsyncIterableQueue(asyncio.Queue):
+    _sentinel = object()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self.get()
+        if item is self._sentinel:
+            raise StopAsyncIteration
+        return item
+
+    def close(self):
+        self.put_nowait(self._sentinel)
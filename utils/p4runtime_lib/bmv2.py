@@ -13,18 +13,42 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-from p4.tmp import p4config_pb2
+import os
+import threading
 
+from .lazy import lazyImport
 from .switch import SwitchConnection
 
+p4config_pb2 = lazyImport('p4.tmp.p4config_pb2')
+
+
+# Device configs already built, keyed by the absolute path of the BMv2 JSON
+# file. Each value is ((mtime_ns, size), device_config).
+_device_config_cache = {}
+_device_config_lock = threading.Lock()
+
 
 def buildDeviceConfig(bmv2_json_file_path=None):
-    "Builds the device config for BMv2"
-    device_config = p4config_pb2.P4DeviceConfig()
-    device_config.reassign = True
-    with open(bmv2_json_file_path) as f:
-        device_config.device_data = f.read().encode('utf-8')
-    return device_config
+    """Builds the device config for BMv2
+
+    The result is memoized by file path, modification time and size, so all
+    switches running the same program share one P4DeviceConfig message. The
+    returned message must not be modified.
+    """
+    path = os.path.abspath(bmv2_json_file_path)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _device_config_lock:
+        cached = _device_config_cache.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        device_config = p4config_pb2.P4DeviceConfig()
+        device_config.reassign = True
+        # The JSON is handed to the switch verbatim, no need to decode it
+        with open(path, 'rb') as f:
+            device_config.device_data = f.read()
+        _device_config_cache[path] = (version, device_config)
+        return device_config
 
 
 class Bmv2SwitchConnection(SwitchConnection):
@@ -0,0 +1,281 @@
+# SPDX-License-Identifier: Apache-2.0
+'''
+Vectorized counterparts of the convert module, built on NumPy.
+
+Each encode*Array function takes a whole column of values (address strings,
+integers...) and returns a (N, width) uint8 array holding the big-endian
+encoding of each value, computed in a few array operations instead of one
+Python call per value. IPv4 addresses are handled as uint32 arrays and IPv6
+addresses as (N, 2) big-endian uint64 arrays (high, low), so synthetic
+address plans can be generated with array arithmetic:
+
+    dst = ipv4Range("10.0.0.0", 100000)
+    build = p4info_helper.compile_entry("MyIngress.ipv4_lpm", "MyIngress.ipv4_forward")
+    entries = build.encodeColumns(
+        lpmColumn(encodeIPv4Array(dst), 32),
+        toBytesList(encodeMacArray(["08:00:00:00:01:11"] * 100000)),
+        toBytesList(encodeIntArray(np.arange(100000) % 4 + 1, 9)))
+
+encodedColumn() picks the right encoder from a bitwidth and kind, like
+convert.encoderFor. encodeTableEntryArray() goes one step further and
+serializes all entries at once when every value has a fixed width.
+'''
+import ipaddress
+import socket
+
+import numpy as np
+
+from p4.v1 import p4runtime_pb2
+
+from .convert import KIND_BY_BITWIDTH, bitwidthToBytes
+from .wire import encodeLengthDelimited, encodeUpdate, fieldNumber
+
+
+def toBytesList(array):
+    """Splits a (N, width) uint8 array into a list of N byte strings"""
+    width = array.shape[1]
+    data = np.ascontiguousarray(array).tobytes()
+    return [data[i:i + width] for i in range(0, len(data), width)]
+
+
+_POWERS_OF_TEN = 10.0 ** np.arange(20)
+
+
+def _parseDottedDecimals(items, count, max_digits, what):
+    """Parses strings of `count` dot separated decimal numbers of 1 to
+    max_digits digits each into an (N, count) int64 array"""
+    try:
+        chars = np.frombuffer(','.join(items).encode('ascii'), dtype=np.uint8)
+    except UnicodeEncodeError:
+        raise ValueError("Malformed %s in input" % what)
+    is_dot = chars == ord('.')
+    is_separator = is_dot | (chars == ord(','))
+    # Checked per item: '1.2.3.4.5' followed by '6.7.8' has the right total
+    # number of octets
+    separator_positions = np.flatnonzero(is_separator)
+    separator_is_dot = is_dot[separator_positions]
+    dots_per_item = np.bincount(np.cumsum(~separator_is_dot, dtype=np.int32)[separator_is_dot],
+                                minlength=len(items))
+    if len(separator_positions) != count * len(items) - 1 or (dots_per_item != count - 1).any():
+        raise ValueError("Malformed %s in input" % what)
+    is_digit = ~is_separator
+    digits = chars[is_digit] - np.uint8(ord('0'))
+    if (digits > 9).any():
+        raise ValueError("Malformed %s in input" % what)
+    # Number each digit belongs to, and position of the end of each number
+    numbers = np.cumsum(is_separator, dtype=np.int32)[is_digit]
+    ends = np.append(separator_positions, len(chars))
+    lengths = np.bincount(numbers, minlength=len(ends))
+    if lengths.min() < 1 or lengths.max() > max_digits:
+        raise ValueError("Malformed %s in input" % what)
+    powers = ends[numbers] - np.flatnonzero(is_digit) - 1
+    values = np.bincount(numbers, weights=digits * _POWERS_OF_TEN[powers], minlength=len(ends))
+    return values.astype(np.int64).reshape(-1, count)
+
+
+def ipv4ToArray(addresses):
+    """Parses dotted IPv4 strings into a uint32 array"""
+    addresses = list(addresses)
+    if not addresses:
+        return np.zeros(0, dtype=np.uint32)
+    octets = _parseDottedDecimals(addresses, 4, 3, "IPv4 address")
+    if ((octets < 0) | (octets > 255)).any():
+        raise ValueError("IPv4 address octet out of range")
+    return (octets << np.array([24, 16, 8, 0])).sum(axis=1).astype(np.uint32)
+
+
+def ipv4Range(start, count, step=1):
+    """Returns `count` IPv4 addresses from `start` (string or int) as uint32"""
+    if isinstance(start, str):
+        start = int(ipaddress.IPv4Address(start))
+    addresses = start + np.arange(count, dtype=np.uint64) * step
+    if count and addresses[-1] > 0xffffffff:
+        raise ValueError("IPv4 range runs past 255.255.255.255")
+    return addresses.astype(np.uint32)
+
+
+def encodeIPv4Array(addresses):
+    """Encodes IPv4 addresses (strings or a uint32 array) as (N, 4) bytes"""
+    if not isinstance(addresses, np.ndarray):
+        addresses = ipv4ToArray(addresses)
+    return addresses.astype('>u4').view(np.uint8).reshape(-1, 4)
+
+
+def maskIPv4(addresses, prefix_lens):
+    """Clears the host bits of uint32 addresses for the given prefix lengths"""
+    prefix_lens = np.asarray(prefix_lens, dtype=np.uint64)
+    masks = (np.uint64(0xffffffff) << (np.uint64(32) - prefix_lens)) & np.uint64(0xffffffff)
+    return (addresses.astype(np.uint64) & masks).astype(np.uint32)
+
+
+def ipv6ToArray(addresses):
+    """Parses IPv6 strings into a (N, 2) big-endian uint64 array (high, low)"""
+    data = b''.join(socket.inet_pton(socket.AF_INET6, a) for a in addresses)
+    return np.frombuffer(data, dtype='>u8').reshape(-1, 2)
+
+
+def ipv6Range(start, count, step=1):
+    """Returns `count` IPv6 addresses from `start` as a (N, 2) uint64 array"""
+    start = int(ipaddress.IPv6Address(start))
+    high = np.full(count, start >> 64, dtype=np.uint64)
+    low = np.full(count, start & 0xffffffffffffffff, dtype=np.uint64)
+    offsets = np.arange(count, dtype=np.uint64) * np.uint64(step)
+    new_low = low + offsets
+    # Carry into the high half where the low half wrapped around
+    high += (new_low < low).astype(np.uint64)
+    return np.stack([high, new_low], axis=1).astype('>u8')
+
+
+def encodeIPv6Array(addresses):
+    """Encodes IPv6 addresses (strings or a (N, 2) uint64 array) as (N, 16) bytes"""
+    if not isinstance(addresses, np.ndarray):
+        addresses = ipv6ToArray(addresses)
+    return np.ascontiguousarray(addresses.astype('>u8')).view(np.uint8).reshape(-1, 16)
+
+
+def maskIPv6(addresses, prefix_lens):
+    """Clears the host bits of (N, 2) uint64 addresses for the given prefix lengths"""
+    prefix_lens = np.asarray(prefix_lens, dtype=np.int64)
+    ones = np.uint64(0xffffffffffffffff)
+
+    def halfMask(bits):
+        bits = np.clip(bits, 0, 64).astype(np.uint64)
+        # Shifting a uint64 by 64 is undefined, hence the where
+        return np.where(bits == 0, np.uint64(0), ones << (np.uint64(64) - bits))
+
+    masks = np.stack([halfMask(prefix_lens), halfMask(prefix_lens - 64)], axis=1)
+    return addresses.astype(np.uint64) & masks
+
+
+_MAC_COLON_COLUMNS = [2, 5, 8, 11, 14]
+_MAC_HEX_COLUMNS = [i for i in range(17) if i not in _MAC_COLON_COLUMNS]
+
+
+def encodeMacArray(macs):
+    """Encodes 'aa:bb:cc:dd:ee:ff' strings as (N, 6) bytes"""
+    macs = list(macs)
+    if any(len(mac) != 17 for mac in macs):
+        raise ValueError("Malformed MAC address in input")
+    if not macs:
+        return np.zeros((0, 6), dtype=np.uint8)
+    try:
+        chars = np.array(macs, dtype='S17').view(np.uint8).reshape(-1, 17)
+    except UnicodeEncodeError:
+        raise ValueError("Malformed MAC address in input")
+    # A misplaced colon would shift the bytes of every following address
+    if (chars[:, _MAC_COLON_COLUMNS] != ord(':')).any():
+        raise ValueError("Malformed MAC address in input")
+    digits = np.ascontiguousarray(chars[:, _MAC_HEX_COLUMNS]).tobytes().decode('ascii')
+    data = bytes.fromhex(digits)
+    # fromhex skips whitespace
+    if len(data) != 6 * len(macs):
+        raise ValueError("Malformed MAC address in input")
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, 6)
+
+
+def encodeIntArray(values, bitwidth):
+    """Encodes non-negative integers of up to 64 bits as (N, bytes) arrays"""
+    if bitwidth > 64:
+        raise ValueError("Bulk encoding of %d bit integers is not supported" % bitwidth)
+    values = np.asarray(values)
+    if values.size and (values.min() < 0 or int(values.max()) >= 1 << bitwidth):
+        raise ValueError("Value does not fit in %d bits" % bitwidth)
+    byte_len = bitwidthToBytes(bitwidth)
+    return values.astype('>u8').view(np.uint8).reshape(-1, 8)[:, 8 - byte_len:]
+
+
+def encodedColumn(values, bitwidth, kind=None):
+    """Encodes a column of values as a list of byte strings.
+
+    kind is 'mac', 'ipv4', 'ipv6' or 'int' (see convert.encoderFor). Without
+    a kind, integer arrays are encoded as numbers and anything else as the
+    address kind implied by the bitwidth.
+    """
+    if kind is None:
+        if isinstance(values, np.ndarray) and values.dtype.kind in 'iu' and values.ndim == 1:
+            # Includes uint32 IPv4 arrays, whose encoding is the same
+            kind = 'int'
+        else:
+            kind = KIND_BY_BITWIDTH.get(bitwidth, 'int')
+    if kind == 'int':
+        return toBytesList(encodeIntArray(values, bitwidth))
+    expected = {'mac': 48, 'ipv4': 32, 'ipv6': 128}.get(kind)
+    if expected is None:
+        raise ValueError("Unknown kind %r" % kind)
+    if expected != bitwidth:
+        raise ValueError("%s values do not fit in %d bits" % (kind, bitwidth))
+    if kind == 'mac':
+        return toBytesList(encodeMacArray(values))
+    if kind == 'ipv4':
+        return toBytesList(encodeIPv4Array(values))
+    return toBytesList(encodeIPv6Array(values))
+
+
+def lpmColumn(encoded, prefix_lens):
+    """Pairs encoded values with prefix lengths (an int or a sequence) for
+    an LPM column of CompiledTableEntry.encodeColumns"""
+    if not isinstance(encoded, list):
+        encoded = toBytesList(encoded)
+    if isinstance(prefix_lens, int):
+        return [(value, prefix_lens) for value in encoded]
+    return list(zip(encoded, np.asarray(prefix_lens).tolist()))
+
+
+def encodeTableEntryArray(builder, *columns, update_type=None):
+    """Serializes the entries of a CompiledTableEntry in one vectorized pass.
+
+    Columns are given as for builder.encodeColumns, but as (N, width) uint8
+    arrays (e.g. from encodeIPv4Array): LPM columns are (array, prefix_len)
+    with one prefix length for all rows, ternary and range columns are
+    (array, array) pairs. Returns a (N, length) uint8 array with one
+    serialized TableEntry per row, or one serialized Update when update_type
+    is given (see wire.encodeUpdate). toBytesList() splits it into entries.
+
+    All entries have the same layout, so a template is serialized once and
+    the value bytes are copied in at the positions where a template with
+    all-zero values differs from one with all-0xff values.
+    """
+    builder._checkArity(columns)
+    arrays = []
+    low = []
+    high = []
+
+    def placeholders(array):
+        arrays.append(array)
+        return bytes(array.shape[1]), b'\xff' * array.shape[1]
+
+    for (_, kind, _), column in zip(builder.match_fields, columns):
+        if kind == 'exact':
+            zeros, ones = placeholders(column)
+        elif kind == 'lpm':
+            values, prefix_len = column
+            zeros, ones = placeholders(values)
+            zeros, ones = (zeros, prefix_len), (ones, prefix_len)
+        else:
+            first_zeros, first_ones = placeholders(column[0])
+            second_zeros, second_ones = placeholders(column[1])
+            zeros, ones = (first_zeros, second_zeros), (first_ones, second_ones)
+        low.append(zeros)
+        high.append(ones)
+    for column in columns[builder.num_match_fields:]:
+        zeros, ones = placeholders(column)
+        low.append(zeros)
+        high.append(ones)
+
+    low = builder.encodeRow(low)
+    high = builder.encodeRow(high)
+    if update_type is not None:
+        table_entry_field = fieldNumber(p4runtime_pb2.Entity, 'table_entry')
+        low = encodeUpdate(update_type, encodeLengthDelimited(table_entry_field, low))
+        high = encodeUpdate(update_type, encodeLengthDelimited(table_entry_field, high))
+    low = np.frombuffer(low, dtype=np.uint8)
+    high = np.frombuffer(high, dtype=np.uint8)
+    positions = np.nonzero(low != high)[0]
+    values = np.concatenate(arrays, axis=1) if arrays else np.zeros((0, 0), dtype=np.uint8)
+    if values.shape[1] != len(positions):
+        raise ValueError("Cannot locate the values in the serialized entry")
+
+    out = np.empty((values.shape[0], len(low)), dtype=np.uint8)
+    out[:] = low
+    out[:, positions] = values
+    return out
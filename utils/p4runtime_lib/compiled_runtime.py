@@ -0,0 +1,221 @@
+# SPDX-License-Identifier: Apache-2.0
+'''
+Precompiled runtime configurations.
+
+program_switch resolves every name of a runtime JSON file against the
+p4info and builds every entry each time a switch is programmed.
+compileRuntimeConfig() does that once, offline, and stores the batches of
+updates ready to be sent in a binary file next to the JSON file:
+
+    python3 -m p4runtime_lib.compiled_runtime s1-runtime.json    # writes s1-runtime.pb
+
+replayRuntimeConfig() programs a switch from that file, prepending only
+the device and election ids to each stored batch (see
+SwitchConnection.WriteEncodedRequests). The file records the sha256 of the
+p4info it was compiled against and of the runtime JSON file; when either
+changed, replayRuntimeConfig returns False without connecting, and the
+JSON file should be used instead.
+
+File layout: RUNTIME_PB_MAGIC, the length (big-endian uint32) and JSON text
+of a header holding the switch settings and the hashes, then one record
+per batch: the entry kind (index in ENTRY_KEYS, uint8), the number of
+updates and the length of the WriteRequest updates field (big-endian
+uint32), followed by that field.
+'''
+import argparse
+import hashlib
+import json
+import os
+import struct
+from itertools import groupby
+
+from . import helper
+from .error_utils import printBatchErrors
+from .json_stream import iterJsonMembers
+from .lazy import lazyImport
+from .simple_controller import (ENTRY_KEYS, ConfException, TableEntryCompiler,
+                                check_switch_conf, connect_switch, encodedEntryUpdates,
+                                error, info)
+
+wire = lazyImport('.wire', __package__)
+
+RUNTIME_PB_MAGIC = b'P4RTPB01'
+RUNTIME_PB_BATCH_SIZE = 500
+
+_LENGTH = struct.Struct('>I')
+_RECORD = struct.Struct('>BII')
+
+
+def compiledRuntimePath(runtime_json):
+    """Path of the compiled form of a runtime JSON file"""
+    return os.path.splitext(runtime_json)[0] + '.pb'
+
+
+def p4infoDigest(p4info):
+    return hashlib.sha256(p4info.SerializeToString(deterministic=True)).hexdigest()
+
+
+def fileDigest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _entryDescription(key, index, entry):
+    if key == 'table_entries' and isinstance(entry, dict) and 'table' in entry:
+        return "%s[%d] (%s)" % (key, index, entry['table'])
+    return "%s[%d]" % (key, index)
+
+
+def compileRuntimeConfig(runtime_json, workdir=None, out_path=None,
+                         batch_size=RUNTIME_PB_BATCH_SIZE):
+    """Compiles a runtime JSON file, whose paths are relative to workdir
+    (default: the current directory, as for run_exercise), into out_path
+    (default: compiledRuntimePath). Returns the number of updates written.
+    An entry that cannot be encoded raises a ConfException naming it."""
+    if workdir is None:
+        workdir = os.getcwd()
+    if out_path is None:
+        out_path = compiledRuntimePath(runtime_json)
+
+    # The settings may come after the entry lists, which are skipped here
+    with open(runtime_json, 'r') as f:
+        sw_conf = {key: value for key, value in iterJsonMembers(f, stream_keys=ENTRY_KEYS)
+                   if key not in ENTRY_KEYS}
+    check_switch_conf(sw_conf=sw_conf, workdir=workdir)
+    p4info_helper = helper.P4InfoHelper(os.path.join(workdir, sw_conf['p4info']))
+    entry_compiler = TableEntryCompiler(p4info_helper, runtime_json)
+
+    header = {key: sw_conf[key] for key in ('target', 'p4info', 'bmv2_json') if key in sw_conf}
+    header['p4info_sha256'] = p4infoDigest(p4info_helper.p4info)
+    header['runtime_json_sha256'] = fileDigest(runtime_json)
+    header = json.dumps(header).encode('utf-8')
+
+    count = 0
+    # Write to a temporary file first, so a runner never replays a partial file
+    tmp_path = '%s.%d.tmp' % (out_path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as out, open(runtime_json, 'r') as f:
+            out.write(RUNTIME_PB_MAGIC + _LENGTH.pack(len(header)) + header)
+
+            def writeBatch(kind, batch):
+                encoded = wire.encodeWriteRequestUpdates(batch)
+                out.write(_RECORD.pack(kind, len(batch), len(encoded)) + encoded)
+
+            for key, entries in iterJsonMembers(f, stream_keys=ENTRY_KEYS):
+                if key not in ENTRY_KEYS:
+                    continue
+                kind = ENTRY_KEYS.index(key)
+                batch = []
+                for index, entry in enumerate(entries):
+                    try:
+                        encoded_update, = encodedEntryUpdates(key, [entry], p4info_helper,
+                                                              entry_compiler)
+                    except Exception as e:
+                        # Some encoding errors (e.g. assertions) have no message
+                        raise ConfException("%s: %s" % (_entryDescription(key, index, entry),
+                                                        str(e) or type(e).__name__)) from e
+                    batch.append(encoded_update)
+                    if len(batch) == batch_size:
+                        writeBatch(kind, batch)
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    writeBatch(kind, batch)
+                    count += len(batch)
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return count
+
+
+def _readRecords(f):
+    """Yields the (kind, number of updates, updates field) of each batch"""
+    while True:
+        record = f.read(_RECORD.size)
+        if not record:
+            return
+        if len(record) < _RECORD.size:
+            raise ValueError("Truncated compiled runtime configuration %s" % f.name)
+        kind, count, length = _RECORD.unpack(record)
+        encoded = f.read(length)
+        if len(encoded) < length:
+            raise ValueError("Truncated compiled runtime configuration %s" % f.name)
+        yield kind, count, encoded
+
+
+def replayRuntimeConfig(addr, device_id, pb_path, workdir, proto_dump_fpath, runtime_json=None):
+    """Programs a switch from a compiled runtime configuration. Returns
+    False, without connecting to the switch, when the file was compiled
+    against another p4info or (if given) another version of runtime_json."""
+    with open(pb_path, 'rb') as f:
+        magic = f.read(len(RUNTIME_PB_MAGIC))
+        if magic != RUNTIME_PB_MAGIC:
+            raise ValueError("%s is not a compiled runtime configuration" % pb_path)
+        header_len, = _LENGTH.unpack(f.read(_LENGTH.size))
+        sw_conf = json.loads(f.read(header_len).decode('utf-8'))
+
+        p4info_helper = helper.P4InfoHelper(os.path.join(workdir, sw_conf['p4info']))
+        if p4infoDigest(p4info_helper.p4info) != sw_conf['p4info_sha256']:
+            info("%s was compiled for another P4Info" % pb_path)
+            return False
+        if runtime_json is not None and fileDigest(runtime_json) != sw_conf['runtime_json_sha256']:
+            info("%s was compiled from another version of %s" % (pb_path, runtime_json))
+            return False
+
+        p4info_helper, sw = connect_switch(addr, device_id, sw_conf, workdir, proto_dump_fpath,
+                                           p4info_helper=p4info_helper)
+        try:
+            for kind, records in groupby(_readRecords(f), key=lambda record: record[0]):
+                name = ENTRY_KEYS[kind].split('_')[0]
+                counts = []
+
+                def batches():
+                    for _, count, encoded in records:
+                        counts.append(count)
+                        yield count, encoded
+
+                failures = sw.WriteEncodedRequests(batches())
+                total = sum(counts)
+                info("Inserted %d precompiled %s entries" % (total - len(failures), name))
+                if failures:
+                    error("%d of %d %s entries could not be written" % (
+                        len(failures), total, name))
+                    printBatchErrors(failures)
+        finally:
+            sw.shutdown()
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compile runtime JSON files into ready-to-send P4Runtime write batches')
+    parser.add_argument('runtime_json', nargs='+',
+                        help='runtime configuration files (JSON)')
+    parser.add_argument('-w', '--workdir',
+                        help='directory the paths in the files are relative to '
+                             '(default: the current directory)',
+                        type=str, action="store", default=None)
+    parser.add_argument('-o', '--output',
+                        help='output file, when compiling a single file (default: the JSON '
+                             'file path with a .pb extension)',
+                        type=str, action="store", default=None)
+    args = parser.parse_args()
+    if args.output and len(args.runtime_json) > 1:
+        parser.error("--output requires a single runtime JSON file")
+
+    for runtime_json in args.runtime_json:
+        out_path = args.output or compiledRuntimePath(runtime_json)
+        try:
+            count = compileRuntimeConfig(runtime_json, workdir=args.workdir, out_path=out_path)
+        except ConfException as e:
+            error("While parsing %s: %s" % (runtime_json, e))
+            continue
+        info("Compiled %d updates from %s into %s" % (count, runtime_json, out_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import functools
 import math
 import re
 import socket
@@ -64,27 +65,131 @@ def encodeNum(number, bitwidth):
     byte_len = bitwidthToBytes(bitwidth)
     # If number is negative, calculate the positive number that its
     # 2's complement encoding would look like in 'bitwidth' bits.
-    orig_number = number
     if number < 0:
         if number < -(2 ** (bitwidth-1)):
             raise Exception("Negative number, %d, has 2's complement representation that does not fit in %d bits" % (number, bitwidth))
         number = (2 ** bitwidth) + number
-    num_str = '%x' % number
-    if orig_number < 0:
-        print("CONVERT_NEGATIVE_NUMBER debug: orig_number=%s number=%s bitwidth=%d num_str='%s'"
-              "" % (orig_number, number, bitwidth, num_str))
     if number >= 2 ** bitwidth:
         raise Exception("Number, %d, does not fit in %d bits" % (number, bitwidth))
-    return bytes.fromhex('0' * (byte_len * 2 - len(num_str)) + num_str)
+    return number.to_bytes(byte_len, 'big')
 
 def decodeNum(encoded_number):
     return int(encoded_number.hex(), 16)
 
+# Number of distinct addresses remembered by each typed address encoder
+ADDRESS_CACHE_SIZE = 4096
+
+# Kinds of values accepted by encoderFor
+KINDS = ('mac', 'ipv4', 'ipv6', 'int', 'bytes')
+
+# Kind assumed for string values of fields of these widths
+KIND_BY_BITWIDTH = {48: 'mac', 32: 'ipv4', 128: 'ipv6'}
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _encodeMacStrict(mac_addr_string):
+    if not matchesMac(mac_addr_string):
+        raise ValueError("%r is not a MAC address" % mac_addr_string)
+    return encodeMac(mac_addr_string)
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _encodeIPv4Strict(ip_addr_string):
+    # Unlike inet_aton, inet_pton rejects shorthands such as '10.1'
+    return socket.inet_pton(socket.AF_INET, ip_addr_string)
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _encodeIPv6Strict(ip_addr_string):
+    return socket.inet_pton(socket.AF_INET6, ip_addr_string)
+
+_ADDRESS_ENCODERS = {
+    'mac': (48, _encodeMacStrict),
+    'ipv4': (32, _encodeIPv4Strict),
+    'ipv6': (128, _encodeIPv6Strict),
+}
+
+def _intEncoder(bitwidth):
+    byte_len = bitwidthToBytes(bitwidth)
+    limit = 1 << bitwidth
+    def encodeInt(number):
+        if 0 <= number < limit:
+            return number.to_bytes(byte_len, 'big')
+        # Negative or too large: 2's complement or error, as encodeNum does
+        return encodeNum(number, bitwidth)
+    return encodeInt
+
+@functools.lru_cache(maxsize=None)
+def encoderFor(bitwidth, kind=None):
+    """Returns a function encoding values for a field of `bitwidth` bits.
+
+    kind is one of KINDS. The encoder of a 'mac', 'ipv4' or 'ipv6' field
+    takes address strings, an 'int' encoder takes integers and a 'bytes'
+    encoder takes values already encoded. Without a kind, integers are
+    encoded as numbers and strings as the address kind matching the
+    bitwidth (see KIND_BY_BITWIDTH), falling back to the type sniffing of
+    encode() for anything else; like encode(), such an encoder takes [x]
+    for x.
+    """
+    byte_len = bitwidthToBytes(bitwidth)
+    if kind in _ADDRESS_ENCODERS:
+        address_bitwidth, encodeAddress = _ADDRESS_ENCODERS[kind]
+        if bitwidth != address_bitwidth:
+            raise ValueError("%s values do not fit in %d bits" % (kind, bitwidth))
+        return encodeAddress
+    if kind == 'int':
+        return _intEncoder(bitwidth)
+    if kind == 'bytes':
+        def encodeBytes(value):
+            if len(value) != byte_len:
+                raise ValueError("%r is not %d bytes long" % (value, byte_len))
+            return value
+        return encodeBytes
+    if kind is not None:
+        raise ValueError("Unknown kind %r, expected one of %s" % (kind, ', '.join(KINDS)))
+
+    encodeInt = _intEncoder(bitwidth)
+    encodeAddress = _ADDRESS_ENCODERS.get(KIND_BY_BITWIDTH.get(bitwidth), (None, None))[1]
+    def encodeValue(x):
+        if type(x) == int:
+            return encodeInt(x)
+        if encodeAddress is not None and type(x) == str:
+            try:
+                return encodeAddress(x)
+            except (ValueError, OSError):
+                pass
+        elif (type(x) == list or type(x) == tuple) and len(x) == 1:
+            return encodeValue(x[0])
+        return _sniffEncode(x, bitwidth)
+    return encodeValue
+
+@functools.lru_cache(maxsize=None)
+def decoderFor(bitwidth, kind=None):
+    """Returns a function decoding values of a field of `bitwidth` bits into
+    the form taken by encoderFor(bitwidth, kind). Without a kind, 48, 32 and
+    128 bit values are decoded as addresses and others as integers.
+
+    Switches may return values without their leading zero bytes, so values
+    are padded back to the field width first.
+    """
+    byte_len = bitwidthToBytes(bitwidth)
+    if kind is None:
+        kind = KIND_BY_BITWIDTH.get(bitwidth, 'int')
+    if kind == 'int':
+        return lambda value: int.from_bytes(value, 'big')
+    if kind == 'bytes':
+        return lambda value: value.rjust(byte_len, b'\x00')
+    if kind == 'mac':
+        return lambda value: value.rjust(byte_len, b'\x00').hex(':')
+    if kind == 'ipv4':
+        return lambda value: socket.inet_ntoa(value.rjust(byte_len, b'\x00'))
+    if kind == 'ipv6':
+        return lambda value: socket.inet_ntop(socket.AF_INET6, value.rjust(byte_len, b'\x00'))
+    raise ValueError("Unknown kind %r, expected one of %s" % (kind, ', '.join(KINDS)))
+
 def encode(x, bitwidth):
     'Tries to infer the type of `x` and encode it'
+    return encoderFor(bitwidth)(x)
+
+def _sniffEncode(x, bitwidth):
     byte_len = bitwidthToBytes(bitwidth)
-    if (type(x) == list or type(x) == tuple) and len(x) == 1:
-        x = x[0]
     encoded_bytes = None
     if type(x) == str:
         if matchesMac(x):
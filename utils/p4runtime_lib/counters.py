@@ -0,0 +1,237 @@
+# SPDX-License-Identifier: Apache-2.0
+'''
+Counter values as NumPy arrays.
+
+An indexed counter is read in a single wildcard request (a CounterEntry
+with no index) and its cells are returned as arrays indexed by counter
+index, instead of one ReadCounters call per index:
+
+    counts = sw.ReadCounterArray(p4info_helper.get_counters_id("MyIngress.ingressTunnelCounter"))
+    counts.packets[100], counts.bytes[100]
+
+CounterPoller samples such counters in the background and keeps their
+recent history, from which deltas and packet/bit rates are computed.
+
+Requires NumPy.
+'''
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# uint64 arrays of the packet and byte counts of each counter index
+CounterArrays = namedtuple('CounterArrays', ['packets', 'bytes'])
+
+
+def buildCounterArrays(counter_entries, size=None):
+    """Returns the CounterArrays of p4runtime_pb2.CounterEntry messages.
+
+    size defaults to the highest index read plus one; cells that were not
+    read are zero.
+    """
+    cells = [(counter_entry.index.index, counter_entry.data.packet_count,
+              counter_entry.data.byte_count) for counter_entry in counter_entries]
+    cells = np.array(cells, dtype=np.uint64).reshape(-1, 3)
+    indices = cells[:, 0].astype(np.int64)
+    if size is None:
+        size = int(indices.max()) + 1 if len(indices) else 0
+    elif len(indices) and indices.max() >= size:
+        raise ValueError("Counter index %d out of range for %d cells" % (indices.max(), size))
+    counts = CounterArrays(np.zeros(size, dtype=np.uint64), np.zeros(size, dtype=np.uint64))
+    counts.packets[indices] = cells[:, 1]
+    counts.bytes[indices] = cells[:, 2]
+    return counts
+
+
+def counterEntries(responses, counter_id=None):
+    """Yields the CounterEntries of ReadResponses, only those of counter_id
+    when given"""
+    for response in responses:
+        for entity in response.entities:
+            if entity.WhichOneof('entity') != 'counter_entry':
+                continue
+            if counter_id is None or entity.counter_entry.counter_id == counter_id:
+                yield entity.counter_entry
+
+
+class CounterHistory(object):
+    """Ring buffer of the last `length` samples of some cells of a counter"""
+
+    def __init__(self, length, num_cells):
+        self.length = length
+        self.timestamps = np.zeros(length, dtype=np.float64)
+        self.packets = np.zeros((length, num_cells), dtype=np.uint64)
+        self.bytes = np.zeros((length, num_cells), dtype=np.uint64)
+        # Number of samples appended so far
+        self.count = 0
+
+    def append(self, timestamp, packets, byte_counts):
+        slot = self.count % self.length
+        self.timestamps[slot] = timestamp
+        self.packets[slot] = packets
+        self.bytes[slot] = byte_counts
+        self.count += 1
+
+    def ordered(self):
+        """Returns copies of (timestamps, packets, bytes), oldest sample first"""
+        if self.count <= self.length:
+            n = self.count
+            return self.timestamps[:n].copy(), self.packets[:n].copy(), self.bytes[:n].copy()
+        order = np.roll(np.arange(self.length), -(self.count % self.length))
+        return self.timestamps[order], self.packets[order], self.bytes[order]
+
+
+def _counterDeltas(values):
+    """Differences between consecutive samples; a value lower than the
+    previous one means the counter was reset, and counts from zero"""
+    previous = values[:-1]
+    current = values[1:]
+    return np.where(current >= previous, current - previous, current)
+
+
+class CounterPoller(object):
+    """Samples indexed counters of several switches from a background thread.
+
+    Every counter watched is read with one ReadCounterArray per interval,
+    all reads of a tick being issued concurrently, so the cost of a tick
+    does not depend on the number of indices in use. Ticks are scheduled at
+    fixed times from the start; a tick that overruns the next one skips it
+    (counted in `missed`) rather than drifting. Rates are computed from the
+    time each sample was taken, not from the nominal interval; sample
+    timestamps are time.monotonic() values, not wall-clock time.
+
+        poller = CounterPoller(interval=1.0, history=300)
+        poller.watch(('s1', 'ingress'), sw, counter_id, size=65536, indices=[100, 200])
+        poller.start()
+        pps, bps = poller.rates(('s1', 'ingress'), 100)
+        poller.stop()
+
+    Only the cells listed in `indices` are kept (all cells by default), in
+    ring buffers of the last `history` samples. Queries return copies and
+    can be made from any thread.
+    """
+
+    def __init__(self, interval=1.0, history=300):
+        self.interval = interval
+        self.history_length = history
+        # key -> (connection, counter_id, size, indices)
+        self.watches = {}
+        self.histories = {}
+        # key -> {counter index: column in its history}
+        self.columns = {}
+        # key -> exception raised by the last read, None once it succeeds
+        self.errors = {}
+        self.missed = 0
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pool = None
+
+    def watch(self, key, connection, counter_id, size, indices=None):
+        """Samples counter_id (of `size` cells) on connection under `key`,
+        keeping the cells in `indices` only if given"""
+        if self._thread is not None:
+            raise RuntimeError("Counters must be watched before the poller starts")
+        indices = np.arange(size) if indices is None else np.asarray(sorted(indices))
+        self.watches[key] = (connection, counter_id, size, indices)
+        self.histories[key] = CounterHistory(self.history_length, len(indices))
+        self.columns[key] = {int(index): column for column, index in enumerate(indices)}
+
+    def start(self):
+        self._stop.clear()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(self.watches)))
+        self._thread = threading.Thread(target=self._run, name='CounterPoller', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            self.sample()
+            next_tick += self.interval
+            now = time.monotonic()
+            if now > next_tick:
+                skipped = int((now - next_tick) // self.interval) + 1
+                self.missed += skipped
+                next_tick += skipped * self.interval
+            self._stop.wait(next_tick - now)
+
+    def _read(self, key):
+        connection, counter_id, size, indices = self.watches[key]
+        start = time.monotonic()
+        counts = connection.ReadCounterArray(counter_id, size)
+        # The sample is dated halfway through the RPC, on the monotonic clock
+        # so that rates are not skewed by changes of the system time
+        return (start + time.monotonic()) / 2, counts.packets[indices], counts.bytes[indices]
+
+    def _tryRead(self, key):
+        try:
+            return self._read(key)
+        except Exception as e:
+            return e
+
+    def sample(self):
+        """Reads every watched counter once, concurrently once started"""
+        if self._pool is None:
+            results = {key: self._tryRead(key) for key in self.watches}
+        else:
+            futures = {key: self._pool.submit(self._tryRead, key) for key in self.watches}
+            results = {key: future.result() for key, future in futures.items()}
+        with self.lock:
+            for key, result in results.items():
+                if isinstance(result, Exception):
+                    self.errors[key] = result
+                    continue
+                self.errors[key] = None
+                self.histories[key].append(*result)
+
+    def _select(self, key, index, values):
+        if index is None:
+            return values
+        return values[..., self.columns[key][index]]
+
+    def history(self, key, index=None):
+        """Returns (timestamps, packets, bytes) of the samples kept, oldest
+        first. packets and bytes have one column per watched index, or are
+        1-D for a single counter index."""
+        with self.lock:
+            timestamps, packets, byte_counts = self.histories[key].ordered()
+        return timestamps, self._select(key, index, packets), self._select(key, index, byte_counts)
+
+    def latest(self, key, index=None):
+        """Returns (timestamp, packets, bytes) of the last sample, or None"""
+        with self.lock:
+            counter_history = self.histories[key]
+            if not counter_history.count:
+                return None
+            slot = (counter_history.count - 1) % counter_history.length
+            sample = (counter_history.timestamps[slot], counter_history.packets[slot].copy(),
+                      counter_history.bytes[slot].copy())
+        return sample[0], self._select(key, index, sample[1]), self._select(key, index, sample[2])
+
+    def deltas(self, key, index=None):
+        """Returns (durations, packets, bytes) of each interval between two
+        samples kept, oldest first"""
+        timestamps, packets, byte_counts = self.history(key, index)
+        return np.diff(timestamps), _counterDeltas(packets), _counterDeltas(byte_counts)
+
+    def rates(self, key, index=None, intervals=1):
+        """Returns (packets per second, bits per second) over the last
+        `intervals` intervals, or None before enough samples were taken"""
+        timestamps, packets, byte_counts = self.history(key, index)
+        if len(timestamps) <= intervals:
+            return None
+        duration = timestamps[-1] - timestamps[-1 - intervals]
+        packet_deltas = _counterDeltas(packets[-1 - intervals:]).sum(axis=0)
+        byte_deltas = _counterDeltas(byte_counts[-1 - intervals:]).sum(axis=0)
+        return packet_deltas / duration, byte_deltas * 8 / duration
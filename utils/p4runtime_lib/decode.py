@@ -0,0 +1,114 @@
+# SPDX-License-Identifier: Apache-2.0
+'''
+Decoding of table entries read back from a switch into readable records.
+
+TableEntryDecoder resolves every table, match field, action and param id
+of the p4info once, with a value decoder chosen from the field bitwidth
+(see convert.decoderFor), so decoding an entry is a handful of dict
+lookups:
+
+    decoder = TableEntryDecoder(p4info_helper)
+    for record in decoder.decodeResponses(sw.ReadTableEntries()):
+        print(formatRecord(record))
+
+decodeResponses is a generator: responses are only read from the stream as
+records are consumed. A 32 bit field is decoded as an IPv4 address, a 48 bit
+one as a MAC address and a 128 bit one as an IPv6 address unless another
+kind is given for its name in `kinds`.
+'''
+from collections import namedtuple
+
+from .convert import decoderFor
+
+# match and params map names to decoded values. LPM matches are decoded as
+# (value, prefix_len), ternary ones as (value, mask) and ranges as (low, high).
+TableEntryRecord = namedtuple('TableEntryRecord',
+                              ['table', 'match', 'action', 'params', 'priority',
+                               'is_default_action'])
+
+
+def _fieldDecoders(fields, kinds):
+    return {f.id: (f.name, decoderFor(f.bitwidth, kinds.get(f.name))) for f in fields}
+
+
+def _rawDecoder(field_id):
+    return (str(field_id), lambda value: value)
+
+
+class TableEntryDecoder(object):
+    """Decodes p4runtime_pb2.TableEntry messages of one p4info"""
+
+    def __init__(self, p4info_helper, kinds=None):
+        kinds = kinds or {}
+        # table id -> (name, {match field id: (name, decoder)})
+        self.tables = {t.preamble.id: (t.preamble.name, _fieldDecoders(t.match_fields, kinds))
+                       for t in p4info_helper.p4info.tables}
+        # action id -> (name, {param id: (name, decoder)})
+        self.actions = {a.preamble.id: (a.preamble.name, _fieldDecoders(a.params, kinds))
+                        for a in p4info_helper.p4info.actions}
+
+    def decode(self, table_entry):
+        """Returns the TableEntryRecord of a table entry. Unknown ids are kept
+        as numbers and their values as bytes."""
+        table_name, fields = self.tables.get(table_entry.table_id,
+                                             (str(table_entry.table_id), {}))
+        match = {}
+        for field_match in table_entry.match:
+            name, decodeValue = fields.get(field_match.field_id) or _rawDecoder(field_match.field_id)
+            kind = field_match.WhichOneof('field_match_type')
+            if kind == 'exact':
+                match[name] = decodeValue(field_match.exact.value)
+            elif kind == 'lpm':
+                match[name] = (decodeValue(field_match.lpm.value), field_match.lpm.prefix_len)
+            elif kind == 'ternary':
+                match[name] = (decodeValue(field_match.ternary.value),
+                               decodeValue(field_match.ternary.mask))
+            elif kind == 'range':
+                match[name] = (decodeValue(field_match.range.low),
+                               decodeValue(field_match.range.high))
+            elif kind == 'optional':
+                match[name] = decodeValue(field_match.optional.value)
+            else:
+                match[name] = field_match.SerializeToString()
+
+        action_name = None
+        params = {}
+        if table_entry.action.WhichOneof('type') == 'action':
+            action = table_entry.action.action
+            action_name, action_params = self.actions.get(action.action_id,
+                                                          (str(action.action_id), {}))
+            for param in action.params:
+                name, decodeValue = action_params.get(param.param_id) or _rawDecoder(param.param_id)
+                params[name] = decodeValue(param.value)
+        return TableEntryRecord(table_name, match, action_name, params,
+                                table_entry.priority, table_entry.is_default_action)
+
+    def decodeEntities(self, entities):
+        """Yields the records of the table entries among `entities`"""
+        for entity in entities:
+            if entity.WhichOneof('entity') == 'table_entry':
+                yield self.decode(entity.table_entry)
+
+    def decodeResponses(self, responses):
+        """Lazily yields the records of ReadResponses, e.g. from
+        SwitchConnection.ReadTableEntries()"""
+        for response in responses:
+            yield from self.decodeEntities(response.entities)
+
+
+def _formatValue(value):
+    if isinstance(value, tuple):
+        return '%s/%s' % value
+    return str(value)
+
+
+def formatRecord(record):
+    """One line summary of a TableEntryRecord"""
+    match = ' '.join('%s=%s' % (name, _formatValue(value))
+                     for name, value in record.match.items())
+    if record.is_default_action:
+        match = '(default)'
+    params = ', '.join('%s=%s' % (name, _formatValue(value))
+                       for name, value in record.params.items())
+    priority = ' priority %d' % record.priority if record.priority else ''
+    return '%s %s%s -> %s(%s)' % (record.table, match, priority, record.action, params)
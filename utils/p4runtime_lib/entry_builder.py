@@ -0,0 +1,216 @@
+# SPDX-License-Identifier: Apache-2.0
+'''
+Precompiled table entry builders.
+
+P4InfoHelper.buildTableEntry resolves the table, action, match field and
+param names and picks an encoder for every value of every entry. When many
+entries share the same (table, action) pair, that work can be done once:
+
+    build = p4info_helper.compile_entry("MyIngress.ipv4_lpm", "MyIngress.ipv4_forward")
+    table_entry = build(("10.0.1.1", 32), "08:00:00:00:01:11", 1)
+
+The builder takes the match values (in table order) followed by the action
+params (in action order), in the same formats as buildTableEntry. The order
+can be chosen with the match_fields and action_params arguments, and the
+kind of each value (see convert.encoderFor) declared with `kinds`:
+
+    build = p4info_helper.compile_entry("MyIngress.yequdesu_exact", "MyIngress.yequdesu_forward",
+                                        kinds={"hdr.yequdesu.dst_id": "int", "port": "int"})
+
+build.encode() returns the serialized TableEntry instead of a message, and
+build.encodeEntity() returns a serialized Entity for wire.encodeUpdate.
+'''
+from p4.config.v1 import p4info_pb2
+from p4.v1 import p4runtime_pb2
+
+from .convert import encoderFor
+from .wire import encodeTag, encodeVarint, fieldNumber
+
+_MATCH_KINDS = {
+    p4info_pb2.MatchField.EXACT: 'exact',
+    p4info_pb2.MatchField.LPM: 'lpm',
+    p4info_pb2.MatchField.TERNARY: 'ternary',
+    p4info_pb2.MatchField.RANGE: 'range',
+}
+
+
+def _lengthDelimitedTag(message_class, field_name):
+    return encodeTag(fieldNumber(message_class, field_name), 2)
+
+
+def _varintTag(message_class, field_name):
+    return encodeTag(fieldNumber(message_class, field_name), 0)
+
+
+_TABLE_ID = _varintTag(p4runtime_pb2.TableEntry, 'table_id')
+_MATCH = _lengthDelimitedTag(p4runtime_pb2.TableEntry, 'match')
+_ACTION = _lengthDelimitedTag(p4runtime_pb2.TableEntry, 'action')
+_PRIORITY = _varintTag(p4runtime_pb2.TableEntry, 'priority')
+_FIELD_ID = _varintTag(p4runtime_pb2.FieldMatch, 'field_id')
+# Tag of each FieldMatch kind, then of its two fields (the second one is a
+# varint for LPM prefix lengths)
+_KIND_TAGS = {
+    'exact': (_lengthDelimitedTag(p4runtime_pb2.FieldMatch, 'exact'),
+              _lengthDelimitedTag(p4runtime_pb2.FieldMatch.Exact, 'value'), None),
+    'lpm': (_lengthDelimitedTag(p4runtime_pb2.FieldMatch, 'lpm'),
+            _lengthDelimitedTag(p4runtime_pb2.FieldMatch.LPM, 'value'),
+            _varintTag(p4runtime_pb2.FieldMatch.LPM, 'prefix_len')),
+    'ternary': (_lengthDelimitedTag(p4runtime_pb2.FieldMatch, 'ternary'),
+                _lengthDelimitedTag(p4runtime_pb2.FieldMatch.Ternary, 'value'),
+                _lengthDelimitedTag(p4runtime_pb2.FieldMatch.Ternary, 'mask')),
+    'range': (_lengthDelimitedTag(p4runtime_pb2.FieldMatch, 'range'),
+              _lengthDelimitedTag(p4runtime_pb2.FieldMatch.Range, 'low'),
+              _lengthDelimitedTag(p4runtime_pb2.FieldMatch.Range, 'high')),
+}
+_TABLE_ACTION_ACTION = _lengthDelimitedTag(p4runtime_pb2.TableAction, 'action')
+_ACTION_ID = _varintTag(p4runtime_pb2.Action, 'action_id')
+_PARAMS = _lengthDelimitedTag(p4runtime_pb2.Action, 'params')
+_PARAM_ID = _varintTag(p4runtime_pb2.Action.Param, 'param_id')
+_PARAM_VALUE = _lengthDelimitedTag(p4runtime_pb2.Action.Param, 'value')
+_ENTITY_TABLE_ENTRY = _lengthDelimitedTag(p4runtime_pb2.Entity, 'table_entry')
+
+
+def _ld(tag, payload):
+    return tag + encodeVarint(len(payload)) + payload
+
+
+class UnsupportedMatchType(Exception):
+    """Raised for tables with a match field of a kind CompiledTableEntry
+    cannot encode (e.g. optional), whose entries must be built with
+    P4InfoHelper.buildTableEntry"""
+
+
+class CompiledTableEntry(object):
+    """Builder of the entries of one table using one action"""
+
+    def __init__(self, p4info_helper, table_name, action_name,
+                 match_fields=None, action_params=None, kinds=None):
+        table = p4info_helper.get('tables', name=table_name)
+        action = p4info_helper.get('actions', name=action_name)
+        self.table_name = table.preamble.name
+        self.action_name = action.preamble.name
+        self.table_id = table.preamble.id
+        self.action_id = action.preamble.id
+
+        if match_fields is None:
+            match_fields = [mf.name for mf in table.match_fields]
+        if action_params is None:
+            action_params = [p.name for p in action.params]
+        # Match field or param name -> kind of its values
+        kinds = kinds or {}
+
+        # (field_id, kind, encoder) of each match value
+        self.match_fields = []
+        for name in match_fields:
+            mf = p4info_helper.get_match_field(self.table_name, name)
+            kind = _MATCH_KINDS.get(mf.match_type)
+            if kind is None:
+                raise UnsupportedMatchType("Unsupported match type with type %r" % mf.match_type)
+            self.match_fields.append((mf.id, kind, encoderFor(mf.bitwidth, kinds.get(name))))
+        # (param_id, encoder) of each action param
+        self.params = []
+        for name in action_params:
+            p = p4info_helper.get_action_param(self.action_name, name)
+            self.params.append((p.id, encoderFor(p.bitwidth, kinds.get(name))))
+        self.num_match_fields = len(self.match_fields)
+        self.arity = self.num_match_fields + len(self.params)
+
+        # Serialized pieces that are the same for all entries
+        self._table_id = _TABLE_ID + encodeVarint(self.table_id)
+        self._match_prefixes = [_FIELD_ID + encodeVarint(field_id)
+                                for field_id, _, _ in self.match_fields]
+        self._action_id = _ACTION_ID + encodeVarint(self.action_id)
+        self._param_ids = [_PARAM_ID + encodeVarint(param_id) for param_id, _ in self.params]
+
+    def _checkArity(self, values):
+        if len(values) != self.arity:
+            raise TypeError("%s/%s entries take %d values (%d match fields, %d params), got %d"
+                            % (self.table_name, self.action_name, self.arity,
+                               self.num_match_fields, len(self.params), len(values)))
+
+    def __call__(self, *values, priority=None):
+        """Returns the p4runtime_pb2.TableEntry for the given values"""
+        self._checkArity(values)
+        table_entry = p4runtime_pb2.TableEntry()
+        table_entry.table_id = self.table_id
+        if priority is not None:
+            table_entry.priority = priority
+        match = table_entry.match
+        for (field_id, kind, encodeValue), value in zip(self.match_fields, values):
+            field_match = match.add()
+            field_match.field_id = field_id
+            if kind == 'exact':
+                field_match.exact.value = encodeValue(value)
+            elif kind == 'lpm':
+                field_match.lpm.value = encodeValue(value[0])
+                field_match.lpm.prefix_len = value[1]
+            elif kind == 'ternary':
+                field_match.ternary.value = encodeValue(value[0])
+                field_match.ternary.mask = encodeValue(value[1])
+            else:
+                field_match.range.low = encodeValue(value[0])
+                field_match.range.high = encodeValue(value[1])
+        action = table_entry.action.action
+        action.action_id = self.action_id
+        params = action.params
+        for (param_id, encodeValue), value in zip(self.params, values[self.num_match_fields:]):
+            param = params.add()
+            param.param_id = param_id
+            param.value = encodeValue(value)
+        return table_entry
+
+    def encode(self, *values, priority=None):
+        """Returns the serialized TableEntry for the given values, identical
+        to SerializeToString() of the message built by __call__"""
+        self._checkArity(values)
+        encoded = []
+        for (_, kind, encodeValue), value in zip(self.match_fields, values):
+            if kind == 'exact':
+                encoded.append(encodeValue(value))
+            elif kind == 'lpm':
+                encoded.append((encodeValue(value[0]), value[1]))
+            else:
+                encoded.append((encodeValue(value[0]), encodeValue(value[1])))
+        for (_, encodeValue), value in zip(self.params, values[self.num_match_fields:]):
+            encoded.append(encodeValue(value))
+        return self.encodeRow(encoded, priority)
+
+    def encodeColumns(self, *columns, priorities=None):
+        """Serializes many entries from columns of already encoded values.
+
+        There is one column per value taken by __call__, holding bytes of
+        the field width (e.g. from bulk_convert), except for LPM columns
+        holding (bytes, prefix_len) and ternary/range columns holding
+        (bytes, bytes) pairs. Returns the list of serialized TableEntries.
+        """
+        self._checkArity(columns)
+        if priorities is None:
+            return [self.encodeRow(row, None) for row in zip(*columns)]
+        return [self.encodeRow(row, priority) for row, priority in zip(zip(*columns), priorities)]
+
+    def encodeRow(self, encoded, priority=None):
+        """Serializes one entry from its already encoded values, given in
+        the same order and format as for encodeColumns"""
+        parts = [self._table_id]
+        for prefix, (_, kind, _), value in zip(self._match_prefixes, self.match_fields, encoded):
+            kind_tag, first_tag, second_tag = _KIND_TAGS[kind]
+            if kind == 'exact':
+                body = _ld(first_tag, value)
+            elif kind == 'lpm':
+                body = _ld(first_tag, value[0])
+                if value[1]:
+                    body += second_tag + encodeVarint(value[1])
+            else:
+                body = _ld(first_tag, value[0]) + _ld(second_tag, value[1])
+            parts.append(_ld(_MATCH, prefix + _ld(kind_tag, body)))
+        action = [self._action_id]
+        for param_id, value in zip(self._param_ids, encoded[self.num_match_fields:]):
+            action.append(_ld(_PARAMS, param_id + _ld(_PARAM_VALUE, value)))
+        parts.append(_ld(_ACTION, _ld(_TABLE_ACTION_ACTION, b''.join(action))))
+        if priority:
+            parts.append(_PRIORITY + encodeVarint(priority))
+        return b''.join(parts)
+
+    def encodeEntity(self, *values, priority=None):
+        """Returns the serialized Entity holding the entry, see wire.encodeUpdate"""
+        return _ld(_ENTITY_TABLE_ENTRY, self.encode(*values, priority=priority))
@@ -16,9 +16,12 @@
 
 import sys
 
-import grpc
-from google.rpc import code_pb2, status_pb2
-from p4.v1 import p4runtime_pb2
+from .lazy import lazyImport
+
+grpc = lazyImport('grpc')
+code_pb2 = lazyImport('google.rpc.code_pb2')
+status_pb2 = lazyImport('google.rpc.status_pb2')
+p4runtime_pb2 = lazyImport('p4.v1.p4runtime_pb2')
 
 
 # Used to indicate that the gRPC error Status object returned by the server has
@@ -81,14 +84,25 @@ def printGrpcError(grpc_error):
     print("gRPC Error", grpc_error.details(), end=' ')
     status_code = grpc_error.code()
     print("({})".format(status_code.name), end=' ')
-    traceback = sys.exc_info()[2]
-    print("[{}:{}]".format(
-        traceback.tb_frame.f_code.co_filename, traceback.tb_lineno))
+    # The error may be printed outside of the except block that caught it,
+    # e.g. when it was raised in another thread
+    traceback = sys.exc_info()[2] or grpc_error.__traceback__
+    if traceback is not None:
+        print("[{}:{}]".format(
+            traceback.tb_frame.f_code.co_filename, traceback.tb_lineno))
+    else:
+        print()
     if status_code != grpc.StatusCode.UNKNOWN:
         return
     p4_errors = parseGrpcErrorBinaryDetails(grpc_error)
     if p4_errors is None:
         return
+    printBatchErrors(p4_errors)
+
+
+# Prints the list of (index, p4.Error) tuples returned by
+# parseGrpcErrorBinaryDetails or SwitchConnection.WriteUpdates.
+def printBatchErrors(p4_errors):
     print("Errors in batch:")
     for idx, p4_error in p4_errors:
         code_name = code_pb2._CODE.values_by_number[
@@ -13,36 +13,134 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import hashlib
+import os
 import re
 
-import google.protobuf.text_format
-from p4.config.v1 import p4info_pb2
-from p4.v1 import p4runtime_pb2
-
 from .convert import encode
+from .lazy import lazyImport
+
+message = lazyImport('google.protobuf.message')
+text_format = lazyImport('google.protobuf.text_format')
+p4info_pb2 = lazyImport('p4.config.v1.p4info_pb2')
+p4runtime_pb2 = lazyImport('p4.v1.p4runtime_pb2')
+
+
+# Header of binary p4info caches, followed by the sha256 of the text p4info
+P4INFO_CACHE_MAGIC = b'P4INFOC1'
+
+# Names of the lookup functions synthesized by P4InfoHelper.__getattr__
+_LOOKUP_ATTR = re.compile(r"^get_\w+_(id|name)$")
+
+
+def loadP4Info(p4_info_filepath, cache=True):
+    """Loads a text format p4info file.
+
+    Parsing text format is slow, so with `cache` the parsed P4Info is also
+    stored in binary form next to the file (<p4_info_filepath>.bin), tagged
+    with the sha256 of the text. Later loads of the same text parse the
+    binary copy instead. The cache is skipped when it cannot be written.
+    """
+    with open(p4_info_filepath, 'rb') as p4info_f:
+        text = p4info_f.read()
+    header = P4INFO_CACHE_MAGIC + hashlib.sha256(text).digest()
+    cache_path = p4_info_filepath + '.bin'
+
+    p4info = p4info_pb2.P4Info()
+    if cache:
+        try:
+            with open(cache_path, 'rb') as cache_f:
+                data = cache_f.read()
+            if data.startswith(header):
+                p4info.ParseFromString(data[len(header):])
+                return p4info
+        except (OSError, message.DecodeError):
+            p4info.Clear()
+
+    # Load the p4info file into a skeleton P4Info object
+    text_format.Merge(text.decode('utf-8'), p4info, allow_unknown_field=True)
+    if cache:
+        # Write to a temporary file first, so concurrent loads never see a
+        # partial cache
+        tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as cache_f:
+                cache_f.write(header + p4info.SerializeToString())
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return p4info
 
 
 class P4InfoHelper(object):
-    def __init__(self, p4_info_filepath):
-        p4info = p4info_pb2.P4Info()
-        # Load the p4info file into a skeleton P4Info object
-        with open(p4_info_filepath) as p4info_f:
-            google.protobuf.text_format.Merge(p4info_f.read(), p4info,
-                                              allow_unknown_field=True)
-        self.p4info = p4info
+    def __init__(self, p4_info_filepath, cache=True):
+        self.p4info = loadP4Info(p4_info_filepath, cache=cache)
+        self._build_indexes()
+
+    @classmethod
+    def from_p4info(cls, p4info):
+        """Builds a helper from a P4Info message (or its serialization)
+        instead of a file"""
+        if isinstance(p4info, bytes):
+            p4info = p4info_pb2.P4Info.FromString(p4info)
+        helper = cls.__new__(cls)
+        helper.p4info = p4info
+        helper._build_indexes()
+        return helper
+
+    def _build_indexes(self):
+        """Index the p4info by name, alias and id so lookups don't scan it.
+        Must be called again if self.p4info is modified."""
+        # The lookup functions synthesized by __getattr__ hold the indexes
+        # they were created with
+        for attr in [attr for attr in self.__dict__ if _LOOKUP_ATTR.match(attr)]:
+            del self.__dict__[attr]
+
+        # entity_type -> {name or alias: entity} and entity_type -> {id: entity}
+        # for every repeated P4Info field with a preamble (tables, actions,
+        # counters, meters, registers, digests...)
+        self._by_name = {}
+        self._by_id = {}
+        for field in self.p4info.DESCRIPTOR.fields:
+            if field.label != field.LABEL_REPEATED or field.message_type is None \
+                    or 'preamble' not in field.message_type.fields_by_name:
+                continue
+            by_name = self._by_name[field.name] = {}
+            by_id = self._by_id[field.name] = {}
+            for o in getattr(self.p4info, field.name):
+                pre = o.preamble
+                # setdefault keeps the first match, like a scan would
+                by_name.setdefault(pre.name, o)
+                if pre.alias:
+                    by_name.setdefault(pre.alias, o)
+                by_id.setdefault(pre.id, o)
+
+        # table name -> ({match field name: field}, {match field id: field})
+        self._match_fields = {}
+        for t in self.p4info.tables:
+            self._match_fields.setdefault(t.preamble.name, (
+                {mf.name: mf for mf in reversed(t.match_fields)},
+                {mf.id: mf for mf in reversed(t.match_fields)}))
+
+        # action name -> ({param name: param}, {param id: param})
+        self._action_params = {}
+        for a in self.p4info.actions:
+            self._action_params.setdefault(a.preamble.name, (
+                {p.name: p for p in reversed(a.params)},
+                {p.id: p for p in reversed(a.params)}))
 
     def get(self, entity_type, name=None, id=None):
         if name is not None and id is not None:
             raise AssertionError("name or id must be None")
 
-        for o in getattr(self.p4info, entity_type):
-            pre = o.preamble
+        if entity_type in self._by_name:
             if name:
-                if (pre.name == name or pre.alias == name):
-                    return o
+                o = self._by_name[entity_type].get(name)
             else:
-                if pre.id == id:
-                    return o
+                o = self._by_id[entity_type].get(id)
+            if o is not None:
+                return o
 
         if name:
             raise AttributeError("Could not find %r of type %s" % (name, entity_type))
@@ -61,31 +159,45 @@ class P4InfoHelper(object):
     def __getattr__(self, attr):
         # Synthesize convenience functions for name to id lookups for top-level entities
         # e.g. get_tables_id(name_string) or get_actions_id(name_string)
+        # The functions are stored on the instance, so this only runs once per name
         m = re.search(r"^get_(\w+)_id$", attr)
         if m:
             primitive = m.group(1)
-            return lambda name: self.get_id(primitive, name)
+            by_name = self._by_name.get(primitive, {})
+
+            def get_id(name):
+                o = by_name.get(name) if name else None
+                if o is None:
+                    return self.get_id(primitive, name)
+                return o.preamble.id
+            setattr(self, attr, get_id)
+            return get_id
 
         # Synthesize convenience functions for id to name lookups
         # e.g. get_tables_name(id) or get_actions_name(id)
         m = re.search(r"^get_(\w+)_name$", attr)
         if m:
             primitive = m.group(1)
-            return lambda id: self.get_name(primitive, id)
+            by_id = self._by_id.get(primitive, {})
+
+            def get_name(id):
+                o = by_id.get(id)
+                if o is None:
+                    return self.get_name(primitive, id)
+                return o.preamble.name
+            setattr(self, attr, get_name)
+            return get_name
 
         raise AttributeError("%r object has no attribute %r" % (self.__class__, attr))
 
     def get_match_field(self, table_name, name=None, id=None):
-        for t in self.p4info.tables:
-            pre = t.preamble
-            if pre.name == table_name:
-                for mf in t.match_fields:
-                    if name is not None:
-                        if mf.name == name:
-                            return mf
-                    elif id is not None:
-                        if mf.id == id:
-                            return mf
+        by_name, by_id = self._match_fields.get(table_name, ({}, {}))
+        if name is not None:
+            mf = by_name.get(name)
+        else:
+            mf = by_id.get(id)
+        if mf is not None:
+            return mf
         raise AttributeError("%r has no attribute %r" % (table_name, name if name is not None else id))
 
     def get_match_field_id(self, table_name, match_field_name):
@@ -135,17 +247,14 @@ class P4InfoHelper(object):
             raise Exception("Unsupported match type with type %r" % match_type)
 
     def get_action_param(self, action_name, name=None, id=None):
-        for a in self.p4info.actions:
-            pre = a.preamble
-            if pre.name == action_name:
-                for p in a.params:
-                    if name is not None:
-                        if p.name == name:
-                            return p
-                    elif id is not None:
-                        if p.id == id:
-                            return p
-        raise AttributeError("action %r has no param %r, (has: %r)" % (action_name, name if name is not None else id, a.params))
+        by_name, by_id = self._action_params.get(action_name, ({}, {}))
+        if name is not None:
+            p = by_name.get(name)
+        else:
+            p = by_id.get(id)
+        if p is not None:
+            return p
+        raise AttributeError("action %r has no param %r, (has: %r)" % (action_name, name if name is not None else id, list(reversed(by_name.values()))))
 
     def get_action_param_id(self, action_name, param_name):
         return self.get_action_param(action_name, name=param_name).id
@@ -196,6 +305,14 @@ class P4InfoHelper(object):
                 ])
         return table_entry
 
+    def compile_entry(self, table_name, action_name, match_fields=None, action_params=None,
+                      kinds=None):
+        """Returns a fast builder for entries of table_name using action_name,
+        see entry_builder.CompiledTableEntry"""
+        from .entry_builder import CompiledTableEntry
+        return CompiledTableEntry(self, table_name, action_name, match_fields=match_fields,
+                                  action_params=action_params, kinds=kinds)
+
     def buildMulticastGroupEntry(self, multicast_group_id, replicas):
         mc_entry = p4runtime_pb2.PacketReplicationEngineEntry()
         mc_entry.multicast_group_entry.multicast_group_id = multicast_group_id
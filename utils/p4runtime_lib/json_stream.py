@@ -0,0 +1,143 @@
+# SPDX-License-Identifier: Apache-2.0
+'''
+Incremental parsing of large JSON objects.
+
+json.load needs the whole document in memory, twice (text and objects).
+iterJsonMembers() reads the top-level object of a file chunk by chunk and
+yields its members one at a time; the arrays of the members listed in
+`stream_keys` are not decoded at once but yielded as iterators over their
+items, each item being decoded with json.JSONDecoder.raw_decode:
+
+    with open(runtime_json) as f:
+        for key, value in iterJsonMembers(f, stream_keys={'table_entries'}):
+            if key == 'table_entries':
+                for entry in value:
+                    ...
+
+Only the current item and one read chunk are held in memory. An item
+iterator must be consumed before advancing to the next member, which
+otherwise skips (parses and discards) its remaining items.
+'''
+import json
+
+CHUNK_SIZE = 1 << 16
+
+_WHITESPACE = ' \t\n\r'
+_NUMBER_CHARS = '0123456789.eE+-'
+
+
+class _JsonReader(object):
+    """Text buffer over a file with the position of the next character"""
+
+    def __init__(self, fp, chunk_size=CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        # Offset in the file of buf[0], for error messages
+        self.base = 0
+        self.eof = False
+
+    def fill(self, min_size=0):
+        """Reads at least one chunk (or min_size characters) more. Returns
+        False at the end of the file."""
+        if self.eof:
+            return False
+        # Drop what has been consumed
+        self.base += self.pos
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        data = self.fp.read(max(self.chunk_size, min_size))
+        if not data:
+            self.eof = True
+            return False
+        self.buf += data
+        return True
+
+    def error(self, msg):
+        raise ValueError("%s at offset %d" % (msg, self.base + self.pos))
+
+    def peek(self):
+        """Returns the next non-whitespace character, or '' at the end"""
+        while True:
+            buf = self.buf
+            pos = self.pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self.pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        """Consumes the next non-whitespace character, one of `chars`"""
+        char = self.peek()
+        if not char or char not in chars:
+            self.error("Expecting one of %r, found %r" % (chars, char))
+        self.pos += 1
+        return char
+
+    def decodeValue(self):
+        """Decodes the next JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                value, end = None, None
+            # A number followed by nothing but number characters may have been
+            # cut at the end of the buffer, so it is only trusted at the end
+            # of the file
+            if end is not None and (self.eof or not self._maybeCut(value, end)):
+                self.pos = end
+                return value
+            # Reading as much again as is buffered keeps large values linear
+            if not self.fill(len(self.buf) - self.pos) and end is None:
+                self.error("Invalid JSON value")
+
+    def _maybeCut(self, value, end):
+        if end == len(self.buf):
+            return True
+        return isinstance(value, (int, float)) and not isinstance(value, bool) \
+            and not self.buf[end:].lstrip(_NUMBER_CHARS)
+
+    def iterArray(self):
+        """Yields the items of the array starting at the next character"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.decodeValue()
+            if self.expect(',]') == ']':
+                return
+
+
+def iterJsonMembers(fp, stream_keys=(), chunk_size=CHUNK_SIZE):
+    """Yields the (key, value) members of the JSON object in file `fp`,
+    where the value of keys in stream_keys holding an array is an iterator
+    over its items"""
+    reader = _JsonReader(fp, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.pos += 1
+    else:
+        while True:
+            key = reader.decodeValue()
+            if not isinstance(key, str):
+                reader.error("Expecting a member name")
+            reader.expect(':')
+            if key in stream_keys and reader.peek() == '[':
+                items = reader.iterArray()
+                yield key, items
+                # Skip what the caller did not consume
+                for _ in items:
+                    pass
+            else:
+                yield key, reader.decodeValue()
+            if reader.expect(',}') == '}':
+                break
+    if reader.peek():
+        reader.error("Extra data after the JSON object")
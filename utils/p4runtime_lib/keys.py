@@ -0,0 +1,72 @@
+# SPDX-License-Identifier: Apache-2.0
+'''
+Hashable keys for P4Runtime entities.
+
+Two entities get the same key when a switch would consider them the same
+object, e.g. table entries with the same table, match and priority. Byte
+strings are compared in canonical form (no leading zero bytes), since
+servers may return values shorter than the bitwidth of the field.
+'''
+
+
+def canonicalBytes(value):
+    'Strips leading zero bytes, keeping at least one byte'
+    return value.lstrip(b'\x00') or b'\x00'
+
+
+def fieldMatchKey(field_match):
+    kind = field_match.WhichOneof('field_match_type')
+    if kind == 'exact':
+        return (field_match.field_id, kind,
+                canonicalBytes(field_match.exact.value))
+    elif kind == 'lpm':
+        return (field_match.field_id, kind,
+                canonicalBytes(field_match.lpm.value), field_match.lpm.prefix_len)
+    elif kind == 'ternary':
+        return (field_match.field_id, kind,
+                canonicalBytes(field_match.ternary.value),
+                canonicalBytes(field_match.ternary.mask))
+    elif kind == 'range':
+        return (field_match.field_id, kind,
+                canonicalBytes(field_match.range.low),
+                canonicalBytes(field_match.range.high))
+    elif kind == 'optional':
+        return (field_match.field_id, kind,
+                canonicalBytes(field_match.optional.value))
+    return (field_match.field_id, kind, field_match.SerializeToString())
+
+
+def tableEntryKey(table_entry):
+    'Returns (table_id, match, priority) identifying a table entry'
+    match = tuple(sorted(fieldMatchKey(m) for m in table_entry.match))
+    return (table_entry.table_id, match, table_entry.priority)
+
+
+def entityKey(entity):
+    '''
+    Key of any entity that can be written, either a p4runtime_pb2.Entity or
+    the message of one of its fields (TableEntry, PacketReplicationEngineEntry...)
+    '''
+    message_name = entity.DESCRIPTOR.name
+    if message_name == 'Entity':
+        return entityKey(getattr(entity, entity.WhichOneof('entity')))
+    if message_name == 'TableEntry':
+        return (message_name, tableEntryKey(entity))
+    if message_name == 'PacketReplicationEngineEntry':
+        kind = entity.WhichOneof('type')
+        if kind == 'multicast_group_entry':
+            return (message_name, kind, entity.multicast_group_entry.multicast_group_id)
+        if kind == 'clone_session_entry':
+            return (message_name, kind, entity.clone_session_entry.session_id)
+    return (message_name, entity.SerializeToString(deterministic=True))
+
+
+def tableActionKey(table_entry):
+    'Returns a key comparing the action part of two table entries'
+    action = table_entry.action
+    kind = action.WhichOneof('type')
+    if kind == 'action':
+        params = tuple(sorted((p.param_id, canonicalBytes(p.value))
+                              for p in action.action.params))
+        return (kind, action.action.action_id, params)
+    return (kind, action.SerializeToString(deterministic=True))
@@ -0,0 +1,43 @@
+# SPDX-License-Identifier: Apache-2.0
+'''
+Deferred imports.
+
+Importing grpc, the P4Runtime protos (which pull in google.rpc) and
+protobuf's text_format takes a good part of a second, which tools that only
+print --help, validate files or convert values never need:
+
+    p4runtime_pb2 = lazyImport('p4.v1.p4runtime_pb2')
+
+returns a module object that performs the import on first attribute access.
+The import itself goes through importlib.import_module, so concurrent first
+uses from several threads are safe. A module that is already imported is
+returned as is.
+
+Modules whose classes are subclassed at import time (e.g. grpc in
+switch.py) gain nothing from this and are imported normally.
+'''
+import importlib
+import importlib.util
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Placeholder for a module, imported on first attribute access"""
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        # Later lookups of any attribute hit the copied namespace directly
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazyImport(name, package=None):
+    """Returns module `name` (relative to `package` when it starts with a
+    dot), imported when one of its attributes is first used"""
+    if name.startswith('.'):
+        name = importlib.util.resolve_name(name, package)
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
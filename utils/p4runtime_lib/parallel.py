@@ -0,0 +1,120 @@
+# SPDX-License-Identifier: Apache-2.0
+'''
+Rule compilation spread over worker processes.
+
+Building and serializing table entries is CPU-bound pure Python, so for
+synthetic rule sets of 10^5-10^6 routes a single core is the bottleneck.
+compileTableEntries() splits the intents in chunks compiled by a pool of
+processes; each worker rebuilds a P4InfoHelper from the serialized p4info
+(see P4InfoHelper.from_p4info) and keeps one CompiledTableEntry per
+(table, action). Only intents and serialized entries cross process
+boundaries, and the parent just assembles the write batches:
+
+    intents = (("MyIngress.ipv4_lpm", "MyIngress.ipv4_forward",
+                ((dst, 32), mac, port)) for dst, mac, port in routes)
+    updates = compileTableEntries(p4info_helper, intents,
+                                  update_type=p4runtime_pb2.Update.INSERT)
+    failures = sw.WriteEncodedUpdates(updates)
+
+An intent is (table_name, action_name, values) or (table_name, action_name,
+values, priority), values being the arguments of the compiled builder: the
+match values in table order followed by the action params in action order.
+Results come back in the order of the intents.
+'''
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from .wire import encodeUpdate
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# Per worker process state, set up by _initWorker
+_worker = None
+
+
+class _Compiler(object):
+    """Compiles intents with builders created on first use"""
+
+    def __init__(self, p4info_helper, kinds=None, update_type=None):
+        self.p4info_helper = p4info_helper
+        self.kinds = kinds
+        self.update_type = update_type
+        self.builders = {}
+
+    def compile(self, intents):
+        builders = self.builders
+        encoded = []
+        for intent in intents:
+            table_name, action_name, values = intent[:3]
+            priority = intent[3] if len(intent) > 3 else None
+            build = builders.get((table_name, action_name))
+            if build is None:
+                build = builders[table_name, action_name] = self.p4info_helper.compile_entry(
+                    table_name, action_name, kinds=self.kinds)
+            if self.update_type is None:
+                encoded.append(build.encode(*values, priority=priority))
+            else:
+                encoded.append(encodeUpdate(self.update_type,
+                                            build.encodeEntity(*values, priority=priority)))
+        return encoded
+
+
+def _initWorker(p4info_bytes, kinds, update_type):
+    global _worker
+    from .helper import P4InfoHelper
+    _worker = _Compiler(P4InfoHelper.from_p4info(p4info_bytes), kinds, update_type)
+
+
+def _compileChunk(intents):
+    return _worker.compile(intents)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def compileTableEntriesChunks(p4info_helper, intents, update_type=None, workers=None,
+                              chunk_size=DEFAULT_CHUNK_SIZE, kinds=None):
+    """Yields lists of serialized TableEntries (or Updates of update_type,
+    see wire.encodeUpdate) for consecutive chunks of intents.
+
+    workers defaults to the number of CPUs; with a single worker the
+    intents are compiled in this process. At most two chunks per worker are
+    in flight, so intents may be produced lazily by a generator.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        compiler = _Compiler(p4info_helper, kinds, update_type)
+        for chunk in _chunks(intents, chunk_size):
+            yield compiler.compile(chunk)
+        return
+
+    p4info_bytes = p4info_helper.p4info.SerializeToString()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initWorker,
+                             initargs=(p4info_bytes, kinds, update_type)) as executor:
+        in_flight = deque()
+        for chunk in _chunks(intents, chunk_size):
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().result()
+            in_flight.append(executor.submit(_compileChunk, chunk))
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def compileTableEntries(p4info_helper, intents, update_type=None, workers=None,
+                        chunk_size=DEFAULT_CHUNK_SIZE, kinds=None):
+    """Returns the list of serialized TableEntries (or Updates of
+    update_type) of all intents, compiled by `workers` processes"""
+    encoded = []
+    for chunk in compileTableEntriesChunks(p4info_helper, intents, update_type=update_type,
+                                           workers=workers, chunk_size=chunk_size, kinds=kinds):
+        encoded += chunk
+    return encoded
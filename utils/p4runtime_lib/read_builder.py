@@ -0,0 +1,154 @@
+# SPDX-License-Identifier: Apache-2.0
+'''
+Reads of several entities in a single ReadRequest.
+
+ReadTableEntries and ReadCounters put one entity in each ReadRequest, so
+reading the state of a switch takes one RPC per table and per counter. A
+ReadBuilder collects any mix of table, counter, direct counter, meter,
+direct meter and register entities, reads them with one Read RPC and sorts
+the entities of the responses by (kind, id):
+
+    reads = ReadBuilder()
+    reads.tableEntries()                        # all tables
+    reads.counter(counter_id)                   # every index
+    reads.directCounter(table_id)
+    state = reads.read(sw)
+    state[('table_entry', table_id)]            # list of TableEntry
+    state[('counter_entry', counter_id)]        # list of CounterEntry
+
+The kind is the name of the Entity field and the id that of the table,
+counter, meter or register (the table id for direct counters and meters).
+ReadBuilder.forP4Info() reads everything a pipeline holds. iterRead()
+yields the entities as the responses are streamed instead of collecting
+them.
+'''
+from p4.v1 import p4runtime_pb2
+
+# Entity kind -> function returning the id entities of that kind are sorted by
+_ENTITY_IDS = {
+    'table_entry': lambda e: e.table_id,
+    'counter_entry': lambda e: e.counter_id,
+    'direct_counter_entry': lambda e: e.table_entry.table_id,
+    'meter_entry': lambda e: e.meter_id,
+    'direct_meter_entry': lambda e: e.table_entry.table_id,
+    'register_entry': lambda e: e.register_id,
+    'action_profile_member': lambda e: e.action_profile_id,
+    'action_profile_group': lambda e: e.action_profile_id,
+    'value_set_entry': lambda e: e.value_set_id,
+    'digest_entry': lambda e: e.digest_id,
+    'extern_entry': lambda e: e.extern_id,
+}
+
+
+def readKey(entity):
+    """Returns ((kind, id), message) for a p4runtime_pb2.Entity read from a
+    switch, e.g. (('counter_entry', counter_id), CounterEntry)"""
+    kind = entity.WhichOneof('entity')
+    message = getattr(entity, kind)
+    entity_id = _ENTITY_IDS.get(kind)
+    return (kind, entity_id(message) if entity_id is not None else None), message
+
+
+class ReadBuilder(object):
+    """Entities to read from a switch in a single ReadRequest"""
+
+    def __init__(self):
+        self.entities = []
+
+    def _add(self):
+        entity = p4runtime_pb2.Entity()
+        self.entities.append(entity)
+        return entity
+
+    def entity(self, entity):
+        """Adds a p4runtime_pb2.Entity built by the caller"""
+        self.entities.append(entity)
+        return self
+
+    def tableEntries(self, table_id=0):
+        """Reads the entries of a table (all tables for table_id 0)"""
+        self._add().table_entry.table_id = table_id
+        return self
+
+    def counter(self, counter_id=0, index=None):
+        """Reads one index of a counter, or all of them"""
+        counter_entry = self._add().counter_entry
+        counter_entry.counter_id = counter_id
+        if index is not None:
+            counter_entry.index.index = index
+        return self
+
+    def directCounter(self, table_id=0):
+        """Reads the direct counters of every entry of a table"""
+        self._add().direct_counter_entry.table_entry.table_id = table_id
+        return self
+
+    def meter(self, meter_id=0, index=None):
+        """Reads the configuration of one index of a meter, or of all"""
+        meter_entry = self._add().meter_entry
+        meter_entry.meter_id = meter_id
+        if index is not None:
+            meter_entry.index.index = index
+        return self
+
+    def directMeter(self, table_id=0):
+        """Reads the direct meters of every entry of a table"""
+        self._add().direct_meter_entry.table_entry.table_id = table_id
+        return self
+
+    def register(self, register_id=0, index=None):
+        """Reads one cell of a register, or all of them"""
+        register_entry = self._add().register_entry
+        register_entry.register_id = register_id
+        if index is not None:
+            register_entry.index.index = index
+        return self
+
+    @classmethod
+    def forP4Info(cls, p4info_helper):
+        """Returns a builder reading every table entry, counter, direct
+        counter, meter, direct meter and register of a p4info"""
+        p4info = p4info_helper.p4info
+        builder = cls()
+        if p4info.tables:
+            builder.tableEntries()
+        for counter in p4info.counters:
+            builder.counter(counter.preamble.id)
+        for direct_counter in p4info.direct_counters:
+            builder.directCounter(direct_counter.direct_table_id)
+        for meter in p4info.meters:
+            builder.meter(meter.preamble.id)
+        for direct_meter in p4info.direct_meters:
+            builder.directMeter(direct_meter.direct_table_id)
+        for register in p4info.registers:
+            builder.register(register.preamble.id)
+        return builder
+
+    def iterRead(self, connection, dry_run=False):
+        """Reads the entities from a SwitchConnection with a single RPC and
+        yields ((kind, id), message) tuples as responses are received"""
+        for response in connection.ReadEntities(self.entities, dry_run=dry_run):
+            for entity in response.entities:
+                yield readKey(entity)
+
+    def read(self, connection, dry_run=False):
+        """Reads the entities from a SwitchConnection with a single RPC.
+        Returns a dict mapping (kind, id) to the list of entities read."""
+        return demultiplex(self.iterRead(connection, dry_run=dry_run))
+
+
+def demultiplex(keyed_entities):
+    """Groups ((kind, id), message) tuples into a dict of lists"""
+    result = {}
+    for key, message in keyed_entities:
+        entities = result.get(key)
+        if entities is None:
+            entities = result[key] = []
+        entities.append(message)
+    return result
+
+
+def demultiplexResponses(responses):
+    """Same as ReadBuilder.read for ReadResponses already received, e.g.
+    from AsyncSwitchConnection.ReadEntities"""
+    return demultiplex(readKey(entity) for response in responses for entity in response.entities)
@@ -0,0 +1,86 @@
+# SPDX-License-Identifier: Apache-2.0
+'''
+Reconciliation of table entries against the state of a switch.
+
+Instead of blindly inserting rules (and falling back to MODIFY when they
+already exist), the tables are read back once and compared by match key
+with the intended entries, so that only the needed INSERT, MODIFY and DELETE
+updates are written:
+
+    updates, failures = reconcileTables(sw, desired_entries, table_ids)
+
+Running it again against an already programmed switch writes nothing.
+When the connection keeps a shadow (see shadow.py) the result of the Read
+is loaded into it, and later calls can pass use_shadow=True to diff against
+the shadow without reading the tables again.
+Default-action entries cannot be reconciled this way and are rejected.
+'''
+from p4.v1 import p4runtime_pb2
+
+from .keys import tableActionKey, tableEntryKey
+from .switch import MAX_WRITE_BATCH_SIZE
+
+
+def readTableEntries(sw, table_ids):
+    'Yields the entries installed in each of the tables, one Read per table'
+    for table_id in table_ids:
+        for response in sw.ReadTableEntries(table_id=table_id):
+            for entity in response.entities:
+                yield entity.table_entry
+
+
+def computeTableUpdates(desired_entries, installed_entries):
+    '''
+    Returns the (update_type, table_entry) list turning installed_entries
+    into desired_entries. When several desired entries share a match key
+    the last one wins.
+    '''
+    desired = {}
+    for table_entry in desired_entries:
+        if table_entry.is_default_action:
+            raise ValueError("Default entries cannot be reconciled (table %d)"
+                             % table_entry.table_id)
+        desired[tableEntryKey(table_entry)] = table_entry
+    installed = {tableEntryKey(e): e for e in installed_entries}
+
+    updates = []
+    for key, table_entry in installed.items():
+        if key not in desired:
+            updates.append((p4runtime_pb2.Update.DELETE, table_entry))
+    for key, table_entry in desired.items():
+        current = installed.get(key)
+        if current is None:
+            updates.append((p4runtime_pb2.Update.INSERT, table_entry))
+        elif tableActionKey(current) != tableActionKey(table_entry):
+            updates.append((p4runtime_pb2.Update.MODIFY, table_entry))
+    return updates
+
+
+def reconcileTables(sw, desired_entries, table_ids=None, use_shadow=False,
+                    max_batch_size=MAX_WRITE_BATCH_SIZE, dry_run=False):
+    '''
+    Makes the given tables of switch `sw` hold exactly desired_entries.
+
+    table_ids lists the tables owned by the caller: entries found there but
+    not desired are deleted. It defaults to the tables of desired_entries.
+    With use_shadow, the installed entries are taken from sw.shadow instead
+    of being read.
+    Returns the list of (update_type, table_entry) written and the failures
+    reported by SwitchConnection.WriteUpdates.
+    '''
+    desired_entries = list(desired_entries)
+    if table_ids is None:
+        table_ids = {table_entry.table_id for table_entry in desired_entries}
+    if use_shadow and sw.shadow is not None:
+        installed = [table_entry for table_id in sorted(table_ids)
+                     for table_entry in sw.shadow.tableEntries(table_id)]
+    else:
+        installed = list(readTableEntries(sw, sorted(table_ids)))
+        if sw.shadow is not None:
+            sw.shadow.replaceTables(table_ids, installed)
+    updates = computeTableUpdates(desired_entries, installed)
+    failures = []
+    if updates:
+        failures = sw.WriteUpdates(updates, max_batch_size=max_batch_size,
+                                   dry_run=dry_run)
+    return updates, failures
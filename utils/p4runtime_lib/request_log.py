@@ -0,0 +1,143 @@
+# SPDX-License-Identifier: Apache-2.0
+'''
+Binary capture of the P4Runtime requests sent to a switch.
+
+BinaryRequestLogger is a drop-in replacement for switch.GrpcRequestLogger
+that keeps the capture file open and leaves all file I/O to a background
+thread. Requests are stored as serialized protobufs instead of text, and the
+decision to skip large messages is taken from ByteSize() without formatting
+them.
+
+File layout: the MAGIC string, then one record per request made of a
+RECORD_HEADER (timestamp, method name length, message size, payload length)
+followed by the method name and the payload. The payload is empty when the
+message was larger than the logger's max_message_size (payload length
+smaller than the message size).
+
+Captures are rendered as text with:
+
+    python3 -m p4runtime_lib.request_log logs/s1-p4runtime-requests.bin
+'''
+import argparse
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+from queue import SimpleQueue
+
+import grpc
+from p4.v1 import p4runtime_pb2
+
+MAGIC = b'P4RTLOG1'
+
+# timestamp, len(method name), message size, len(payload)
+RECORD_HEADER = struct.Struct('<dHII')
+
+# Messages bigger than this (e.g. pipeline configs) are recorded without payload
+BINARY_LOG_MAX_SIZE = 64 * 1024
+
+
+class BinaryRequestLogger(grpc.UnaryUnaryClientInterceptor,
+                          grpc.UnaryStreamClientInterceptor):
+    """gRPC interceptor that logs requests to a binary file from a writer thread"""
+
+    _sentinel = object()
+
+    def __init__(self, log_file, max_message_size=BINARY_LOG_MAX_SIZE):
+        self.log_file = log_file
+        self.max_message_size = max_message_size
+        self.file = open(log_file, 'wb')
+        self.file.write(MAGIC)
+        self.queue = SimpleQueue()
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def log_message(self, method_name, body):
+        ts = time.time()
+        if isinstance(body, bytes):
+            size = len(body)
+            payload = body if size <= self.max_message_size else b''
+        else:
+            size = body.ByteSize()
+            payload = body.SerializeToString() if size <= self.max_message_size else b''
+        # grpc.aio passes the method name as bytes
+        if isinstance(method_name, str):
+            method_name = method_name.encode('utf-8')
+        self.queue.put((ts, method_name, size, payload))
+
+    def _write_loop(self):
+        while True:
+            record = self.queue.get()
+            if record is self._sentinel:
+                break
+            ts, method, size, payload = record
+            try:
+                self.file.write(RECORD_HEADER.pack(ts, len(method), size, len(payload)) +
+                                method + payload)
+            except Exception as e:
+                # Losing one record must not stop the capture
+                sys.stderr.write("Could not log a %s request to %s: %s\n" % (
+                    method.decode('utf-8', 'replace'), self.log_file, e))
+            # Flush when the writer catches up, so the capture can be read
+            # while the controller is running
+            if self.queue.empty():
+                self.file.flush()
+        self.file.close()
+
+    def close(self):
+        self.queue.put(self._sentinel)
+        self.thread.join()
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        self.log_message(client_call_details.method, request)
+        return continuation(client_call_details, request)
+
+    def intercept_unary_stream(self, continuation, client_call_details, request):
+        self.log_message(client_call_details.method, request)
+        return continuation(client_call_details, request)
+
+
+def readRecords(log_file):
+    """Yields (timestamp, method_name, size, payload) for each logged request"""
+    with open(log_file, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a binary P4Runtime request log" % log_file)
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            ts, method_len, size, payload_len = RECORD_HEADER.unpack(header)
+            method_name = f.read(method_len).decode('utf-8')
+            yield ts, method_name, size, f.read(payload_len)
+
+
+def requestType(method_name):
+    """Returns the request message class of a P4Runtime gRPC method"""
+    service = p4runtime_pb2.DESCRIPTOR.services_by_name['P4Runtime']
+    method = service.methods_by_name[method_name.rsplit('/', 1)[-1]]
+    return getattr(p4runtime_pb2, method.input_type.name)
+
+
+def render(log_file, out=sys.stdout):
+    """Writes a capture in the text format used by GrpcRequestLogger"""
+    for ts, method_name, size, payload in readRecords(log_file):
+        out.write("\n[%s] %s\n---\n" % (
+            datetime.utcfromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+            method_name))
+        if len(payload) == size:
+            out.write(str(requestType(method_name).FromString(payload)))
+        else:
+            out.write("Message too long (%d bytes)! Skipping log...\n" % size)
+        out.write('---\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render a binary P4Runtime request log as text')
+    parser.add_argument('log_file', help='binary log written by BinaryRequestLogger')
+    args = parser.parse_args()
+    render(args.log_file)
+
+
+if __name__ == '__main__':
+    main()
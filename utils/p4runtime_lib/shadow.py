@@ -0,0 +1,87 @@
+# SPDX-License-Identifier: Apache-2.0
+'''
+In-memory shadow of the table entries installed on a switch.
+
+A SwitchConnection created with shadow=True keeps a ShadowTables instance
+up to date with every table entry it writes successfully, so controllers
+can check what is installed without reading tables back:
+
+    sw = Bmv2SwitchConnection(name='s1', address='127.0.0.1:50051', shadow=True)
+    sw.WriteTableEntry(table_entry)
+    table_entry in sw.shadow            # True
+    sw.shadow.lookup(table_entry)       # installed entry with the same match
+
+Entries are keyed by keys.tableEntryKey, i.e. (table_id, canonical match,
+priority). Only entries written through the connection are known: entries
+installed by someone else show up after a Read is loaded with
+replaceTables(). Default-action entries are not tracked.
+'''
+from p4.v1 import p4runtime_pb2
+
+from .keys import tableEntryKey
+
+
+class ShadowTables(object):
+    """Table entries of one switch, keyed by match"""
+
+    def __init__(self):
+        self.entries = {}
+
+    def apply(self, update_type, entity):
+        """Records a successful update. Non table entities are ignored."""
+        if isinstance(entity, p4runtime_pb2.Entity):
+            if entity.WhichOneof('entity') != 'table_entry':
+                return
+            entity = entity.table_entry
+        elif not isinstance(entity, p4runtime_pb2.TableEntry):
+            return
+        if entity.is_default_action:
+            return
+        key = tableEntryKey(entity)
+        if update_type == p4runtime_pb2.Update.DELETE:
+            self.entries.pop(key, None)
+        else:
+            table_entry = p4runtime_pb2.TableEntry()
+            table_entry.CopyFrom(entity)
+            self.entries[key] = table_entry
+
+    def applyWriteRequest(self, request, failed_indices=()):
+        """Records the updates of a WriteRequest, except the failed ones"""
+        for idx, update in enumerate(request.updates):
+            if idx not in failed_indices:
+                self.apply(update.type, update.entity)
+
+    def replaceTables(self, table_ids, table_entries):
+        """Replaces the content of the given tables, e.g. with a Read result"""
+        table_ids = set(table_ids)
+        self.entries = {key: table_entry for key, table_entry in self.entries.items()
+                        if key[0] not in table_ids}
+        for table_entry in table_entries:
+            self.apply(p4runtime_pb2.Update.INSERT, table_entry)
+
+    def lookup(self, table_entry):
+        """Returns the installed entry with the same match, or None"""
+        return self.entries.get(tableEntryKey(table_entry))
+
+    def tableEntries(self, table_id):
+        return [table_entry for key, table_entry in self.entries.items()
+                if key[0] == table_id]
+
+    def export(self):
+        """Returns the shadow as a ReadResponse, like a wildcard table Read"""
+        response = p4runtime_pb2.ReadResponse()
+        for table_entry in self.entries.values():
+            response.entities.add().table_entry.CopyFrom(table_entry)
+        return response
+
+    def clear(self):
+        self.entries = {}
+
+    def __contains__(self, table_entry):
+        return tableEntryKey(table_entry) in self.entries
+
+    def __iter__(self):
+        return iter(list(self.entries.values()))
+
+    def __len__(self):
+        return len(self.entries)
@@ -19,10 +19,25 @@ import argparse
 import json
 import os
 import sys
+import time
 
-from p4.config.v1 import p4info_pb2
+from . import helper
+from .error_utils import printBatchErrors
+from .json_stream import iterJsonMembers
+from .lazy import lazyImport
 
-from . import bmv2, helper
+bmv2 = lazyImport('.bmv2', __package__)
+entry_builder = lazyImport('.entry_builder', __package__)
+p4info_pb2 = lazyImport('p4.config.v1.p4info_pb2')
+p4runtime_pb2 = lazyImport('p4.v1.p4runtime_pb2')
+wire = lazyImport('.wire', __package__)
+
+
+# Runtime JSON lists of entries, parsed incrementally with --stream
+ENTRY_KEYS = ('table_entries', 'multicast_group_entries', 'clone_session_entries')
+# Updates per write and entries between two progress messages with --stream
+STREAM_BATCH_SIZE = 500
+PROGRESS_INTERVAL = 10000
 
 
 def error(msg):
@@ -54,6 +69,10 @@ def main():
     parser.add_argument("-c", '--runtime-conf-file',
                         help="path to input runtime configuration file (JSON)",
                         type=str, action="store", required=True)
+    parser.add_argument('--stream',
+                        help='parse the entries of the runtime configuration file incrementally '
+                             'and write them in batches, for very large files',
+                        action="store_true", default=False)
 
     args = parser.parse_args()
 
@@ -65,7 +84,9 @@ def main():
                        device_id=args.device_id,
                        sw_conf_file=sw_conf_file,
                        workdir=workdir,
-                       proto_dump_fpath=args.proto_dump_file)
+                       proto_dump_fpath=args.proto_dump_file,
+                       runtime_json=args.runtime_conf_file,
+                       stream=args.stream)
 
 
 def check_switch_conf(sw_conf, workdir):
@@ -100,7 +121,11 @@ def check_switch_conf(sw_conf, workdir):
                     raise InvalidFileContentException(f"Invalid JSON content in {real_path}: {e}")
 
 
-def program_switch(addr, device_id, sw_conf_file, workdir, proto_dump_fpath, runtime_json):
+def program_switch(addr, device_id, sw_conf_file, workdir, proto_dump_fpath, runtime_json,
+                   stream=False):
+    if stream:
+        return program_switch_streaming(addr, device_id, sw_conf_file, workdir,
+                                        proto_dump_fpath, runtime_json)
     sw_conf = json_load_byteified(sw_conf_file)
     try:
         check_switch_conf(sw_conf=sw_conf, workdir=workdir)
@@ -108,9 +133,49 @@ def program_switch(addr, device_id, sw_conf_file, workdir, proto_dump_fpath, run
         error("While parsing input runtime configuration: %s" % str(e))
         return
 
+    p4info_helper, sw = connect_switch(addr, device_id, sw_conf, workdir, proto_dump_fpath)
+    try:
+        if 'table_entries' in sw_conf:
+            table_entries = sw_conf['table_entries']
+            info("Inserting %d table entries..." % len(table_entries))
+            updates = []
+            for entry in table_entries:
+                info(tableEntryToString(entry))
+                validateTableEntry(entry, p4info_helper, runtime_json)
+                updates.append(tableEntryUpdate(entry, p4info_helper))
+            writeUpdates(sw, updates, "table")
+
+        if 'multicast_group_entries' in sw_conf:
+            group_entries = sw_conf['multicast_group_entries']
+            info("Inserting %d group entries..." % len(group_entries))
+            updates = []
+            for entry in group_entries:
+                info(groupEntryToString(entry))
+                updates.append((p4runtime_pb2.Update.INSERT,
+                                multicastGroupEntry(entry, p4info_helper)))
+            writeUpdates(sw, updates, "group")
+
+        if 'clone_session_entries' in sw_conf:
+            clone_entries = sw_conf['clone_session_entries']
+            info("Inserting %d clone entries..." % len(clone_entries))
+            updates = []
+            for entry in clone_entries:
+                info(cloneEntryToString(entry))
+                updates.append((p4runtime_pb2.Update.INSERT,
+                                cloneSessionEntry(entry, p4info_helper)))
+            writeUpdates(sw, updates, "clone")
+
+    finally:
+        sw.shutdown()
+
+
+def connect_switch(addr, device_id, sw_conf, workdir, proto_dump_fpath, p4info_helper=None):
+    """Loads the p4info of a checked switch configuration (unless given),
+    connects to the switch and sets its pipeline. Returns (p4info_helper, sw)."""
     info('Using P4Info file %s...' % sw_conf['p4info'])
-    p4info_fpath = os.path.join(workdir, sw_conf['p4info'])
-    p4info_helper = helper.P4InfoHelper(p4info_fpath)
+    if p4info_helper is None:
+        p4info_fpath = os.path.join(workdir, sw_conf['p4info'])
+        p4info_helper = helper.P4InfoHelper(p4info_fpath)
 
     target = sw_conf['target']
 
@@ -132,31 +197,171 @@ def program_switch(addr, device_id, sw_conf_file, workdir, proto_dump_fpath, run
                                            bmv2_json_file_path=bmv2_json_fpath)
         else:
             raise Exception("Should not be here")
-
-        if 'table_entries' in sw_conf:
-            table_entries = sw_conf['table_entries']
-            info("Inserting %d table entries..." % len(table_entries))
-            for entry in table_entries:
-                info(tableEntryToString(entry))
-                validateTableEntry(entry, p4info_helper, runtime_json)
-                insertTableEntry(sw, entry, p4info_helper)
-
-        if 'multicast_group_entries' in sw_conf:
-            group_entries = sw_conf['multicast_group_entries']
-            info("Inserting %d group entries..." % len(group_entries))
-            for entry in group_entries:
-                info(groupEntryToString(entry))
-                insertMulticastGroupEntry(sw, entry, p4info_helper)
-
-        if 'clone_session_entries' in sw_conf:
-            clone_entries = sw_conf['clone_session_entries']
-            info("Inserting %d clone entries..." % len(clone_entries))
-            for entry in clone_entries:
-                info(cloneEntryToString(entry))
-                insertCloneGroupEntry(sw, entry, p4info_helper)
-
-    finally:
+    except BaseException:
         sw.shutdown()
+        raise
+    return p4info_helper, sw
+
+
+def program_switch_streaming(addr, device_id, sw_conf_file, workdir, proto_dump_fpath,
+                             runtime_json):
+    """Same as program_switch, for runtime configuration files too large to
+    load at once.
+
+    The entry lists are parsed one entry at a time and written in batches
+    of serialized updates as they are read, with a progress message every
+    PROGRESS_INTERVAL entries instead of one line per entry, so memory use
+    does not depend on the number of entries. The switch is set up as soon
+    as the settings preceding the first entry list are complete; lists
+    found before that are read again from the start of the file afterwards.
+    """
+    sw_conf = {}
+    sw = None
+    deferred = []
+    try:
+        for key, value in iterJsonMembers(sw_conf_file, stream_keys=ENTRY_KEYS):
+            if key not in ENTRY_KEYS:
+                sw_conf[key] = value
+                continue
+            if sw is None:
+                try:
+                    check_switch_conf(sw_conf=sw_conf, workdir=workdir)
+                except ConfException:
+                    deferred.append(key)
+                    continue
+                p4info_helper, sw = connect_switch(addr, device_id, sw_conf, workdir,
+                                                   proto_dump_fpath)
+                entry_compiler = TableEntryCompiler(p4info_helper, runtime_json)
+            streamEntries(sw, key, value, p4info_helper, entry_compiler)
+
+        if sw is None:
+            try:
+                check_switch_conf(sw_conf=sw_conf, workdir=workdir)
+            except ConfException as e:
+                error("While parsing input runtime configuration: %s" % str(e))
+                return
+            p4info_helper, sw = connect_switch(addr, device_id, sw_conf, workdir,
+                                               proto_dump_fpath)
+            entry_compiler = TableEntryCompiler(p4info_helper, runtime_json)
+        if deferred:
+            sw_conf_file.seek(0)
+            for key, value in iterJsonMembers(sw_conf_file, stream_keys=ENTRY_KEYS):
+                if key in deferred:
+                    streamEntries(sw, key, value, p4info_helper, entry_compiler)
+    finally:
+        if sw is not None:
+            sw.shutdown()
+
+
+def streamEntries(sw, key, entries, p4info_helper, entry_compiler):
+    """Writes the entries of runtime JSON list `key` in batches of serialized
+    updates (see SwitchConnection.WriteEncodedUpdates)"""
+    kind = key.split('_')[0]
+    info("Inserting %s entries..." % kind)
+    start = time.perf_counter()
+    count = 0
+    failures = []
+    batch = []
+    for encoded_update in encodedEntryUpdates(key, entries, p4info_helper, entry_compiler):
+        batch.append(encoded_update)
+        if len(batch) == STREAM_BATCH_SIZE:
+            failures += [(count + idx, e) for idx, e in sw.WriteEncodedUpdates(batch)]
+            count += len(batch)
+            batch = []
+            if count % PROGRESS_INTERVAL == 0:
+                info("%d %s entries written..." % (count, kind))
+    if batch:
+        failures += [(count + idx, e) for idx, e in sw.WriteEncodedUpdates(batch)]
+        count += len(batch)
+    info("Inserted %d %s entries in %.1fs" % (
+        count - len(failures), kind, time.perf_counter() - start))
+    if failures:
+        error("%d of %d %s entries could not be written" % (len(failures), count, kind))
+        printBatchErrors(failures)
+
+
+def encodedEntryUpdates(key, entries, p4info_helper, entry_compiler):
+    """Yields the serialized Updates of the entries of runtime JSON list `key`"""
+    for entry in entries:
+        if key == 'table_entries':
+            yield entry_compiler.encodedUpdate(entry)
+            continue
+        if key == 'multicast_group_entries':
+            pre_entry = p4info_helper.buildMulticastGroupEntry(
+                entry["multicast_group_id"], entry['replicas'])
+        else:
+            pre_entry = p4info_helper.buildCloneSessionEntry(
+                entry['clone_session_id'], entry['replicas'],
+                entry.get('packet_length_bytes', 0))
+        yield wire.encodeUpdate(p4runtime_pb2.Update.INSERT, wire.encodeEntity(pre_entry))
+
+
+class TableEntryCompiler(object):
+    """Validates and serializes runtime JSON table entries.
+
+    The match fields requiring a priority are computed once per table, and
+    entries are serialized by a CompiledTableEntry per (table, action, match
+    fields, params), falling back to buildTableEntry for default actions
+    and match types compiled builders do not handle.
+    """
+
+    def __init__(self, p4info_helper, runtime_json):
+        self.p4info_helper = p4info_helper
+        self.runtime_json = runtime_json
+        # table name -> names of its match fields requiring a priority
+        self.priority_fields = {}
+        # (table, action, match field names, param names) -> builder or None
+        self.builders = {}
+
+    def validate(self, flow):
+        """Same check as validateTableEntry"""
+        table_name = flow['table']
+        match_fields = flow.get('match')
+        priority = flow.get('priority')
+        if match_fields is None or priority:
+            return
+        priority_fields = self.priority_fields.get(table_name)
+        if priority_fields is None:
+            match_types_with_priority = [
+                p4info_pb2.MatchField.TERNARY,
+                p4info_pb2.MatchField.RANGE,
+                p4info_pb2.MatchField.OPTIONAL
+            ]
+            table = self.p4info_helper.get('tables', name=table_name)
+            priority_fields = self.priority_fields[table_name] = frozenset(
+                mf.name for mf in table.match_fields
+                if mf.match_type in match_types_with_priority)
+        if not priority_fields.isdisjoint(match_fields):
+            raise AssertionError(
+                "non-zero 'priority' field is required for all entries for table {} in {}"
+                .format(table_name, self.runtime_json)
+            )
+
+    def encodedUpdate(self, flow):
+        """Returns the serialized Update of a runtime JSON entry, the same
+        as tableEntryUpdate's"""
+        self.validate(flow)
+        if flow.get('default_action'):
+            return self._encodeMessage(flow)
+        match_fields = flow.get('match') or {}
+        action_params = flow['action_params'] or {}
+        key = (flow['table'], flow['action_name'], tuple(match_fields), tuple(action_params))
+        build = self.builders.get(key, False)
+        if build is False:
+            try:
+                build = self.p4info_helper.compile_entry(*key)
+            except entry_builder.UnsupportedMatchType:
+                build = None
+            self.builders[key] = build
+        if build is None:
+            return self._encodeMessage(flow)
+        values = list(match_fields.values()) + list(action_params.values())
+        return wire.encodeUpdate(p4runtime_pb2.Update.INSERT,
+                                 build.encodeEntity(*values, priority=flow.get('priority')))
+
+    def _encodeMessage(self, flow):
+        update_type, table_entry = tableEntryUpdate(flow, self.p4info_helper)
+        return wire.encodeUpdate(update_type, wire.encodeEntity(table_entry))
 
 
 def validateTableEntry(flow, p4info_helper, runtime_json):
@@ -180,7 +385,15 @@ def validateTableEntry(flow, p4info_helper, runtime_json):
                 )
 
 
-def insertTableEntry(sw, flow, p4info_helper):
+def writeUpdates(sw, updates, kind):
+    failures = sw.WriteUpdates(updates)
+    if failures:
+        error("%d of %d %s entries could not be written" % (
+            len(failures), len(updates), kind))
+        printBatchErrors(failures)
+
+
+def tableEntryUpdate(flow, p4info_helper):
     table_name = flow['table']
     match_fields = flow.get('match') # None if not found
     action_name = flow['action_name']
@@ -196,6 +409,14 @@ def insertTableEntry(sw, flow, p4info_helper):
         action_params=action_params,
         priority=priority)
 
+    # The default entry always exists, so it can only be modified
+    if table_entry.is_default_action:
+        return (p4runtime_pb2.Update.MODIFY, table_entry)
+    return (p4runtime_pb2.Update.INSERT, table_entry)
+
+
+def insertTableEntry(sw, flow, p4info_helper):
+    _, table_entry = tableEntryUpdate(flow, p4info_helper)
     sw.WriteTableEntry(table_entry)
 
 
@@ -253,14 +474,18 @@ def cloneEntryToString(rule):
     ports_str = ', '.join(replicas)
     return 'Clone Session {0} => ({1}) ({2})'.format(clone_id, ports_str, packet_length_bytes)
 
+def multicastGroupEntry(rule, p4info_helper):
+    return p4info_helper.buildMulticastGroupEntry(rule["multicast_group_id"], rule['replicas'])
+
+def cloneSessionEntry(rule, p4info_helper):
+    return p4info_helper.buildCloneSessionEntry(rule['clone_session_id'], rule['replicas'],
+                                                rule.get('packet_length_bytes', 0))
+
 def insertMulticastGroupEntry(sw, rule, p4info_helper):
-    mc_entry = p4info_helper.buildMulticastGroupEntry(rule["multicast_group_id"], rule['replicas'])
-    sw.WritePREEntry(mc_entry)
+    sw.WritePREEntry(multicastGroupEntry(rule, p4info_helper))
 
 def insertCloneGroupEntry(sw, rule, p4info_helper):
-    clone_entry = p4info_helper.buildCloneSessionEntry(rule['clone_session_id'], rule['replicas'],
-                                                       rule.get('packet_length_bytes', 0))
-    sw.WritePREEntry(clone_entry)
+    sw.WritePREEntry(cloneSessionEntry(rule, p4info_helper))
 
 
 if __name__ == '__main__':
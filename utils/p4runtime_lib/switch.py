@@ -13,17 +13,35 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import hashlib
 from abc import abstractmethod
+from collections import deque
 from datetime import datetime
-from queue import Queue
+from queue import Empty, Queue
 import threading
 
 import grpc
-from p4.tmp import p4config_pb2
 from p4.v1 import p4runtime_pb2, p4runtime_pb2_grpc
 
+from .error_utils import parseGrpcErrorBinaryDetails
+from .keys import entityKey
+from .lazy import lazyImport
+from .request_log import BinaryRequestLogger, requestType
+from .shadow import ShadowTables
+from .wire import (batchEncodedWriteRequests, encodeSetPipelineConfigRequest,
+                   encodeWriteRequestHeader)
+
+counters = lazyImport('.counters', __package__)
+p4config_pb2 = lazyImport('p4.tmp.p4config_pb2')
+
 MSG_LOG_MAX_LEN = 1024
 
+# Maximum number of updates packed into a single WriteRequest by WriteUpdates
+MAX_WRITE_BATCH_SIZE = 500
+
+# Default number of Write RPCs a WritePipeline keeps in flight
+WRITE_PIPELINE_WINDOW = 8
+
 # List of all active connections
 connections = []
 
@@ -31,6 +49,83 @@ def ShutdownAllSwitchConnections():
     for c in connections:
         c.shutdown()
 
+def setUpdateEntity(update, entity):
+    """Copies `entity` into the matching field of update.entity"""
+    if isinstance(entity, p4runtime_pb2.Entity):
+        update.entity.CopyFrom(entity)
+    elif isinstance(entity, p4runtime_pb2.TableEntry):
+        update.entity.table_entry.CopyFrom(entity)
+    elif isinstance(entity, p4runtime_pb2.PacketReplicationEngineEntry):
+        update.entity.packet_replication_engine_entry.CopyFrom(entity)
+    elif isinstance(entity, p4runtime_pb2.CounterEntry):
+        update.entity.counter_entry.CopyFrom(entity)
+    elif isinstance(entity, p4runtime_pb2.DirectCounterEntry):
+        update.entity.direct_counter_entry.CopyFrom(entity)
+    elif isinstance(entity, p4runtime_pb2.MeterEntry):
+        update.entity.meter_entry.CopyFrom(entity)
+    elif isinstance(entity, p4runtime_pb2.RegisterEntry):
+        update.entity.register_entry.CopyFrom(entity)
+    else:
+        raise TypeError("Cannot write entity of type %r" % type(entity))
+
+def batchWriteRequests(device_id, updates, max_batch_size=MAX_WRITE_BATCH_SIZE):
+    """Packs (update_type, entity) pairs into WriteRequests
+
+    Yields (offset, request) tuples where offset is the index in `updates`
+    of the first update carried by the request.
+    """
+    request = None
+    offset = 0
+    for index, (update_type, entity) in enumerate(updates):
+        if request is None:
+            request = p4runtime_pb2.WriteRequest()
+            request.device_id = device_id
+            request.election_id.low = 1
+            offset = index
+        update = request.updates.add()
+        update.type = update_type
+        setUpdateEntity(update, entity)
+        if len(request.updates) >= max_batch_size:
+            yield offset, request
+            request = None
+    if request is not None:
+        yield offset, request
+
+def pipelineCookie(p4info, p4_device_config):
+    """Content hash of a pipeline config, used as its ForwardingPipelineConfig cookie"""
+    digest = hashlib.sha256(p4info.SerializeToString(deterministic=True))
+    digest.update(p4_device_config)
+    return int.from_bytes(digest.digest()[:8], 'big')
+
+# Recently encoded ForwardingPipelineConfig messages as
+# (p4info, device_config, cookie, encoded_config) tuples, most recent last.
+PIPELINE_CONFIG_CACHE_SIZE = 4
+_pipeline_configs = []
+_pipeline_configs_lock = threading.Lock()
+
+def encodePipelineConfig(p4info, device_config):
+    """Returns the cookie and the serialized ForwardingPipelineConfig of a
+    p4info and device config
+
+    The config is built, serialized and hashed into the cookie only once per
+    (p4info, device_config) pair: switches sharing the same (cached)
+    messages get the same bytes back, to which each push only prepends its
+    device and election ids (see wire.encodeSetPipelineConfigRequest).
+    Neither input must be modified afterwards.
+    """
+    with _pipeline_configs_lock:
+        for cached_p4info, cached_device_config, cookie, encoded_config in _pipeline_configs:
+            if cached_p4info is p4info and cached_device_config is device_config:
+                return cookie, encoded_config
+        config = p4runtime_pb2.ForwardingPipelineConfig()
+        config.p4info.CopyFrom(p4info)
+        config.p4_device_config = device_config.SerializeToString()
+        cookie = config.cookie.cookie = pipelineCookie(config.p4info, config.p4_device_config)
+        encoded_config = config.SerializeToString()
+        _pipeline_configs.append((p4info, device_config, cookie, encoded_config))
+        del _pipeline_configs[:-PIPELINE_CONFIG_CACHE_SIZE]
+        return cookie, encoded_config
+
 class StreamDispatcher:
     def __init__(self, stream):
         self.stream = stream
@@ -65,16 +160,30 @@ class StreamDispatcher:
 class SwitchConnection(object):
 
     def __init__(self, name=None, address='127.0.0.1:50051', device_id=0,
-                 proto_dump_file=None):
+                 proto_dump_file=None, proto_dump_format='text', shadow=False):
         self.name = name
         self.address = address
         self.device_id = device_id
         self.p4info = None
+        # Entries written by this connection, see shadow.ShadowTables
+        self.shadow = ShadowTables() if shadow else None
         self.channel = grpc.insecure_channel(self.address)
+        self.raw_channel = self.channel
+        self.request_logger = None
         if proto_dump_file is not None:
-            interceptor = GrpcRequestLogger(proto_dump_file)
-            self.channel = grpc.intercept_channel(self.channel, interceptor)
+            self.request_logger = buildRequestLogger(proto_dump_file, proto_dump_format)
+            self.channel = grpc.intercept_channel(self.channel, self.request_logger)
         self.client_stub = p4runtime_pb2_grpc.P4RuntimeStub(self.channel)
+        # Write taking an already serialized WriteRequest, see wire.py
+        self.encoded_write = self.channel.unary_unary(
+            '/p4.v1.P4Runtime/Write',
+            request_serializer=None,
+            response_deserializer=p4runtime_pb2.WriteResponse.FromString)
+        # SetForwardingPipelineConfig taking an already serialized request
+        self.encoded_set_pipeline_config = self.channel.unary_unary(
+            '/p4.v1.P4Runtime/SetForwardingPipelineConfig',
+            request_serializer=None,
+            response_deserializer=p4runtime_pb2.SetForwardingPipelineConfigResponse.FromString)
         self.requests_stream = IterableQueue()
         self.stream_msg_resp = self.client_stub.StreamChannel(iter(self.requests_stream))
         self.dispatcher = StreamDispatcher(self.stream_msg_resp)
@@ -88,8 +197,18 @@ class SwitchConnection(object):
     def shutdown(self):
         self.requests_stream.close()
         self.dispatcher.stop() 
+        if self.request_logger is not None:
+            self.request_logger.close()
+
+    def WaitForChannelReady(self, timeout=None):
+        """Blocks until the gRPC channel is connected.
 
-    def MasterArbitrationUpdate(self, dry_run=False, **kwargs):
+        Raises grpc.FutureTimeoutError if the switch cannot be reached
+        within `timeout` seconds.
+        """
+        grpc.channel_ready_future(self.raw_channel).result(timeout=timeout)
+
+    def MasterArbitrationUpdate(self, dry_run=False, timeout=None, **kwargs):
         request = p4runtime_pb2.StreamMessageRequest()
         request.arbitration.device_id = self.device_id
         request.arbitration.election_id.high = 0
@@ -99,23 +218,64 @@ class SwitchConnection(object):
             print("P4Runtime MasterArbitrationUpdate: ", request)
         else:
             self.requests_stream.put(request)
-            return self.dispatcher.arbitration_queue.get()
-
-    def SetForwardingPipelineConfig(self, p4info, dry_run=False, **kwargs):
+            try:
+                return self.dispatcher.arbitration_queue.get(timeout=timeout)
+            except Empty:
+                raise TimeoutError("No arbitration response from %s after %ss"
+                                   % (self.address, timeout))
+
+    def SetForwardingPipelineConfig(self, p4info, dry_run=False, timeout=None,
+                                    skip_if_unchanged=False, **kwargs):
+        """Pushes the P4 program to the switch.
+
+        The config is stamped with a cookie derived from its content. With
+        skip_if_unchanged, the cookie currently installed on the switch is
+        read first and the push (which wipes all table state) is skipped
+        when it matches. Returns True if the config was pushed.
+        """
         device_config = self.buildDeviceConfig(**kwargs)
-        request = p4runtime_pb2.SetForwardingPipelineConfigRequest()
-        request.election_id.low = 1
+        cookie, encoded_config = encodePipelineConfig(p4info, device_config)
+        request = encodeSetPipelineConfigRequest(self.device_id, encoded_config)
+        if dry_run:
+            print("P4Runtime SetForwardingPipelineConfig:",
+                  p4runtime_pb2.SetForwardingPipelineConfigRequest.FromString(request))
+            return True
+        if skip_if_unchanged and self.GetPipelineCookie(timeout=timeout) == cookie:
+            return False
+        self.encoded_set_pipeline_config(request, timeout=timeout)
+        if self.shadow is not None:
+            # A new pipeline starts with empty tables
+            self.shadow.clear()
+        return True
+
+    def GetForwardingPipelineConfig(self, response_type=None, dry_run=False, timeout=None):
+        request = p4runtime_pb2.GetForwardingPipelineConfigRequest()
         request.device_id = self.device_id
-        config = request.config
-
-        config.p4info.CopyFrom(p4info)
-        config.p4_device_config = device_config.SerializeToString()
-
-        request.action = p4runtime_pb2.SetForwardingPipelineConfigRequest.VERIFY_AND_COMMIT
+        if response_type is None:
+            response_type = p4runtime_pb2.GetForwardingPipelineConfigRequest.ALL
+        request.response_type = response_type
         if dry_run:
-            print("P4Runtime SetForwardingPipelineConfig:", request)
+            print("P4Runtime GetForwardingPipelineConfig:", request)
         else:
-            self.client_stub.SetForwardingPipelineConfig(request)
+            return self.client_stub.GetForwardingPipelineConfig(request, timeout=timeout).config
+
+    def GetPipelineCookie(self, timeout=None):
+        """Returns the cookie of the installed pipeline, or None if the switch
+        has no pipeline or did not stamp one."""
+        try:
+            config = self.GetForwardingPipelineConfig(
+                p4runtime_pb2.GetForwardingPipelineConfigRequest.COOKIE_ONLY,
+                timeout=timeout)
+        except grpc.RpcError:
+            return None
+        if not config.HasField("cookie"):
+            return None
+        return config.cookie.cookie
+
+    def _write(self, request):
+        self.client_stub.Write(request)
+        if self.shadow is not None:
+            self.shadow.applyWriteRequest(request)
 
     def WriteTableEntry(self, table_entry, dry_run=False):
         request = p4runtime_pb2.WriteRequest()
@@ -130,7 +290,19 @@ class SwitchConnection(object):
         if dry_run:
             print("P4Runtime Write:", request)
         else:
-            self.client_stub.Write(request)
+            self._write(request)
+
+    def ModifyTableEntry(self, table_entry, dry_run=False):
+        request = p4runtime_pb2.WriteRequest()
+        request.device_id = self.device_id
+        request.election_id.low = 1
+        update = request.updates.add()
+        update.type = p4runtime_pb2.Update.MODIFY
+        update.entity.table_entry.CopyFrom(table_entry)
+        if dry_run:
+            print("P4Runtime Write:", request)
+        else:
+            self._write(request)
 
     def DeleteTableEntry(self, table_entry, dry_run=False):
         request = p4runtime_pb2.WriteRequest()
@@ -142,7 +314,89 @@ class SwitchConnection(object):
         if dry_run:
             print("P4Runtime Write:", request)
         else:
-            self.client_stub.Write(request)
+            self._write(request)
+
+    def WriteUpdates(self, updates, max_batch_size=MAX_WRITE_BATCH_SIZE, dry_run=False):
+        """Writes a list of (update_type, entity) pairs using as few
+        WriteRequests as possible.
+
+        Each WriteRequest carries at most max_batch_size updates. The entity
+        can be a p4runtime_pb2.Entity or any message that fits in one of its
+        fields (TableEntry, PacketReplicationEngineEntry, ...).
+
+        Returns a list of (index, p4.Error) tuples, one for every update that
+        the switch rejected, where index is the position of the update in
+        `updates`. A gRPC error without per-update details is re-raised.
+        """
+        failures = []
+        for offset, request in batchWriteRequests(self.device_id, updates, max_batch_size):
+            if dry_run:
+                print("P4Runtime Write:", request)
+                continue
+            try:
+                self._write(request)
+            except grpc.RpcError as e:
+                p4_errors = parseGrpcErrorBinaryDetails(e)
+                if p4_errors is None:
+                    raise
+                failures += [(offset + idx, p4_error) for idx, p4_error in p4_errors]
+                if self.shadow is not None:
+                    self.shadow.applyWriteRequest(request, {idx for idx, _ in p4_errors})
+        return failures
+
+    def WriteEncodedUpdates(self, encoded_updates, max_batch_size=MAX_WRITE_BATCH_SIZE,
+                            dry_run=False):
+        """Same as WriteUpdates, for updates serialized with wire.encodeUpdate.
+
+        The WriteRequests are assembled as bytes and sent without going
+        through protobuf messages. With a shadow, the requests are decoded
+        again to update it.
+        """
+        failures = []
+        for offset, request in batchEncodedWriteRequests(self.device_id, encoded_updates,
+                                                         max_batch_size):
+            failures += self._writeEncoded(request, offset, dry_run)
+        return failures
+
+    def WriteEncodedRequests(self, batches, dry_run=False):
+        """Writes pre-assembled batches of updates, given as (number of
+        updates, encoded updates field) pairs (see
+        wire.encodeWriteRequestUpdates). Only this connection's device and
+        election ids are prepended to each batch, so nothing is re-encoded.
+
+        Failures are returned as for WriteUpdates, indexed across all batches.
+        """
+        header = encodeWriteRequestHeader(self.device_id)
+        failures = []
+        offset = 0
+        for count, encoded_updates in batches:
+            failures += self._writeEncoded(header + encoded_updates, offset, dry_run)
+            offset += count
+        return failures
+
+    def _writeEncoded(self, request, offset, dry_run):
+        if dry_run:
+            print("P4Runtime Write:", p4runtime_pb2.WriteRequest.FromString(request))
+            return []
+        failures = []
+        failed_indices = ()
+        try:
+            self.encoded_write(request)
+        except grpc.RpcError as e:
+            p4_errors = parseGrpcErrorBinaryDetails(e)
+            if p4_errors is None:
+                raise
+            failures = [(offset + idx, p4_error) for idx, p4_error in p4_errors]
+            failed_indices = {idx for idx, _ in p4_errors}
+        if self.shadow is not None:
+            self.shadow.applyWriteRequest(p4runtime_pb2.WriteRequest.FromString(request),
+                                          failed_indices)
+        return failures
+
+    def OpenWritePipeline(self, window=WRITE_PIPELINE_WINDOW,
+                          max_batch_size=MAX_WRITE_BATCH_SIZE):
+        """Returns a WritePipeline that streams updates to this switch"""
+        return WritePipeline(self, window=window, max_batch_size=max_batch_size)
 
     def ReadTableEntries(self, table_id=None, dry_run=False):
         request = p4runtime_pb2.ReadRequest()
@@ -159,6 +413,18 @@ class SwitchConnection(object):
             for response in self.client_stub.Read(request):
                 yield response
 
+    def ReadEntities(self, entities, dry_run=False):
+        """Reads any list of p4runtime_pb2.Entity with a single ReadRequest
+        and yields the responses (see read_builder.ReadBuilder)"""
+        request = p4runtime_pb2.ReadRequest()
+        request.device_id = self.device_id
+        request.entities.extend(entities)
+        if dry_run:
+            print("P4Runtime Read:", request)
+        else:
+            for response in self.client_stub.Read(request):
+                yield response
+
     def ReadCounters(self, counter_id=None, index=None, dry_run=False):
         request = p4runtime_pb2.ReadRequest()
         request.device_id = self.device_id
@@ -176,6 +442,18 @@ class SwitchConnection(object):
             for response in self.client_stub.Read(request):
                 yield response
 
+    def ReadCounterArray(self, counter_id, size=None, dry_run=False):
+        """Reads every index of an indexed counter with a single wildcard
+        read. Returns counters.CounterArrays holding the packet and byte
+        counts as NumPy arrays indexed by counter index, of `size` cells
+        (default: the highest index read plus one)."""
+        responses = self.ReadCounters(counter_id, dry_run=dry_run)
+        if dry_run:
+            for _ in responses:
+                pass
+            return None
+        return counters.buildCounterArrays(counters.counterEntries(responses, counter_id), size)
+
     def WritePREEntry(self, pre_entry, dry_run=False):
         request = p4runtime_pb2.WriteRequest()
         request.device_id = self.device_id
@@ -186,7 +464,7 @@ class SwitchConnection(object):
         if dry_run:
             print("P4Runtime Write:", request)
         else:
-            self.client_stub.Write(request)
+            self._write(request)
 
     def PacketIn(self, dry_run=False):
         request = self.dispatcher.packet_in_queue.get()
@@ -219,6 +497,112 @@ class SwitchConnection(object):
             print("P4 Runtime PacketIn: ", msg)
         else:
             return msg
+
+
+class WritePipeline(object):
+    """Writes updates to a switch with several Write RPCs in flight.
+
+    Updates passed to add() are packed into WriteRequests of up to
+    max_batch_size updates, sent with Write.future(). At most `window`
+    requests are outstanding; add() blocks while the window is full. An
+    update touching the same entity (see keys.entityKey) as an earlier one
+    is only sent once the request carrying the earlier update completed, so
+    updates to one entity are applied in order.
+
+    Failures are collected as (index, error) tuples, where index counts the
+    updates passed to add() and error is the p4.Error of that update, or the
+    grpc.RpcError of its request when the switch gave no per-update details.
+
+        with sw.OpenWritePipeline() as pipeline:
+            for table_entry in entries:
+                pipeline.add(p4runtime_pb2.Update.INSERT, table_entry)
+        failures = pipeline.failures
+    """
+
+    def __init__(self, connection, window=WRITE_PIPELINE_WINDOW,
+                 max_batch_size=MAX_WRITE_BATCH_SIZE):
+        self.connection = connection
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.failures = []
+        self.count = 0
+        # Updates not sent yet and the keys they touch
+        self.batch = []
+        self.batch_keys = set()
+        # (sequence number, offset, request, future, keys) of each request in flight
+        self.in_flight = deque()
+        # Sequence number of the last request in flight touching each key
+        self.in_flight_keys = {}
+        self.sent = 0
+        self.completed = 0
+
+    def add(self, update_type, entity):
+        key = entityKey(entity)
+        if key in self.batch_keys:
+            # Both updates cannot be in the same request: a switch is free to
+            # apply the updates of one batch in any order
+            self._send()
+        self.batch.append((update_type, entity))
+        self.batch_keys.add(key)
+        self.count += 1
+        if len(self.batch) >= self.max_batch_size:
+            self._send()
+
+    def flush(self):
+        """Sends pending updates and waits for all requests to complete.
+        Returns the failures collected so far."""
+        self._send()
+        while self.in_flight:
+            self._complete_oldest()
+        return self.failures
+
+    def _send(self):
+        if not self.batch:
+            return
+        # Wait for requests touching the same entities as this batch
+        last_conflict = max((self.in_flight_keys.get(key, 0) for key in self.batch_keys), default=0)
+        while self.completed < last_conflict:
+            self._complete_oldest()
+        while len(self.in_flight) >= self.window:
+            self._complete_oldest()
+
+        offset = self.count - len(self.batch)
+        _, request = next(batchWriteRequests(self.connection.device_id, self.batch,
+                                             len(self.batch)))
+        future = self.connection.client_stub.Write.future(request)
+        self.sent += 1
+        for key in self.batch_keys:
+            self.in_flight_keys[key] = self.sent
+        self.in_flight.append((self.sent, offset, request, future, self.batch_keys))
+        self.batch = []
+        self.batch_keys = set()
+
+    def _complete_oldest(self):
+        seq, offset, request, future, keys = self.in_flight.popleft()
+        shadow = self.connection.shadow
+        try:
+            future.result()
+            if shadow is not None:
+                shadow.applyWriteRequest(request)
+        except grpc.RpcError as e:
+            p4_errors = parseGrpcErrorBinaryDetails(e)
+            if p4_errors is None:
+                self.failures += [(offset + idx, e) for idx in range(len(request.updates))]
+            else:
+                self.failures += [(offset + idx, p4_error) for idx, p4_error in p4_errors]
+                if shadow is not None:
+                    shadow.applyWriteRequest(request, {idx for idx, _ in p4_errors})
+        self.completed = seq
+        for key in keys:
+            if self.in_flight_keys.get(key) == seq:
+                del self.in_flight_keys[key]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
 class GrpcRequestLogger(grpc.UnaryUnaryClientInterceptor,
                         grpc.UnaryStreamClientInterceptor):
     """Implementation of a gRPC interceptor that logs request to a file"""
@@ -232,14 +616,25 @@ class GrpcRequestLogger(grpc.UnaryUnaryClientInterceptor,
     def log_message(self, method_name, body):
         with open(self.log_file, 'a') as f:
             ts = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-            msg = str(body)
             f.write("\n[%s] %s\n---\n" % (ts, method_name))
-            if len(msg) < MSG_LOG_MAX_LEN:
-                f.write(str(body))
+            # The text format is never shorter than the serialized message, so
+            # large batches are skipped without formatting them
+            size = len(body) if isinstance(body, bytes) else body.ByteSize()
+            if size < MSG_LOG_MAX_LEN:
+                if isinstance(body, bytes):
+                    # Request sent already serialized
+                    body = requestType(method_name).FromString(body)
+                msg = str(body)
+                size = len(msg)
+            if size < MSG_LOG_MAX_LEN:
+                f.write(msg)
             else:
-                f.write("Message too long (%d bytes)! Skipping log...\n" % len(msg))
+                f.write("Message too long (%d bytes)! Skipping log...\n" % size)
             f.write('---\n')
 
+    def close(self):
+        pass
+
     def intercept_unary_unary(self, continuation, client_call_details, request):
         self.log_message(client_call_details.method, request)
         return continuation(client_call_details, request)
@@ -248,6 +643,14 @@ class GrpcRequestLogger(grpc.UnaryUnaryClientInterceptor,
         self.log_message(client_call_details.method, request)
         return continuation(client_call_details, request)
 
+def buildRequestLogger(proto_dump_file, proto_dump_format='text'):
+    """Returns the request logger for a proto_dump_format ('text' or 'binary')"""
+    if proto_dump_format == 'text':
+        return GrpcRequestLogger(proto_dump_file)
+    elif proto_dump_format == 'binary':
+        return BinaryRequestLogger(proto_dump_file)
+    raise ValueError("Unknown proto dump format %r" % proto_dump_format)
+
 class IterableQueue(Queue):
     _sentinel = object()
 
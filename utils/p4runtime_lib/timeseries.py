@@ -0,0 +1,259 @@
+# SPDX-License-Identifier: Apache-2.0
+'''
+Append-only store of counter samples in memory-mapped segment files.
+
+Each sample is a fixed-width record (timestamp, counter_id, packets, bytes)
+of RECORD_DTYPE. Records are appended, in non-decreasing timestamp order, to
+segment files of a fixed capacity which are mapped in memory; when a
+segment is full the writer rotates to a new one, and drops the oldest
+segments beyond max_segments, so the disk space used is bounded:
+
+    writer = TimeSeriesWriter('logs/link_stats', segment_records=65536, max_segments=16)
+    writer.append(time.time(), [100, 200], [packets_100, packets_200], [bytes_100, bytes_200])
+    writer.close()
+
+    reader = TimeSeriesReader('logs/link_stats')
+    records = reader.range(start, end)              # NumPy array of RECORD_DTYPE
+    records['packets'][records['counter_id'] == 100]
+
+Segments are named <name>-<sequence>.seg. A segment starts with
+TIMESERIES_MAGIC and the number of records written (little-endian uint64),
+which the writer updates after the records themselves, followed by the
+records. The reader maps each segment with np.memmap and finds time ranges
+by binary search on the timestamps; a range within one segment is a view
+of the file, not a copy.
+
+    python3 -m p4runtime_lib.timeseries logs/link_stats --counter 100
+'''
+import argparse
+import glob
+import mmap
+import os
+import re
+import struct
+from datetime import datetime
+
+import numpy as np
+
+TIMESERIES_MAGIC = b'P4TSEG01'
+DEFAULT_SEGMENT_RECORDS = 1 << 16
+
+RECORD_DTYPE = np.dtype([('timestamp', '<f8'), ('counter_id', '<u4'),
+                         ('packets', '<u8'), ('bytes', '<u8')])
+
+_COUNT = struct.Struct('<Q')
+_HEADER_SIZE = len(TIMESERIES_MAGIC) + _COUNT.size
+
+
+def segmentPaths(directory, name='stats'):
+    """Paths of the segments of a store, oldest first"""
+    pattern = re.compile(re.escape(name) + r'-(\d+)\.seg$')
+    segments = []
+    for path in glob.glob(os.path.join(glob.escape(directory), name + '-*.seg')):
+        match = pattern.search(os.path.basename(path))
+        if match:
+            segments.append((int(match.group(1)), path))
+    return [path for _, path in sorted(segments)]
+
+
+def _readCount(f, path):
+    header = f.read(_HEADER_SIZE)
+    if len(header) < _HEADER_SIZE or not header.startswith(TIMESERIES_MAGIC):
+        raise ValueError("%s is not a time series segment" % path)
+    return _COUNT.unpack_from(header, len(TIMESERIES_MAGIC))[0]
+
+
+class _Segment(object):
+    """A segment file mapped for appending"""
+
+    def __init__(self, path, capacity=None):
+        self.path = path
+        if capacity is not None:
+            with open(path, 'xb') as f:
+                f.write(TIMESERIES_MAGIC + _COUNT.pack(0))
+                f.truncate(_HEADER_SIZE + capacity * RECORD_DTYPE.itemsize)
+        self.file = open(path, 'r+b')
+        self.count = _readCount(self.file, path)
+        size = os.fstat(self.file.fileno()).st_size
+        self.capacity = (size - _HEADER_SIZE) // RECORD_DTYPE.itemsize
+        self.mmap = mmap.mmap(self.file.fileno(), size)
+        self.records = np.ndarray((self.capacity,), dtype=RECORD_DTYPE,
+                                  buffer=self.mmap, offset=_HEADER_SIZE)
+
+    def lastTimestamp(self):
+        return self.records['timestamp'][self.count - 1] if self.count else None
+
+    def append(self, records):
+        """Appends as many records as fit, returns how many did"""
+        n = min(len(records), self.capacity - self.count)
+        self.records[self.count:self.count + n] = records[:n]
+        self.count += n
+        # The count is written last, so readers never see partial records
+        _COUNT.pack_into(self.mmap, len(TIMESERIES_MAGIC), self.count)
+        return n
+
+    def flush(self):
+        self.mmap.flush()
+
+    def close(self):
+        self.flush()
+        # The array must be released before the mapping can be closed
+        self.records = None
+        self.mmap.close()
+        self.file.close()
+
+
+class TimeSeriesWriter(object):
+    """Appends counter samples to the segments of a store, continuing the
+    last segment of an existing store"""
+
+    def __init__(self, directory, name='stats', segment_records=DEFAULT_SEGMENT_RECORDS,
+                 max_segments=None):
+        self.directory = directory
+        self.name = name
+        self.segment_records = segment_records
+        self.max_segments = max_segments
+        os.makedirs(directory, exist_ok=True)
+        segments = segmentPaths(directory, name)
+        self.segment = None
+        if segments:
+            self.sequence = self._sequence(segments[-1])
+            segment = _Segment(segments[-1])
+            if segment.count < segment.capacity:
+                self.segment = segment
+            else:
+                segment.close()
+        else:
+            self.sequence = -1
+        self.last_timestamp = self.segment.lastTimestamp() if self.segment else None
+
+    def _sequence(self, path):
+        return int(os.path.basename(path)[len(self.name) + 1:-len('.seg')])
+
+    def _rotate(self):
+        if self.segment is not None:
+            self.segment.close()
+        self.sequence += 1
+        path = os.path.join(self.directory, '%s-%06d.seg' % (self.name, self.sequence))
+        self.segment = _Segment(path, capacity=self.segment_records)
+        if self.max_segments is not None:
+            for old_path in segmentPaths(self.directory, self.name)[:-self.max_segments]:
+                os.remove(old_path)
+
+    def append(self, timestamp, counter_ids, packets, byte_counts):
+        """Appends one record per counter id, all at `timestamp` (seconds
+        since the epoch). Timestamps must not decrease."""
+        if self.last_timestamp is not None and timestamp < self.last_timestamp:
+            raise ValueError("Timestamp %f is older than the last one recorded (%f)" % (
+                timestamp, self.last_timestamp))
+        records = np.empty(len(counter_ids), dtype=RECORD_DTYPE)
+        records['timestamp'] = timestamp
+        records['counter_id'] = counter_ids
+        records['packets'] = packets
+        records['bytes'] = byte_counts
+        self.appendRecords(records)
+
+    def appendRecords(self, records):
+        """Appends an array of RECORD_DTYPE records, sorted by timestamp"""
+        if not len(records):
+            return
+        while len(records):
+            if self.segment is None or self.segment.count == self.segment.capacity:
+                self._rotate()
+            records = records[self.segment.append(records):]
+        self.last_timestamp = self.segment.lastTimestamp()
+
+    def flush(self):
+        if self.segment is not None:
+            self.segment.flush()
+
+    def close(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TimeSeriesReader(object):
+    """Reads the records of a store; the segments are listed and their
+    record counts read when the reader is created or refresh()ed"""
+
+    def __init__(self, directory, name='stats'):
+        self.directory = directory
+        self.name = name
+        self.refresh()
+
+    def refresh(self):
+        """Picks up the records and segments written since"""
+        self.segments = []
+        for path in segmentPaths(self.directory, self.name):
+            try:
+                with open(path, 'rb') as f:
+                    count = _readCount(f, path)
+            except FileNotFoundError:
+                # Removed by a rotation meanwhile
+                continue
+            if count:
+                self.segments.append(np.memmap(path, dtype=RECORD_DTYPE, mode='r',
+                                               offset=_HEADER_SIZE, shape=(count,)))
+
+    def __len__(self):
+        return sum(len(records) for records in self.segments)
+
+    def iterRange(self, start=None, end=None):
+        """Yields, for each segment, the view of its records with start <=
+        timestamp < end (either bound may be None)"""
+        for records in self.segments:
+            timestamps = records['timestamp']
+            if start is not None and timestamps[-1] < start:
+                continue
+            if end is not None and timestamps[0] >= end:
+                break
+            first = 0 if start is None else np.searchsorted(timestamps, start, side='left')
+            last = len(records) if end is None else np.searchsorted(timestamps, end, side='left')
+            if first < last:
+                yield records[first:last]
+
+    def range(self, start=None, end=None, counter_id=None):
+        """Returns the records with start <= timestamp < end. The array is a
+        view of the file when they all are in one segment and counter_id
+        (which selects the records of one counter) is not given."""
+        parts = list(self.iterRange(start, end))
+        if not parts:
+            records = np.empty(0, dtype=RECORD_DTYPE)
+        elif len(parts) == 1:
+            records = parts[0]
+        else:
+            records = np.concatenate(parts)
+        if counter_id is not None:
+            records = records[records['counter_id'] == counter_id]
+        return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print the records of a counter time series store')
+    parser.add_argument('directory', help='directory of the store')
+    parser.add_argument('--name', help='name of the store (default: stats)',
+                        type=str, action="store", default='stats')
+    parser.add_argument('--counter', help='only print the records of this counter id',
+                        type=int, action="store", default=None)
+    parser.add_argument('--start', help='first timestamp (seconds since the epoch)',
+                        type=float, action="store", default=None)
+    parser.add_argument('--end', help='timestamp to stop at (seconds since the epoch)',
+                        type=float, action="store", default=None)
+    args = parser.parse_args()
+
+    reader = TimeSeriesReader(args.directory, args.name)
+    records = reader.range(args.start, args.end, args.counter)
+    for timestamp, counter_id, packets, byte_count in records.tolist():
+        print("%s %d %d %d" % (datetime.fromtimestamp(timestamp).isoformat(sep=' '),
+                               counter_id, packets, byte_count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+# SPDX-License-Identifier: Apache-2.0
+'''
+Wire-level assembly of P4Runtime WriteRequests.
+
+Building a WriteRequest with the protobuf API deep-copies every entity into
+the request (update.entity.table_entry.CopyFrom(...)) before the request is
+serialized again. For large deploys, the entities can instead be serialized
+once and the request bytes built by concatenating length-delimited fields:
+
+    encoded = [encodeUpdate(p4runtime_pb2.Update.INSERT, encodeEntity(te))
+               for te in table_entries]
+    failures = sw.WriteEncodedUpdates(encoded)
+
+Encoded updates are plain bytes and can be kept and written again, e.g. to
+several switches. The same goes for pipeline configs, which are large
+(the whole BMv2 JSON): encodeSetPipelineConfigRequest wraps one serialized
+ForwardingPipelineConfig in the request of each switch. Field numbers are
+taken from the message descriptors.
+'''
+from p4.v1 import p4runtime_pb2
+
+_WIRETYPE_VARINT = 0
+_WIRETYPE_LENGTH_DELIMITED = 2
+
+
+def fieldNumber(message_class, field_name):
+    """Number of a field, taken from the message descriptor"""
+    return message_class.DESCRIPTOR.fields_by_name[field_name].number
+
+
+def encodeVarint(value):
+    """Encodes a non-negative integer as a protobuf base 128 varint"""
+    if value < 0x80:
+        return bytes((value,))
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def encodeTag(field_number, wire_type):
+    return encodeVarint((field_number << 3) | wire_type)
+
+
+def encodeVarintField(field_number, value):
+    return encodeTag(field_number, _WIRETYPE_VARINT) + encodeVarint(value)
+
+
+def encodeLengthDelimited(field_number, payload):
+    """Encodes bytes, a string or an embedded message (given serialized)"""
+    return (encodeTag(field_number, _WIRETYPE_LENGTH_DELIMITED)
+            + encodeVarint(len(payload)) + payload)
+
+
+_WRITE_REQUEST_DEVICE_ID = fieldNumber(p4runtime_pb2.WriteRequest, 'device_id')
+_WRITE_REQUEST_ELECTION_ID = fieldNumber(p4runtime_pb2.WriteRequest, 'election_id')
+_WRITE_REQUEST_UPDATES = fieldNumber(p4runtime_pb2.WriteRequest, 'updates')
+_UINT128_HIGH = fieldNumber(p4runtime_pb2.Uint128, 'high')
+_UINT128_LOW = fieldNumber(p4runtime_pb2.Uint128, 'low')
+_UPDATE_TYPE = fieldNumber(p4runtime_pb2.Update, 'type')
+_UPDATE_ENTITY = fieldNumber(p4runtime_pb2.Update, 'entity')
+_SET_PIPELINE_DEVICE_ID = fieldNumber(p4runtime_pb2.SetForwardingPipelineConfigRequest,
+                                      'device_id')
+_SET_PIPELINE_ELECTION_ID = fieldNumber(p4runtime_pb2.SetForwardingPipelineConfigRequest,
+                                        'election_id')
+_SET_PIPELINE_ACTION = fieldNumber(p4runtime_pb2.SetForwardingPipelineConfigRequest, 'action')
+_SET_PIPELINE_CONFIG = fieldNumber(p4runtime_pb2.SetForwardingPipelineConfigRequest, 'config')
+
+# Field number in Entity of each message type it can hold
+_ENTITY_FIELDS = {field.message_type.full_name: field.number
+                  for field in p4runtime_pb2.Entity.DESCRIPTOR.fields}
+
+
+def encodeEntity(entity):
+    """Serializes a p4runtime_pb2.Entity, or any message fitting in one of
+    its fields (TableEntry, PacketReplicationEngineEntry...), as an Entity"""
+    full_name = entity.DESCRIPTOR.full_name
+    if full_name == p4runtime_pb2.Entity.DESCRIPTOR.full_name:
+        return entity.SerializeToString()
+    field_number = _ENTITY_FIELDS.get(full_name)
+    if field_number is None:
+        raise TypeError("Cannot write entity of type %r" % type(entity))
+    return encodeLengthDelimited(field_number, entity.SerializeToString())
+
+
+def encodeUpdate(update_type, encoded_entity):
+    """Returns the serialized Update of an entity encoded by encodeEntity"""
+    return (encodeVarintField(_UPDATE_TYPE, update_type)
+            + encodeLengthDelimited(_UPDATE_ENTITY, encoded_entity))
+
+
+def _encodeElectionId(field_number, election_id_low, election_id_high):
+    election_id = b''
+    if election_id_high:
+        election_id += encodeVarintField(_UINT128_HIGH, election_id_high)
+    if election_id_low:
+        election_id += encodeVarintField(_UINT128_LOW, election_id_low)
+    return encodeLengthDelimited(field_number, election_id)
+
+
+def encodeWriteRequestHeader(device_id, election_id_low=1, election_id_high=0):
+    """Returns the device and election id fields of a serialized
+    WriteRequest. Fields may come in any order, so a request is this header
+    followed by the output of encodeWriteRequestUpdates."""
+    return ((encodeVarintField(_WRITE_REQUEST_DEVICE_ID, device_id) if device_id else b'')
+            + _encodeElectionId(_WRITE_REQUEST_ELECTION_ID, election_id_low, election_id_high))
+
+
+def encodeWriteRequestUpdates(encoded_updates):
+    """Returns the updates field of a serialized WriteRequest"""
+    return b''.join([encodeLengthDelimited(_WRITE_REQUEST_UPDATES, update)
+                     for update in encoded_updates])
+
+
+def encodeWriteRequest(device_id, encoded_updates, election_id_low=1, election_id_high=0):
+    """Returns the serialized WriteRequest carrying the encoded updates"""
+    return (encodeWriteRequestHeader(device_id, election_id_low, election_id_high)
+            + encodeWriteRequestUpdates(encoded_updates))
+
+
+def batchEncodedWriteRequests(device_id, encoded_updates, max_batch_size):
+    """Like switch.batchWriteRequests, but for encoded updates: yields
+    (offset, serialized WriteRequest) tuples"""
+    if not isinstance(encoded_updates, (list, tuple)):
+        encoded_updates = list(encoded_updates)
+    for offset in range(0, len(encoded_updates), max_batch_size):
+        yield offset, encodeWriteRequest(
+            device_id, encoded_updates[offset:offset + max_batch_size])
+
+
+def encodeSetPipelineConfigRequest(device_id, encoded_config,
+                                   action=p4runtime_pb2.SetForwardingPipelineConfigRequest.VERIFY_AND_COMMIT,
+                                   election_id_low=1, election_id_high=0):
+    """Returns the serialized SetForwardingPipelineConfigRequest carrying a
+    serialized ForwardingPipelineConfig, which is copied once into the
+    request bytes"""
+    return b''.join([
+        encodeVarintField(_SET_PIPELINE_DEVICE_ID, device_id) if device_id else b'',
+        _encodeElectionId(_SET_PIPELINE_ELECTION_ID, election_id_low, election_id_high),
+        encodeVarintField(_SET_PIPELINE_ACTION, action),
+        encodeTag(_SET_PIPELINE_CONFIG, _WIRETYPE_LENGTH_DELIMITED),
+        encodeVarint(len(encoded_config)),
+        encoded_config,
+    ])
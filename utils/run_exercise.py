@@ -26,6 +26,7 @@ import os
 import subprocess
 from time import sleep
 
+import p4runtime_lib.compiled_runtime
 import p4runtime_lib.simple_controller
 from mininet.cli import CLI
 from mininet.link import TCLink
@@ -271,9 +272,22 @@ class ExerciseRunner:
         grpc_port = sw_obj.grpc_port
         device_id = sw_obj.device_id
         runtime_json = sw_dict['runtime_json']
+        outfile = '%s/%s-p4runtime-requests.txt' %(self.log_dir, sw_name)
+        pb_path = p4runtime_lib.compiled_runtime.compiledRuntimePath(runtime_json)
+        if os.path.exists(pb_path):
+            self.logger('Configuring switch %s using P4Runtime with precompiled file %s'
+                        % (sw_name, pb_path))
+            if p4runtime_lib.compiled_runtime.replayRuntimeConfig(
+                    addr='127.0.0.1:%d' % grpc_port,
+                    device_id=device_id,
+                    pb_path=pb_path,
+                    workdir=os.getcwd(),
+                    proto_dump_fpath=outfile,
+                    runtime_json=runtime_json):
+                return
+            self.logger('%s is out of date, falling back to %s' % (pb_path, runtime_json))
         self.logger('Configuring switch %s using P4Runtime with file %s' % (sw_name, runtime_json))
         with open(runtime_json, 'r') as sw_conf_file:
-            outfile = '%s/%s-p4runtime-requests.txt' %(self.log_dir, sw_name)
             p4runtime_lib.simple_controller.program_switch(
                 addr='127.0.0.1:%d' % grpc_port,
                 device_id=device_id,
@@ -0,0 +1,38 @@
+# SPDX-License-Identifier: Apache-2.0
+import os
+
+import pytest
+
+from p4runtime_lib.helper import P4InfoHelper
+
+REF_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'ref')
+P4INFO = os.path.join(REF_DIR, 'basic_tunnel', 'build', 'basic_tunnel.p4.p4info.txtpb')
+
+
+@pytest.fixture(scope='module')
+def helper():
+    return P4InfoHelper(P4INFO, cache=False)
+
+
+@pytest.mark.parametrize('dst_id, port', [(1, 2), ([1], 2), ([1], [2]), ((1,), (2,))])
+def test_exact_single_element_lists(helper, dst_id, port):
+    expected = helper.buildTableEntry(
+        table_name="MyIngress.myTunnel_exact",
+        match_fields={"hdr.myTunnel.dst_id": dst_id},
+        action_name="MyIngress.myTunnel_forward",
+        action_params={"port": port})
+    build = helper.compile_entry("MyIngress.myTunnel_exact", "MyIngress.myTunnel_forward")
+    assert build(dst_id, port) == expected
+    assert build.encode(dst_id, port) == expected.SerializeToString()
+
+
+def test_lpm(helper):
+    expected = helper.buildTableEntry(
+        table_name="MyIngress.ipv4_lpm",
+        match_fields={"hdr.ipv4.dstAddr": ["10.0.1.1", 32]},
+        action_name="MyIngress.ipv4_forward",
+        action_params={"dstAddr": "08:00:00:00:01:11", "port": [1]})
+    build = helper.compile_entry("MyIngress.ipv4_lpm", "MyIngress.ipv4_forward")
+    assert build(["10.0.1.1", 32], "08:00:00:00:01:11", [1]) == expected
+    assert build.encode(["10.0.1.1", 32], "08:00:00:00:01:11", [1]) == \
+        expected.SerializeToString()
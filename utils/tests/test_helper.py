@@ -0,0 +1,24 @@
+# SPDX-License-Identifier: Apache-2.0
+import os
+
+import pytest
+
+from p4runtime_lib.helper import P4InfoHelper
+
+REF_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'ref')
+P4INFO = os.path.join(REF_DIR, 'basic_tunnel', 'build', 'basic_tunnel.p4.p4info.txtpb')
+
+
+def test_lookups_follow_rebuilt_indexes():
+    helper = P4InfoHelper(P4INFO, cache=False)
+    table_id = helper.get_tables_id("MyIngress.ipv4_lpm")
+    assert helper.get_tables_name(table_id) == "MyIngress.ipv4_lpm"
+
+    table = helper.get('tables', name="MyIngress.ipv4_lpm")
+    table.preamble.name = "MyIngress.ipv4_routes"
+    helper._build_indexes()
+
+    assert helper.get_tables_id("MyIngress.ipv4_routes") == table_id
+    assert helper.get_tables_name(table_id) == "MyIngress.ipv4_routes"
+    with pytest.raises(AttributeError):
+        helper.get_tables_id("MyIngress.ipv4_lpm")
@@ -0,0 +1,61 @@
+# SPDX-License-Identifier: Apache-2.0
+import glob
+import os
+
+import pytest
+
+from p4runtime_lib import simple_controller, wire
+from p4runtime_lib.helper import P4InfoHelper
+
+REF_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'ref')
+RUNTIME_JSONS = sorted(glob.glob(os.path.join(REF_DIR, '*', 's*-runtime.json')))
+
+
+class RecordingSwitch(object):
+    """Stands for a switch connection, recording the serialized updates
+    written to it"""
+
+    def __init__(self):
+        self.updates = []
+
+    def WriteUpdates(self, updates):
+        self.updates += [wire.encodeUpdate(update_type, wire.encodeEntity(entity))
+                         for update_type, entity in updates]
+        return []
+
+    def WriteEncodedUpdates(self, encoded_updates):
+        self.updates += encoded_updates
+        return []
+
+    def shutdown(self):
+        pass
+
+
+def programmedUpdates(monkeypatch, runtime_json, stream):
+    sw = RecordingSwitch()
+
+    def connect_switch(addr, device_id, sw_conf, workdir, proto_dump_fpath):
+        p4info_path = os.path.join(workdir, sw_conf['p4info'])
+        return P4InfoHelper(p4info_path, cache=False), sw
+
+    monkeypatch.setattr(simple_controller, 'connect_switch', connect_switch)
+    with open(runtime_json, 'r') as sw_conf_file:
+        simple_controller.program_switch('127.0.0.1:50051', 0, sw_conf_file,
+                                         os.path.dirname(runtime_json), None,
+                                         runtime_json, stream=stream)
+    return sw.updates
+
+
+@pytest.mark.parametrize('runtime_json', RUNTIME_JSONS,
+                         ids=[os.path.relpath(path, REF_DIR) for path in RUNTIME_JSONS])
+def test_streaming_matches_program_switch(monkeypatch, runtime_json):
+    with open(runtime_json, 'r') as f:
+        sw_conf = simple_controller.json_load_byteified(f)
+    try:
+        simple_controller.check_switch_conf(sw_conf, os.path.dirname(runtime_json))
+    except simple_controller.ConfException as e:
+        pytest.skip(str(e))
+    expected = programmedUpdates(monkeypatch, runtime_json, stream=False)
+    assert len(expected) == sum(len(sw_conf.get(key, ()))
+                                for key in simple_controller.ENTRY_KEYS)
+    assert programmedUpdates(monkeypatch, runtime_json, stream=True) == expected